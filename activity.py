@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from datetime import date, datetime, tzinfo
+from typing import Callable, Collection, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+
+from reminders import day_random, reminder_window
+from storage import UserSettings, open_sqlite
+
+logger = logging.getLogger(__name__)
+
+HOURS = 24
+DAYS = 7
+SLOTS = HOURS * DAYS
+MAX_COUNT = 0xFFFF
+
+
+class ActivityStore:
+    """
+    Когда пользователи пишут боту: гистограмма 24×7 (час × день недели,
+    в местном времени) на пользователя.
+
+    Гистограмма — массив из 168 счетчиков uint16 (336 байт). Старые
+    наблюдения постепенно забываются: раз в half_life_days все счетчики
+    делятся пополам. Изменения пишутся в SQLite пачкой в фоне.
+    """
+
+    def __init__(self, path: str, half_life_days: float = 28.0, flush_interval: float = 5.0,
+                 refresh_interval: Optional[float] = None):
+        self.path = path
+        self.half_life = half_life_days * 86400
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+        self._counts: Dict[int, array] = {}
+        self._decayed_at: Dict[int, float] = {}
+        self._dirty: set = set()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._seen_until = 0.0
+        self._last_refresh = 0.0
+
+    # ---------- SQLite (выполняется в отдельном потоке) ----------
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = open_sqlite(self.path)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS user_activity (
+                    user_id INTEGER PRIMARY KEY,
+                    counts BLOB NOT NULL,
+                    decayed_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _load_rows(self, since: float) -> list:
+        with self._db_lock:
+            return self._connect().execute(
+                "SELECT user_id, counts, decayed_at, updated_at FROM user_activity WHERE updated_at > ?",
+                (since,),
+            ).fetchall()
+
+    def _save(self, rows: list):
+        with self._db_lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO user_activity (user_id, counts, decayed_at, updated_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            conn.commit()
+
+    def _close(self):
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _apply_rows(self, rows: list):
+        for user_id, blob, decayed_at, updated_at in rows:
+            self._seen_until = max(self._seen_until, updated_at)
+            if user_id in self._dirty:
+                continue
+            counts = array("H")
+            counts.frombytes(blob)
+            if len(counts) == SLOTS:
+                self._counts[user_id] = counts
+                self._decayed_at[user_id] = decayed_at
+
+    # ---------- Публичный API ----------
+
+    def record(self, user_id: int, timestamp: float, tz: Optional[tzinfo] = None):
+        """Учитывает сообщение пользователя в момент timestamp"""
+        counts = self._counts.get(user_id)
+        if counts is None:
+            counts = self._counts[user_id] = array("H", bytes(2 * SLOTS))
+            self._decayed_at[user_id] = timestamp
+        elif timestamp - self._decayed_at[user_id] >= self.half_life:
+            self._decay(counts)
+            self._decayed_at[user_id] = timestamp
+        local = datetime.fromtimestamp(timestamp, tz)
+        slot = local.weekday() * HOURS + local.hour
+        if counts[slot] == MAX_COUNT:
+            self._decay(counts)
+        counts[slot] += 1
+        self._dirty.add(user_id)
+
+    @staticmethod
+    def _decay(counts: array):
+        for i in range(SLOTS):
+            counts[i] >>= 1
+
+    def histogram(self, user_id: int) -> Optional[array]:
+        """Счетчики пользователя (индекс — день_недели * 24 + час) или None"""
+        return self._counts.get(user_id)
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    async def load(self):
+        self._seen_until = time.time()
+        self._apply_rows(await asyncio.to_thread(self._load_rows, 0.0))
+        logger.info(f"Загружена активность {len(self._counts)} пользователей")
+
+    async def refresh(self):
+        """Подтягивает гистограммы, обновленные другими процессами"""
+        self._apply_rows(await asyncio.to_thread(self._load_rows, self._seen_until - 5.0))
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        now = time.time()
+        rows = [
+            (user_id, self._counts[user_id].tobytes(), self._decayed_at[user_id], now)
+            for user_id in dirty
+        ]
+        try:
+            await asyncio.to_thread(self._save, rows)
+        except Exception as e:
+            logger.error("Ошибка записи активности: %s", e)
+            self._dirty |= dirty
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.shield(self.flush())
+            if self.refresh_interval is not None and time.monotonic() - self._last_refresh >= self.refresh_interval:
+                self._last_refresh = time.monotonic()
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    logger.error("Ошибка чтения активности: %s", e)
+
+    async def start(self):
+        await self.load()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        await asyncio.to_thread(self._close)
+
+
+class ActivityTimePicker:
+    """
+    Выбор времени напоминания с учетом активности получателя.
+
+    Час внутри окна выбирается случайно с весом prior + число сообщений
+    в этот час в этот день недели; без истории это обычный равномерный
+    выбор. Минута — случайная внутри часа. Окно не длиннее суток,
+    поэтому решение O(1) на получателя. Случайность — day_random(), так
+    что при той же гистограмме день получает то же время.
+    """
+
+    def __init__(self, activity: ActivityStore, prior: float = 2.0):
+        self.activity = activity
+        self.prior = prior
+
+    def weights(self, settings: UserSettings, reminder_type: str, day: date) -> List[float]:
+        start, end = reminder_window(settings, reminder_type)
+        counts = self.activity.histogram(settings.user_id)
+        if counts is None:
+            return [self.prior] * max(1, end - start)
+        base = day.weekday() * HOURS
+        return [self.prior + counts[base + hour] for hour in range(start, max(end, start + 1))]
+
+    def __call__(self, settings: UserSettings, reminder_type: str, day: date) -> int:
+        start, _ = reminder_window(settings, reminder_type)
+        weights = self.weights(settings, reminder_type, day)
+        rng = day_random(settings.user_id, reminder_type, day)
+        target = rng.random() * sum(weights)
+        offset = len(weights) - 1
+        for i, weight in enumerate(weights):
+            target -= weight
+            if target < 0:
+                offset = i
+                break
+        minute = int(rng.random() * 60)
+        return (start + offset) * 3600 + minute * 60
+
+
+class ActivityMiddleware(BaseMiddleware):
+    """
+    Отмечает время входящих сообщений (регистрируется как outer middleware).
+    Учитываются только users — получатели напоминаний: гистограммы
+    остальных никому не нужны и росли бы без ограничений.
+    """
+
+    def __init__(self, record: Callable[[int, float], None], users: Collection[int]):
+        self.record = record
+        self.users = users
+
+    async def __call__(self, handler, event, data):
+        user = getattr(event, "from_user", None)
+        if user is not None and user.id in self.users:
+            try:
+                self.record(user.id, event.date.timestamp())
+            except Exception as e:
+                logger.error("Ошибка учета активности: %s", e)
+        return await handler(event, data)
@@ -0,0 +1,128 @@
+"""
+Бенчмарк: N одновременных вызовов default_handler.
+
+Запуск из корня репозитория:
+    python benchmarks/concurrent_chat.py --n 20 --latency 1.0
+    python benchmarks/concurrent_chat.py --n 20 --latency 1.0 --blocking
+    python benchmarks/concurrent_chat.py --n 20 --latency 1.0 --stream
+
+С асинхронным клиентом N запросов укладываются примерно в одну задержку LLM
+(пока N не превышает LLM_MAX_CONCURRENCY). Флаг --blocking имитирует старый
+синхронный клиент: запросы выполняются последовательно, ~N задержек.
+Флаг --stream включает потоковые ответы и показывает время до первого
+видимого текста.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('BOT_TOKEN', '123456:BENCHMARK')
+os.environ.setdefault('GIRLFRIEND_ID', '1')
+os.environ.setdefault('OWNER_ID', '2')
+os.environ.setdefault('MINI_APP_URL', 'https://example.com')
+os.environ.setdefault('DB_PATH', ':memory:')
+
+from config import Config  # noqa: E402
+
+
+class FakeCompletions:
+    def __init__(self, latency: float, blocking: bool):
+        self.latency = latency
+        self.blocking = blocking
+
+    async def create(self, stream=False, **kwargs):
+        if stream:
+            return self._stream()
+        if self.blocking:
+            time.sleep(self.latency)
+        else:
+            await asyncio.sleep(self.latency)
+        message = SimpleNamespace(content="Ира, ответ")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    async def _stream(self, chunks: int = 20):
+        # Первый токен приходит быстро, остальная задержка размазана по фрагментам
+        await asyncio.sleep(self.latency * 0.1)
+        for i in range(chunks):
+            delta = SimpleNamespace(content=f"слово{i} ")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+            await asyncio.sleep(self.latency * 0.9 / chunks)
+
+
+class FakeBot:
+    async def send_chat_action(self, **kwargs):
+        pass
+
+
+class FakeSentMessage:
+    def __init__(self, owner):
+        self.owner = owner
+
+    async def edit_text(self, text, **kwargs):
+        self.owner.edits += 1
+
+
+class FakeMessage:
+    def __init__(self, chat_id: int, text: str):
+        self.chat = SimpleNamespace(id=chat_id)
+        self.from_user = SimpleNamespace(id=chat_id, first_name="Bench", username=None, language_code=None)
+        self.text = text
+        self.answers = []
+        self.edits = 0
+        self.created = time.perf_counter()
+        self.first_visible = None
+
+    async def answer(self, text, **kwargs):
+        if self.first_visible is None:
+            self.first_visible = time.perf_counter() - self.created
+        self.answers.append(text)
+        return FakeSentMessage(self)
+
+
+async def run(n: int, latency: float, blocking: bool, stream: bool):
+    import bot as app
+    import llm
+
+    os.environ['CHAT_STREAMING'] = '1' if stream else '0'
+    os.environ['STREAM_EDIT_INTERVAL'] = str(latency / 5)
+    app.create_app(Config.from_env())
+    llm.configure(max_concurrency=max(n, 1), timeout=latency * 10)
+    llm.get_routes()[0].provider._client = SimpleNamespace(
+        chat=SimpleNamespace(completions=FakeCompletions(latency, blocking))
+    )
+    app.bot = FakeBot()
+
+    messages = [FakeMessage(1000 + i, "привет") for i in range(n)]
+    started = time.perf_counter()
+    await asyncio.gather(*(app.default_handler(m) for m in messages))
+    elapsed = time.perf_counter() - started
+
+    answered = sum(1 for m in messages if m.answers)
+    mode = 'blocking' if blocking else 'stream' if stream else 'async'
+    print(f"mode={mode} n={n} latency={latency:.2f}s")
+    print(f"answered={answered} elapsed={elapsed:.2f}s ({elapsed / latency:.1f}x LLM latency)")
+    visible = sorted(m.first_visible for m in messages if m.first_visible is not None)
+    if visible:
+        print(
+            f"time to first visible text: p50={visible[len(visible) // 2]:.2f}s max={visible[-1]:.2f}s, "
+            f"edits per reply={sum(m.edits for m in messages) / n:.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--n', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=1.0)
+    parser.add_argument('--blocking', action='store_true')
+    parser.add_argument('--stream', action='store_true')
+    args = parser.parse_args()
+    asyncio.run(run(args.n, args.latency, args.blocking, args.stream))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Локальные заглушки внешних сервисов для офлайн-бенчмарков.
+
+FakeTelegramAPI — Bot API на aiohttp: отдает синтетические апдейты через
+getUpdates и записывает все исходящие вызовы (sendMessage, editMessageText...).
+FakeLLMServer — OpenAI/Groq-совместимый /chat/completions с настраиваемой
+задержкой и долей ошибок, поддерживает stream=true (SSE).
+
+Используются из offline_suite.py, но могут запускаться и отдельно:
+    python benchmarks/fake_servers.py --telegram-port 8081 --llm-port 8082 --llm-latency 0.5
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+import time
+from collections import Counter, deque
+from typing import List, Optional
+
+from aiohttp import web
+
+
+class _Server:
+    def __init__(self):
+        self.app = web.Application()
+        self.runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        bound_host, bound_port = self.runner.addresses[0][:2]
+        self.base_url = f"http://{bound_host}:{bound_port}"
+        return self.base_url
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+class FakeTelegramAPI(_Server):
+    """Bot API: очередь апдейтов для long polling и журнал исходящих вызовов"""
+
+    def __init__(self, latency: float = 0.0, bot_id: int = 123456):
+        super().__init__()
+        self.latency = latency
+        self.bot_id = bot_id
+        self.calls: Counter = Counter()
+        self.sent: List[tuple] = []
+        self._updates: deque = deque()
+        self._new_updates = asyncio.Event()
+        self._message_ids = itertools.count(1)
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+
+    def push(self, updates: List[dict]):
+        """Добавляет апдейты, которые бот заберет следующим getUpdates"""
+        self._updates.extend(updates)
+        self._new_updates.set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._updates)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.calls[method] += 1
+        if method == "getUpdates":
+            result = await self._get_updates(params)
+        else:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            result = self._result(method, params)
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, params: dict) -> list:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        # Подтвержденные апдейты (id < offset) больше не отдаем
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return list(itertools.islice(self._updates, limit))
+
+    def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return {"id": self.bot_id, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if method in ("sendMessage", "editMessageText"):
+            chat_id = int(params["chat_id"])
+            self.sent.append((method, chat_id, time.perf_counter()))
+            return {
+                "message_id": int(params.get("message_id") or next(self._message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+        return True
+
+
+class FakeLLMServer(_Server):
+    """OpenAI/Groq-совместимый сервер чат-комплишенов"""
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.2, failure_rate: float = 0.0,
+                 chunks: int = 10, seed: Optional[int] = None):
+        super().__init__()
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.chunks = chunks
+        self.requests = 0
+        self.batch_requests = 0
+        self.failures = 0
+        self._rng = random.Random(seed)
+        self._counter = itertools.count(1)
+        # Groq SDK добавляет /openai/v1 к base_url, OpenAI SDK — нет
+        for prefix in ("/openai/v1", "/v1"):
+            self.app.router.add_post(prefix + "/chat/completions", self.handle)
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency * (1 + self._rng.uniform(-self.jitter, self.jitter)))
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests += 1
+        if self._rng.random() < self.failure_rate:
+            self.failures += 1
+            await asyncio.sleep(self._delay() / 2)
+            return web.json_response(
+                {"error": {"message": "fake upstream failure", "type": "server_error"}}, status=503
+            )
+        n = next(self._counter)
+        text = f"Ира, это тестовый ответ номер {n}. Он нужен только для замера."
+        # Пакетный запрос (textbatch.batch_instruction): отвечаем JSON-массивом
+        prompt = (body.get("messages") or [{}])[-1].get("content") or ""
+        batch = re.search(r"Напиши (\d+) разных вариантов", prompt)
+        if batch:
+            self.batch_requests += 1
+            text = json.dumps(
+                [f"Ира, это тестовый текст {n}.{i}. Он нужен только для замера." for i in range(int(batch.group(1)))],
+                ensure_ascii=False,
+            )
+        prompt_tokens = sum(len(m.get("content") or "") for m in body.get("messages", [])) // 3 + 1
+        if body.get("stream"):
+            return await self._stream(request, body, n, text)
+        await asyncio.sleep(self._delay())
+        return web.json_response({
+            "id": f"chatcmpl-{n}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(text) // 3 + 1,
+                "total_tokens": prompt_tokens + len(text) // 3 + 1,
+            },
+        })
+
+    async def _stream(self, request: web.Request, body: dict, n: int, text: str) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        delay = self._delay()
+        words = text.split(" ")
+        step = max(1, len(words) // self.chunks)
+        # Первый фрагмент приходит через 10% задержки, остальное — равномерно
+        await asyncio.sleep(delay * 0.1)
+        for i in range(0, len(words), step):
+            piece = " ".join(words[i:i + step]) + (" " if i + step < len(words) else "")
+            chunk = {
+                "id": f"chatcmpl-{n}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+            await asyncio.sleep(delay * 0.9 / self.chunks)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+async def serve(args):
+    telegram = FakeTelegramAPI(latency=args.telegram_latency)
+    fake_llm = FakeLLMServer(latency=args.llm_latency, failure_rate=args.llm_failure_rate)
+    print("Bot API:", await telegram.start(port=args.telegram_port))
+    print("LLM:    ", await fake_llm.start(port=args.llm_port))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await telegram.stop()
+        await fake_llm.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--telegram-port', type=int, default=8081)
+    parser.add_argument('--telegram-latency', type=float, default=0.0)
+    parser.add_argument('--llm-port', type=int, default=8082)
+    parser.add_argument('--llm-latency', type=float, default=0.5)
+    parser.add_argument('--llm-failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
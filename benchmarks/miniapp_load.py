@@ -0,0 +1,154 @@
+"""
+Нагрузочный тест API для Mini App: GET /api/<эндпоинт> с подписанной
+initData, пропускная способность и задержка ответа.
+
+Против уже запущенного бота (initData подписывается его токеном):
+    python benchmarks/miniapp_load.py --url http://127.0.0.1:8080 --bot-token $BOT_TOKEN --user-id $GIRLFRIEND_ID
+
+Полностью локально (бот поднимается в этом же процессе, база в памяти):
+    python benchmarks/miniapp_load.py --self-host --requests 20000 --concurrency 100
+
+Прогон идет тремя фазами: без сжатия, с gzip и с If-None-Match
+(ETag из первого ответа — сервер отвечает 304 без тела).
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+from urllib.parse import urlencode
+
+from aiohttp import ClientSession, TCPConnector
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from miniapp import webapp_secret  # noqa: E402
+
+ENDPOINTS = ["days", "confessions", "settings"]
+PHASES = {
+    "identity": {"Accept-Encoding": "identity"},
+    "gzip": {"Accept-Encoding": "gzip"},
+    "304": {"Accept-Encoding": "gzip"},
+}
+
+
+def sign_init_data(bot_token: str, user_id: int) -> str:
+    """initData, как ее выдает Telegram для пользователя user_id"""
+    fields = {
+        "auth_date": str(int(time.time())),
+        "query_id": f"AAload{user_id}",
+        "user": json.dumps({"id": user_id, "first_name": "Load"}, separators=(",", ":")),
+    }
+    check = "\n".join(f"{key}={value}" for key, value in sorted(fields.items()))
+    fields["hash"] = hmac.new(webapp_secret(bot_token), check.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_phase(session: ClientSession, base_url: str, phase: str, init_data: str,
+                    requests: int, concurrency: int):
+    headers = {**PHASES[phase], "Authorization": f"tma {init_data}"}
+    etags = {}
+    if phase == "304":
+        for endpoint in ENDPOINTS:
+            async with session.get(f"{base_url}/api/{endpoint}", headers=headers) as response:
+                await response.read()
+                etags[endpoint] = response.headers.get("ETag", "")
+
+    latencies = []
+    statuses = {}
+    received = 0
+    counter = itertools.count()
+
+    async def worker():
+        nonlocal received
+        while True:
+            i = next(counter)
+            if i >= requests:
+                return
+            endpoint = ENDPOINTS[i % len(ENDPOINTS)]
+            request_headers = headers
+            if endpoint in etags:
+                request_headers = {**headers, "If-None-Match": etags[endpoint]}
+            started = time.perf_counter()
+            async with session.get(f"{base_url}/api/{endpoint}", headers=request_headers,
+                                   auto_decompress=False) as response:
+                received += len(await response.read())
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status] = statuses.get(response.status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{phase:<9} {requests / elapsed:7.0f} req/s  "
+        f"p50 {percentile(latencies, 50) * 1000:5.1f}мс  p99 {percentile(latencies, 99) * 1000:5.1f}мс  "
+        f"mean {statistics.mean(latencies) * 1000:5.1f}мс  тело {received / requests:5.0f}Б  {statuses}"
+    )
+
+
+async def load(base_url: str, init_data: str, requests: int, concurrency: int, phases: list):
+    base_url = base_url.rstrip("/")
+    print(f"requests={requests} concurrency={concurrency} endpoints={','.join(ENDPOINTS)}")
+    async with ClientSession(connector=TCPConnector(limit=concurrency)) as session:
+        for phase in phases:
+            await run_phase(session, base_url, phase, init_data, requests, concurrency)
+
+
+async def self_hosted(args):
+    os.environ.setdefault('BOT_TOKEN', '123456:LOADTEST')
+    os.environ.setdefault('GIRLFRIEND_ID', '1')
+    os.environ.setdefault('OWNER_ID', '2')
+    os.environ.setdefault('MINI_APP_URL', 'https://example.com')
+    os.environ.setdefault('RELATIONSHIP_START_DATE', '2024-02-14 00:00:00')
+    os.environ.setdefault('DB_PATH', ':memory:')
+    import bot as app
+    import miniapp
+
+    app.create_app()
+    for i in range(10):
+        app.recent_texts.add(app.config.girlfriend_id, "confession", f"Признание №{i}: ты делаешь каждый мой день светлее 💕")
+    runner = await miniapp.start_server(app.miniapp_api, "127.0.0.1", args.port)
+    try:
+        init_data = sign_init_data(app.config.bot_token, app.config.girlfriend_id)
+        await load(f"http://127.0.0.1:{args.port}", init_data, args.requests, args.concurrency, args.phases)
+        cache = app.miniapp_api.cache
+        print(f"кеш ответов: попаданий {cache.hits}, сборок {cache.misses}")
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8080')
+    parser.add_argument('--bot-token', default=os.getenv('BOT_TOKEN', ''))
+    parser.add_argument('--user-id', type=int, default=int(os.getenv('GIRLFRIEND_ID') or 0))
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--phases', nargs='+', choices=list(PHASES), default=list(PHASES))
+    parser.add_argument('--self-host', action='store_true')
+    parser.add_argument('--port', type=int, default=8090)
+    args = parser.parse_args()
+
+    if args.self_host:
+        asyncio.run(self_hosted(args))
+    else:
+        init_data = sign_init_data(args.bot_token, args.user_id)
+        asyncio.run(load(args.url, init_data, args.requests, args.concurrency, args.phases))
+
+
+if __name__ == "__main__":
+    main()
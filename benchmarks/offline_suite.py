@@ -0,0 +1,352 @@
+"""
+Офлайн-бенчмарк бота целиком: настоящий dp из bot.py, локальные Bot API и LLM.
+
+    python benchmarks/offline_suite.py
+    python benchmarks/offline_suite.py --commands 5000 --chats 500 --reminders 2000 --llm-latency 0.3
+    python benchmarks/offline_suite.py --scenarios chat --stream --llm-failure-rate 0.1
+    python benchmarks/offline_suite.py --scenarios bursts --bursts 100 --burst-size 5
+    python benchmarks/offline_suite.py --scenarios stream --streams 50
+    python benchmarks/offline_suite.py --scenarios chat --log sync --log-file /tmp/bot.log
+
+Бот получает апдейты через long polling от FakeTelegramAPI, ИИ-ответы
+берет у FakeLLMServer (см. fake_servers.py). Для каждого сценария
+печатается пропускная способность (апдейтов/с), p50/p99 времени работы
+обработчиков и простои event loop (насколько позже запланированного
+просыпается таймер-монитор). Сценарий bursts шлет от каждого пользователя
+несколько сообщений подряд: они должны склеиться в один ответ.
+Сценарий stream вызывает llm.stream напрямую и проверяет, что ответ
+приходит по частям; если ни один поток не отдал текста, прогон
+завершается с ошибкой (иначе бот молча откатился бы на обычный запрос).
+
+Лимиты частоты Telegram по умолчанию подняты, чтобы мерить стоимость
+обработки, а не настройки; --telegram-limits оставляет значения из окружения.
+
+--log включает лог уровня INFO в --log-file: sync — прежний basicConfig,
+пишущий прямо из event loop; text и json — очередь logs.configure() с
+прореживанием по LOG_SAMPLE_RATE. Сравнение показывает цену лога в простоях loop.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import BaseMiddleware  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+
+import logs  # noqa: E402
+from fake_servers import FakeLLMServer, FakeTelegramAPI  # noqa: E402
+from webhook_load import make_update, percentile  # noqa: E402
+
+COMMANDS = ["/start", "/help", "/status", "/days", "/confession"]
+SHORT_MESSAGES = ["привет", "спокойной ночи", "❤️", "доброе утро", "скучаю"]
+
+
+def setup_env(args):
+    os.environ.setdefault('BOT_TOKEN', '123456:BENCHMARK')
+    os.environ.setdefault('GIRLFRIEND_ID', '1')
+    os.environ.setdefault('OWNER_ID', '2')
+    os.environ.setdefault('MINI_APP_URL', 'https://example.com')
+    os.environ.setdefault('RELATIONSHIP_START_DATE', '2024-02-14 00:00:00')
+    os.environ.setdefault('DB_PATH', ':memory:')
+    os.environ['CHAT_STREAMING'] = '1' if args.stream else '0'
+    if not args.telegram_limits:
+        for name in ('SEND_GLOBAL_RATE', 'SEND_CHAT_RATE', 'REMINDER_RATE_LIMIT'):
+            os.environ[name] = '100000'
+
+
+class HandlerTimer(BaseMiddleware):
+    """Точное время каждого обработчика; сообщает, когда обработано expected апдейтов"""
+
+    def __init__(self):
+        self.durations = defaultdict(list)
+        self.done = 0
+        self.expected = 0
+        self.finished = asyncio.Event()
+        self.counter = _UpdateCounter(self)
+
+    def reset(self, expected: int):
+        self.durations.clear()
+        self.done = 0
+        self.expected = expected
+        self.finished.clear()
+
+    async def __call__(self, handler, event, data):
+        callback = getattr(data.get("handler"), "callback", None)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.durations[getattr(callback, "__name__", "unknown")].append(time.perf_counter() - started)
+
+
+class _UpdateCounter(BaseMiddleware):
+    """Outer middleware: считает апдейты, включая склеенные CoalescingMiddleware в один ответ"""
+
+    def __init__(self, timer: HandlerTimer):
+        self.timer = timer
+
+    async def __call__(self, handler, event, data):
+        try:
+            return await handler(event, data)
+        finally:
+            self.timer.done += 1
+            if self.timer.done >= self.timer.expected:
+                self.timer.finished.set()
+
+
+class LoopMonitor:
+    """Меряет, насколько позже запланированного просыпается event loop"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def start(self):
+        self.lags = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def print_report(name: str, count: int, elapsed: float, durations: dict, monitor: LoopMonitor,
+                 telegram: FakeTelegramAPI, calls_before: dict, fake_llm: FakeLLMServer, llm_before: int):
+    print(f"\n=== {name}: {count} шт за {elapsed:.2f}с, {count / elapsed:.0f}/с")
+    for handler, values in sorted(durations.items(), key=lambda item: -len(item[1])):
+        print(
+            f"  {handler:<22} n={len(values):<6} p50={percentile(values, 50) * 1000:7.1f}мс "
+            f"p99={percentile(values, 99) * 1000:7.1f}мс"
+        )
+    lags = monitor.lags
+    print(
+        f"  простой event loop: max={max(lags, default=0) * 1000:.1f}мс "
+        f"p99={percentile(lags, 99) * 1000:.1f}мс сумма={sum(lags) * 1000:.0f}мс"
+    )
+    calls = {
+        method: n - calls_before.get(method, 0)
+        for method, n in telegram.calls.items()
+        if method != "getUpdates" and n - calls_before.get(method, 0)
+    }
+    print(f"  Bot API: {calls}, запросов к LLM: {fake_llm.requests - llm_before}")
+
+
+async def run_updates(name: str, updates: list, telegram, fake_llm, timer, monitor, timeout: float):
+    calls_before, llm_before = dict(telegram.calls), fake_llm.requests
+    timer.reset(len(updates))
+    monitor.start()
+    started = time.perf_counter()
+    telegram.push(updates)
+    try:
+        await asyncio.wait_for(timer.finished.wait(), timeout)
+    except asyncio.TimeoutError:
+        print(f"\n{name}: не дождались обработки за {timeout:.0f}с ({timer.done}/{len(updates)})")
+    elapsed = time.perf_counter() - started
+    await monitor.stop()
+    print_report(name, timer.done, elapsed, timer.durations, monitor, telegram, calls_before, fake_llm, llm_before)
+
+
+async def run_reminders(app, count: int, telegram, fake_llm, monitor):
+    """Включает утренние напоминания count получателям и прогоняет их одним тиком"""
+    calls_before, llm_before = dict(telegram.calls), fake_llm.requests
+    scheduler = app.reminder_scheduler
+    durations = defaultdict(list)
+    send = scheduler.send
+
+    async def timed_send(user_id, reminder_type, text, day):
+        started = time.perf_counter()
+        try:
+            await send(user_id, reminder_type, text, day)
+        finally:
+            durations["send_reminder"].append(time.perf_counter() - started)
+
+    scheduler.send = timed_send
+    for user_id in range(100_000, 100_000 + count):
+        app.state_store.update(user_id, morning_active=True)
+        scheduler.sync_user(user_id)
+
+    monitor.start()
+    started = time.perf_counter()
+    await scheduler.run_due(now=time.time() + 2 * 86400)
+    elapsed = time.perf_counter() - started
+    await monitor.stop()
+    scheduler.send = send
+    print_report("напоминания", len(durations["send_reminder"]), elapsed, durations, monitor,
+                 telegram, calls_before, fake_llm, llm_before)
+
+
+async def run_llm_stream(count: int, fake_llm: FakeLLMServer) -> bool:
+    """Прогоняет count потоковых запросов llm.stream; True, если хотя бы один отдал текст"""
+    import llm
+
+    llm_before = fake_llm.requests
+    first_chunk, chunks, errors = [], [], []
+
+    async def one(i: int):
+        started = time.perf_counter()
+        received = 0
+        try:
+            async for _ in llm.stream(
+                [{"role": "user", "content": f"расскажи что-нибудь про день {i}"}],
+                temperature=0.9, max_tokens=150, kind="chat_stream",
+            ):
+                if not received:
+                    first_chunk.append(time.perf_counter() - started)
+                received += 1
+        except Exception as e:
+            errors.append(repr(e))
+        chunks.append(received)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    elapsed = time.perf_counter() - started
+    print(f"\n=== llm.stream: {count} шт за {elapsed:.2f}с")
+    print(
+        f"  фрагментов на ответ: {sum(chunks) / max(1, len(chunks)):.1f}, "
+        f"до первого p50={percentile(first_chunk, 50) * 1000:.1f}мс "
+        f"p99={percentile(first_chunk, 99) * 1000:.1f}мс, запросов к LLM: {fake_llm.requests - llm_before}"
+    )
+    if errors:
+        print(f"  ошибок: {len(errors)}, первая: {errors[0]}")
+    return any(chunks)
+
+
+def setup_logging(args, app_config):
+    if args.log == "sync":
+        logging.basicConfig(level=logging.INFO, filename=args.log_file,
+                            format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        return None
+    if args.log in ("text", "json"):
+        return logs.configure(
+            args.log,
+            level="INFO",
+            sample_rate=app_config.log_sample_rate,
+            slow_ms=app_config.log_slow_ms,
+            stream=open(args.log_file, "a", encoding="utf-8"),
+        )
+    return None
+
+
+async def run(args):
+    setup_env(args)
+    telegram = FakeTelegramAPI(latency=args.telegram_latency)
+    fake_llm = FakeLLMServer(latency=args.llm_latency, failure_rate=args.llm_failure_rate, seed=42)
+    telegram_url = await telegram.start()
+    llm_url = await fake_llm.start()
+
+    import bot as app
+    import llm
+
+    dp = app.create_app()
+    log_listener = setup_logging(args, app.config)
+    llm.configure(
+        api_key="fake",
+        base_url=llm_url,
+        max_concurrency=app.config.llm_max_concurrency,
+        timeout=app.config.llm_timeout,
+        models=app.config.llm_models,
+    )
+    app.bot.session.api = TelegramAPIServer.from_base(telegram_url)
+
+    timer = HandlerTimer()
+    dp.message.middleware(timer)
+    dp.message.outer_middleware(timer.counter)
+    await app.state_store.start()
+    await app.text_pool.start()
+    app.chat_history.start()
+    app.reminder_scheduler.start()
+    polling = asyncio.create_task(dp.start_polling(
+        app.bot, handle_signals=False, close_bot_session=False, polling_timeout=1,
+        allowed_updates=dp.resolve_used_update_types(),
+    ))
+    monitor = LoopMonitor()
+
+    scenarios = args.scenarios.split(",")
+    stream_ok = True
+    try:
+        if "commands" in scenarios:
+            updates = [
+                make_update(10_000 + i % args.users, COMMANDS[i % len(COMMANDS)])
+                for i in range(args.commands)
+            ]
+            await run_updates("команды", updates, telegram, fake_llm, timer, monitor, args.timeout)
+        if "chat" in scenarios:
+            # Половина — частые короткие сообщения (кешируются), половина — уникальные
+            updates = [
+                make_update(
+                    20_000 + i % args.users,
+                    SHORT_MESSAGES[i % len(SHORT_MESSAGES)] if i % 2 else f"расскажи что-нибудь про день {i}",
+                )
+                for i in range(args.chats)
+            ]
+            await run_updates("default_handler", updates, telegram, fake_llm, timer, monitor, args.timeout)
+        if "bursts" in scenarios:
+            # Пользователь шлет несколько сообщений подряд, ждем один ответ на всю пачку
+            updates = [
+                make_update(30_000 + user, f"сообщение {i + 1} из {args.burst_size}")
+                for user in range(args.bursts)
+                for i in range(args.burst_size)
+            ]
+            await run_updates("пачки сообщений", updates, telegram, fake_llm, timer, monitor, args.timeout)
+        if "reminders" in scenarios:
+            await run_reminders(app, args.reminders, telegram, fake_llm, monitor)
+        if "stream" in scenarios:
+            stream_ok = await run_llm_stream(args.streams, fake_llm)
+    finally:
+        await dp.stop_polling()
+        await polling
+        await app.reminder_scheduler.stop()
+        await app.text_pool.stop()
+        await app.chat_history.stop()
+        await app.state_store.stop()
+        await llm.close()
+        await app.bot.session.close()
+        await telegram.stop()
+        await fake_llm.stop()
+        if log_listener is not None:
+            log_listener.stop()
+    if fake_llm.failures:
+        print(f"\nОтказов LLM (имитация): {fake_llm.failures} из {fake_llm.requests}")
+    if not stream_ok:
+        raise SystemExit("llm.stream не отдал ни одного фрагмента")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', default='commands,chat,bursts,reminders,stream')
+    parser.add_argument('--commands', type=int, default=2000)
+    parser.add_argument('--chats', type=int, default=300)
+    parser.add_argument('--bursts', type=int, default=50)
+    parser.add_argument('--burst-size', type=int, default=4)
+    parser.add_argument('--reminders', type=int, default=1000)
+    parser.add_argument('--streams', type=int, default=20)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--llm-latency', type=float, default=0.2)
+    parser.add_argument('--llm-failure-rate', type=float, default=0.0)
+    parser.add_argument('--telegram-latency', type=float, default=0.0)
+    parser.add_argument('--telegram-limits', action='store_true')
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--timeout', type=float, default=300.0)
+    parser.add_argument('--log', choices=('off', 'sync', 'text', 'json'), default='off')
+    parser.add_argument('--log-file', default=os.devnull)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Бенчмарк планировщика напоминаний на фейковых часах.
+
+    python benchmarks/reminder_scheduler.py --recipients 10000 --days 3
+
+Симулирует N получателей в разных часовых поясах, прокручивает время
+шагами --step секунд и считает: число отправок, число пачечных генераций,
+задержку доставки относительно запланированного времени (в симулированном
+времени, с учетом глобального лимита частоты) и реальное время CPU.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reminders import ReminderScheduler  # noqa: E402
+from storage import MemoryStateStore  # noqa: E402
+
+TIMEZONES = ["Europe/Moscow", "Europe/Berlin", "Asia/Almaty", "America/New_York", "Asia/Tokyo", "UTC"]
+
+
+class FakeClock:
+    def __init__(self, start: float):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        # Время "проходит" мгновенно: цель считается в момент вызова,
+        # поэтому параллельные ожидания не складываются
+        target = self.now + seconds
+        await asyncio.sleep(0)
+        self.now = max(self.now, target)
+
+
+async def run(recipients: int, days: int, step: int, rate: float, concurrency: int):
+    start = datetime(2026, 2, 1, tzinfo=timezone.utc).timestamp()
+    clock = FakeClock(start)
+    store = MemoryStateStore()
+    rng = random.Random(42)
+    for user_id in range(recipients):
+        store.update(
+            user_id,
+            morning_active=True,
+            evening_active=rng.random() < 0.8,
+            timezone=rng.choice(TIMEZONES),
+        )
+
+    lags = []
+    batch_calls = 0
+    sent_by_day = {}
+
+    async def generate_batch(reminder_type, count):
+        nonlocal batch_calls
+        batch_calls += 1
+        return [f"{reminder_type} #{i}" for i in range(count)]
+
+    scheduled_at = {}
+
+    async def send(user_id, reminder_type, text, day):
+        due = scheduled_at.get((user_id, reminder_type))
+        if due is not None:
+            lags.append(clock() - due)
+        day = int((clock() - start) // 86400)
+        sent_by_day[day] = sent_by_day.get(day, 0) + 1
+
+    scheduler = ReminderScheduler(
+        store,
+        generate_batch=generate_batch,
+        send=send,
+        max_concurrent_sends=concurrency,
+        global_rate=rate,
+        clock=clock,
+        sleep=clock.sleep,
+    )
+
+    # Запоминаем плановое время каждой сработавшей записи, чтобы считать задержку
+    pop_due = scheduler._pop_due
+
+    def recording_pop_due(now):
+        batches = pop_due(now)
+        for reminder_type, entries in batches.items():
+            for user_id, due in entries:
+                scheduled_at[(user_id, reminder_type)] = due
+        return batches
+
+    scheduler._pop_due = recording_pop_due
+
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    scheduler.sync_all()
+    sync_time = time.perf_counter() - wall_started
+
+    end = start + days * 86400
+    ticks = 0
+    while clock() < end:
+        clock.now += step
+        await scheduler.run_due()
+        ticks += 1
+
+    wall = time.perf_counter() - wall_started
+    cpu = time.process_time() - cpu_started
+    total = sum(sent_by_day.values())
+    print(f"recipients={recipients} days={days} step={step}s ticks={ticks}")
+    print(f"initial schedule: {sync_time * 1000:.1f}ms, pending={scheduler.pending()}")
+    print(f"sent={total} per_day={dict(sorted(sent_by_day.items()))}")
+    print(f"batch generation calls={batch_calls} (vs {total} with one call per send)")
+    if lags:
+        print(
+            f"delivery lag (simulated): p50={statistics.median(lags):.1f}s "
+            f"p99={sorted(lags)[int(len(lags) * 0.99) - 1]:.1f}s max={max(lags):.1f}s"
+        )
+    print(f"wall={wall:.2f}s cpu={cpu:.2f}s ({cpu / max(total, 1) * 1e6:.0f}µs CPU per send)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recipients', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=3)
+    parser.add_argument('--step', type=int, default=60)
+    parser.add_argument('--rate', type=float, default=25.0)
+    parser.add_argument('--concurrency', type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.recipients, args.days, args.step, args.rate, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
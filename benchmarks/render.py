@@ -0,0 +1,152 @@
+"""
+Микробенчмарк отрисовки ответов на частые команды: раньше и с templates.py.
+
+    python benchmarks/render.py
+    python benchmarks/render.py --iterations 50000
+
+«Раньше» — код обработчиков до кеширования: клавиатура собиралась заново
+на каждый ответ, текст справки — из f-строк, дата начала отношений
+разбиралась strptime при каждом /days. «Сейчас» — готовые объекты
+Templates и дата из Config. Для каждого пути печатается время CPU на
+вызов и пиковый объем памяти, выделяемой за один вызов (tracemalloc).
+Сеть и сериализация запроса не учитываются — они одинаковы в обоих случаях.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo  # noqa: E402
+
+from config import START_DATE_FORMAT  # noqa: E402
+from templates import Templates  # noqa: E402
+
+MINI_APP_URL = "https://example.com/app"
+START_DATE = "2024-02-14 00:00:00"
+
+
+# ---------- Как было ----------
+
+def legacy_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="💌 Открыть сюрприз", web_app=WebAppInfo(url=MINI_APP_URL))],
+            [InlineKeyboardButton(text="❓ Справка", callback_data="help_callback")],
+        ]
+    )
+
+
+def legacy_help():
+    help_text = (
+        "🎯 Вот что я умею:\n\n"
+        "📱 Основное:\n"
+        "💌 Открыть сюрприз\n\n"
+        "⏱️ Команды:\n"
+        "/days - Счетчик дней вместе (в днях, часах, секундах)\n"
+        "/confession - Случайное признание (новое каждый раз)\n"
+        "/help - Эта справка\n"
+        "/disable_morning - Отключить утренние напоминания\n"
+        "/enable_morning - Включить утренние напоминания\n"
+        "/disable_evening - Отключить вечерние напоминания\n"
+        "/enable_evening - Включить вечерние напоминания\n\n"
+        "🎭 Дополнительно:\n"
+        "Напиши мне что-нибудь - я отвечу! 💕"
+    )
+    return help_text, legacy_keyboard()
+
+
+def legacy_start():
+    return (
+        f"💕 Привет, Иришка!\n\n"
+        f"Я приготовил для тебя что-то на День Святого Валентина... 💘"
+    ), legacy_keyboard()
+
+
+def legacy_days():
+    start = datetime.strptime(START_DATE, START_DATE_FORMAT)
+    diff = datetime.now() - start
+    days, hours = diff.days, diff.seconds // 3600
+    minutes = (diff.seconds % 3600) // 60
+    total_hours = days * 24 + hours
+    text = (
+        f"💕 Мы вместе {days} дней\n"
+        f"в часах это {total_hours} часов\n"
+        f"в минутах это {total_hours * 60 + minutes:,} минут\n"
+        f"а в секундах целых {days * 86400 + diff.seconds:,}\n\n"
+        f"Каждая секунда с тобой - волшебство ✨\n"
+        f"Открой сюрприз, чтобы узнать, как сильно ты мне нужна 💌"
+    )
+    return text, legacy_keyboard()
+
+
+# ---------- Сейчас ----------
+
+templates = Templates(MINI_APP_URL)
+relationship_start = datetime.strptime(START_DATE, START_DATE_FORMAT)
+
+
+def cached_help():
+    return templates.text("help"), templates.main_keyboard()
+
+
+def cached_start():
+    return templates.text("welcome"), templates.main_keyboard()
+
+
+def cached_days():
+    diff = datetime.now() - relationship_start
+    days, hours = diff.days, diff.seconds // 3600
+    minutes = (diff.seconds % 3600) // 60
+    total_hours = days * 24 + hours
+    text = templates.text(
+        "days", days=str(days), hours=total_hours,
+        minutes=total_hours * 60 + minutes, seconds=days * 86400 + diff.seconds,
+    )
+    return text, templates.main_keyboard()
+
+
+def measure(fn, iterations: int):
+    fn()  # прогрев: кеши шаблонов и ленивые схемы pydantic
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    per_call = (time.perf_counter() - started) / iterations
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(100):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn()
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return per_call, sorted(peaks)[len(peaks) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    paths = [
+        ("/help", legacy_help, cached_help),
+        ("/start", legacy_start, cached_start),
+        ("/days", legacy_days, cached_days),
+    ]
+    print(f"{'команда':<8} {'раньше':>18} {'сейчас':>18} {'выигрыш':>9}")
+    for name, legacy, cached in paths:
+        legacy_time, legacy_mem = measure(legacy, args.iterations)
+        cached_time, cached_mem = measure(cached, args.iterations)
+        print(
+            f"{name:<8} {legacy_time * 1e6:7.1f}мкс {legacy_mem:6d}Б "
+            f"{cached_time * 1e6:7.1f}мкс {cached_mem:6d}Б "
+            f"{legacy_time / cached_time:8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Бенчмарк холодного старта: импорт bot.py, create_app() и время до первого
+обработанного апдейта.
+
+    python benchmarks/startup.py --runs 5
+
+Каждый прогон — отдельный процесс Python. Родитель поднимает FakeTelegramAPI
+(см. fake_servers.py) с одним апдейтом /start и запускает бота в режиме
+polling; бот сообщает моменты окончания импорта, сборки приложения, запуска
+сервисов и обработки первого апдейта. Все отметки — time.monotonic(), общий
+для процессов, так что «от запуска процесса» включает старт интерпретатора.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PHASES = ["import", "create_app", "services", "first_update"]
+
+
+async def child():
+    marks = {}
+    import bot as app
+    marks["import"] = time.monotonic()
+
+    from aiogram.client.telegram import TelegramAPIServer
+
+    dp = app.create_app()
+    app.bot.session.api = TelegramAPIServer.from_base(os.environ["FAKE_TELEGRAM_URL"])
+    marks["create_app"] = time.monotonic()
+
+    await app.state_store.start()
+    await app.text_pool.start()
+    app.chat_history.start()
+    app.reminder_scheduler.start()
+    marks["services"] = time.monotonic()
+
+    first_update = asyncio.Event()
+
+    async def mark_first(handler, event, data):
+        try:
+            return await handler(event, data)
+        finally:
+            first_update.set()
+
+    dp.message.outer_middleware(mark_first)
+    polling = asyncio.create_task(dp.start_polling(
+        app.bot, handle_signals=False, close_bot_session=False, polling_timeout=1,
+    ))
+    await first_update.wait()
+    marks["first_update"] = time.monotonic()
+
+    await dp.stop_polling()
+    await polling
+    await app.reminder_scheduler.stop()
+    await app.text_pool.stop()
+    await app.chat_history.stop()
+    await app.state_store.stop()
+    await app.bot.session.close()
+    print(json.dumps(marks))
+
+
+async def measure(runs: int):
+    from fake_servers import FakeTelegramAPI
+    from webhook_load import make_update
+
+    telegram = FakeTelegramAPI()
+    url = await telegram.start()
+    env = dict(os.environ)
+    env.setdefault('BOT_TOKEN', '123456:STARTUP')
+    env.setdefault('GIRLFRIEND_ID', '1')
+    env.setdefault('OWNER_ID', '2')
+    env.setdefault('MINI_APP_URL', 'https://example.com')
+    env.setdefault('DB_PATH', ':memory:')
+    env['FAKE_TELEGRAM_URL'] = url
+
+    results = {phase: [] for phase in PHASES}
+    try:
+        for _ in range(runs):
+            telegram.push([make_update(10, "/start")])
+            spawned = time.monotonic()
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, os.path.abspath(__file__), "--child",
+                env=env, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+            )
+            stdout, _ = await process.communicate()
+            marks = json.loads(stdout.decode().strip().splitlines()[-1])
+            for phase in PHASES:
+                results[phase].append(marks[phase] - spawned)
+    finally:
+        await telegram.stop()
+
+    print(f"Холодный старт, {runs} прогонов (секунды от запуска процесса, медиана / минимум):")
+    for phase in PHASES:
+        values = results[phase]
+        print(f"  {phase:<14} {statistics.median(values):6.3f} / {min(values):6.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    asyncio.run(child() if args.child else measure(args.runs))
+
+
+if __name__ == "__main__":
+    main()
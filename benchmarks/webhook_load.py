@@ -0,0 +1,136 @@
+"""
+Нагрузочный тест вебхука: отправляет синтетические Update JSON и меряет
+пропускную способность и задержку ответа.
+
+Против уже запущенного бота (BOT_MODE=webhook):
+    python benchmarks/webhook_load.py --url http://127.0.0.1:8080/webhook --secret $WEBHOOK_SECRET
+
+Полностью локально, без Telegram (бот поднимается в этом же процессе,
+запросы к Bot API заменены заглушкой):
+    python benchmarks/webhook_load.py --self-host --updates 5000 --concurrency 100
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import statistics
+import sys
+import time
+
+from aiohttp import ClientSession, TCPConnector, web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_update_ids = itertools.count(1)
+
+TEXTS = ["/days", "/help", "/status", "/start", "привет", "спокойной ночи"]
+
+
+def make_update(user_id: int, text: str) -> dict:
+    """Синтетический Update с текстовым сообщением"""
+    update_id = next(_update_ids)
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private", "first_name": "Load"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Load"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    return {"update_id": update_id, "message": message}
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def load(url: str, secret: str, updates: int, concurrency: int, users: int):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    latencies = []
+    statuses = {}
+    counter = itertools.count()
+
+    async with ClientSession(connector=TCPConnector(limit=concurrency)) as session:
+        async def worker():
+            while True:
+                i = next(counter)
+                if i >= updates:
+                    return
+                payload = make_update(10_000 + i % users, TEXTS[i % len(TEXTS)])
+                started = time.perf_counter()
+                async with session.post(url, json=payload, headers=headers) as response:
+                    await response.read()
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    print(f"updates={updates} concurrency={concurrency} elapsed={elapsed:.2f}s")
+    print(f"throughput={updates / elapsed:.0f} updates/s")
+    print(
+        f"latency p50={percentile(latencies, 50) * 1000:.1f}ms "
+        f"p99={percentile(latencies, 99) * 1000:.1f}ms "
+        f"mean={statistics.mean(latencies) * 1000:.1f}ms"
+    )
+    print(f"statuses={statuses}")
+
+
+def stub_bot_api(bot, latency: float):
+    """Заменяет сетевые вызовы Bot API заглушкой с заданной задержкой"""
+    async def make_request(bot, method, timeout=None):
+        if latency:
+            await asyncio.sleep(latency)
+        return True
+
+    bot.session.make_request = make_request
+
+
+async def self_hosted(args):
+    os.environ.setdefault('BOT_TOKEN', '123456:LOADTEST')
+    os.environ.setdefault('GIRLFRIEND_ID', '1')
+    os.environ.setdefault('OWNER_ID', '2')
+    os.environ.setdefault('MINI_APP_URL', 'https://example.com')
+    os.environ.setdefault('DB_PATH', ':memory:')
+    import bot as app
+    from webhook import build_app
+
+    dp = app.create_app()
+    stub_bot_api(app.bot, args.api_latency)
+    web_app = build_app(dp, app.bot, path="/webhook", secret_token=args.secret or None)
+    runner = web.AppRunner(web_app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+    try:
+        await load(f"http://127.0.0.1:{args.port}/webhook", args.secret, args.updates, args.concurrency, args.users)
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8080/webhook')
+    parser.add_argument('--secret', default=os.getenv('WEBHOOK_SECRET', ''))
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--self-host', action='store_true')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--api-latency', type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.self_host:
+        asyncio.run(self_hosted(args))
+    else:
+        asyncio.run(load(args.url, args.secret, args.updates, args.concurrency, args.users))
+
+
+if __name__ == "__main__":
+    main()
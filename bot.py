@@ -1,49 +1,252 @@
+import asyncio
+import atexit
 import logging
-from typing import Optional
-from dotenv import load_dotenv
 import os
-from datetime import datetime
-import random
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
-from groq import Groq
+import socket
+from typing import List, Optional, Set, Tuple
+from datetime import date, datetime
+import time
 
-from aiogram import Bot, Dispatcher, types, F
+from aiogram import Bot, Dispatcher, Router, types, F
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import CommandStart, Command
-from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo, CallbackQuery
+from aiogram.types import InlineKeyboardMarkup, CallbackQuery
+from aiogram.exceptions import TelegramForbiddenError
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-# Загружаем переменные окружения
-load_dotenv()
+import llm
+import logs
+import metrics
+import miniapp
+import prompts
+from activity import ActivityMiddleware, ActivityStore, ActivityTimePicker
+from cache import ResponseCache
+from cluster import WORKER_HOST, WORKER_PATH, run_cluster
+from coalesce import ChatBurst, CoalescingMiddleware
+from config import Config, ConfigError, load_config
+from coordination import Lease, LeaderElection, ReminderClaims
+from fingerprints import FingerprintIndex
+from fsm_storage import SQLiteFSMStorage
+from history import HistoryStore
+from outbox import Outbox, outbox_key
+from pool import TextPool
+from reminders import ReminderScheduler, random_time_picker
+from sender import OutboundDispatcher, OutboundMiddleware
+from storage import create_state_store
+from textbatch import batch_instruction, split_batch
+from streaming import ProgressiveMessage
+from templates import DEFAULT_LOCALE, Templates
+from webhook import run_webhook
 
-# Включаем логирование
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-# Инициализация Bot и Dispatcher
-BOT_TOKEN = os.getenv('BOT_TOKEN')
-MINI_APP_URL = os.getenv('MINI_APP_URL')
-GROQ_API_KEY = os.getenv('GROQ_API_KEY')
-RELATIONSHIP_START_DATE = os.getenv('RELATIONSHIP_START_DATE')
-GIRLFRIEND_ID = int(os.getenv('GIRLFRIEND_ID'))
-OWNER_ID = int(os.getenv('OWNER_ID'))
+# Обработчики регистрируются при импорте, без сети и переменных окружения
+router = Router()
+
+# Конфиг, клиенты и сервисы; создаются в create_app()
+config: Optional[Config] = None
+bot: Optional[Bot] = None
+outbound: Optional[OutboundDispatcher] = None
+text_pool: Optional[TextPool] = None
+state_store = None
+chat_history: Optional[HistoryStore] = None
+response_cache: Optional[ResponseCache] = None
+reminder_scheduler: Optional[ReminderScheduler] = None
+activity: Optional[ActivityStore] = None
+sent_texts: Optional[FingerprintIndex] = None
+outbox: Optional[Outbox] = None
+templates: Optional[Templates] = None
+chat_prompt: Optional[prompts.PromptBuilder] = None
+recent_texts: Optional[miniapp.RecentTexts] = None
+miniapp_api: Optional[miniapp.MiniAppAPI] = None
+
+
+def create_bot(app_config: Config) -> Bot:
+    """Bot с сессией к api.telegram.org или к своему Bot API серверу (TELEGRAM_API_URL)"""
+    session = None
+    if app_config.telegram_api_url:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(app_config.telegram_api_url))
+    return Bot(token=app_config.bot_token, session=session)
+
+
+def create_app(app_config: Optional[Config] = None, worker_index: Optional[int] = None) -> Dispatcher:
+    """
+    Собирает приложение: бота, сервисы и диспетчер с обработчиками.
+
+    Ничего не подключает: сессия Bot API, клиент LLM и базы SQLite
+    открываются при первом использовании или в main().
+    worker_index задается процессам-обработчикам кластерного режима.
+    """
+    global config, bot, outbound, text_pool, state_store, chat_history, response_cache, reminder_scheduler, activity
+    global sent_texts, templates, outbox, chat_prompt, recent_texts, miniapp_api
+    config = app_config or load_config()
 
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
+    # Тексты и клавиатуры собираются один раз на язык
+    templates = Templates(config.mini_app_url)
 
-# Инициализация Groq клиента
-groq_client = Groq(api_key=GROQ_API_KEY)
+    bot = create_bot(config)
 
-# Инициализация scheduler для напоминаний
-scheduler = AsyncIOScheduler()
+    # Все исходящие запросы идут через диспетчер с лимитами Telegram и повторами.
+    # Лимит Telegram общий на бота: в кластере каждый процесс получает свою долю
+    outbound = OutboundDispatcher(
+        global_rate=config.send_global_rate / (config.workers if worker_index is not None else 1),
+        chat_rate=config.send_chat_rate,
+        max_retries=config.send_max_retries,
+    )
+    bot.session.middleware(OutboundMiddleware(outbound))
+
+    # Параметры асинхронного LLM клиента (сам клиент создается при первом запросе)
+    llm.configure(
+        api_key=config.groq_api_key,
+        base_url=config.llm_base_url,
+        max_concurrency=config.llm_max_concurrency,
+        timeout=config.llm_timeout,
+        models=config.llm_models,
+        fallback_api_key=config.llm_fallback_api_key,
+        fallback_base_url=config.llm_fallback_base_url,
+        fallback_models=config.llm_fallback_models,
+        hedge_quantile=config.llm_hedge_quantile,
+        hedge_delay=config.llm_hedge_delay,
+        breaker_failures=config.llm_breaker_failures,
+        breaker_cooldown=config.llm_breaker_cooldown,
+    )
+
+    # Пул заранее сгенерированных признаний и напоминаний
+    text_pool = TextPool(
+        path=config.data_path,
+        generators={
+            "confession": lambda: request_confession(),
+            "morning": lambda: request_reminder("morning"),
+            "evening": lambda: request_reminder("evening"),
+        },
+        batch_generators={
+            kind: lambda count, kind=kind: request_batch(kind, count)
+            for kind in ("confession", "morning", "evening")
+        },
+        max_batch=config.llm_batch_size,
+        target_size=config.pool_size,
+        ttl=config.pool_ttl_hours * 3600,
+        owner="" if worker_index is None else f"worker-{worker_index}",
+    )
+
+    # Отпечатки уже отправленных текстов: признания и напоминания не повторяются
+    sent_texts = FingerprintIndex(
+        config.data_path,
+        capacity=config.dedup_capacity,
+        max_distance=config.dedup_max_distance,
+        refresh_interval=5.0 if worker_index is not None else None,
+    )
+
+    # Хранилище настроек напоминаний (переживает перезапуски).
+    # По умолчанию напоминания выключены и включаются после /start от Иры
+    # В кластере настройки меняют разные процессы: подтягиваем чужие изменения
+    state_store = create_state_store(
+        config.storage_backend,
+        config.data_path,
+        refresh_interval=2.0 if worker_index is not None else None,
+    )
+
+    # История переписки для ИИ-ответов: последние реплики и резюме более старых
+    chat_history = HistoryStore(
+        path=config.data_path,
+        summarizer=lambda summary, turns: summarize_conversation(summary, turns),
+        max_turns=config.chat_history_turns,
+        token_budget=config.chat_history_tokens,
+        max_chats=config.chat_history_max_chats,
+    )
+
+    # Промпт ИИ-ответа: системная часть общая, сообщение пользователя в пределах бюджета
+    chat_prompt = prompts.PromptBuilder("chat", CHAT_SYSTEM_PROMPT, input_budget=config.chat_input_tokens)
+
+    # Кеш ИИ-ответов на частые короткие сообщения
+    response_cache = ResponseCache(
+        capacity=config.chat_cache_size,
+        ttl=config.chat_cache_ttl_hours * 3600,
+        variants=config.chat_cache_variants,
+        similarity=config.chat_cache_similarity,
+    )
+
+    # Когда получатели обычно пишут боту (час × день недели) —
+    # напоминания смещаются к этим часам внутри окна
+    activity = ActivityStore(
+        config.data_path,
+        half_life_days=config.activity_half_life_days,
+        refresh_interval=60.0 if worker_index is not None else None,
+    )
+
+    # Журнал напоминаний: текст записывается до отправки, недоставленное
+    # после перезапуска досылается, а не теряется
+    outbox = Outbox(
+        config.data_path,
+        max_age=config.outbox_max_age_hours * 3600,
+    )
+
+    # Планировщик напоминаний: одна очередь на всех получателей.
+    # Воркеры дополнительно делят напоминания через общую таблицу
+    claims = ReminderClaims(config.data_path) if worker_index is not None else None
+    reminder_scheduler = ReminderScheduler(
+        state_store,
+        generate_batch=lambda reminder_type, count: get_reminder_texts(reminder_type, count),
+        send=lambda user_id, reminder_type, text, day: send_reminder(user_id, reminder_type, text, day),
+        default_timezone=config.reminder_timezone,
+        time_picker=ActivityTimePicker(activity, prior=config.activity_prior) if config.reminder_adaptive else random_time_picker,
+        max_concurrent_sends=config.reminder_max_concurrency,
+        global_rate=config.reminder_rate_limit,
+        claim=lambda reminder_type, entries: claim_reminders(reminder_type, entries, claims),
+        catch_up=config.outbox_max_age_hours * 3600,
+    )
+    state_store.on_change = lambda user_ids: [reminder_scheduler.sync_user(user_id) for user_id in user_ids]
+
+    # Последние признания каждого получателя — для Mini App
+    recent_texts = miniapp.RecentTexts(config.data_path)
+
+    # API для Mini App: ответы собираются заново, только когда данные меняются
+    miniapp_api = miniapp.MiniAppAPI(
+        config.bot_token,
+        allowed_users=config.reminder_recipients | {config.owner_id},
+        origin=miniapp.mini_app_origin(config.mini_app_url),
+        init_data_ttl=config.miniapp_init_data_ttl,
+    )
+    miniapp_api.add_endpoint("days", lambda user_id: int(time.time() // 60), miniapp_days, shared=True, max_age=60)
+    miniapp_api.add_endpoint("confessions", recent_texts.version, miniapp_confessions)
+    miniapp_api.add_endpoint(
+        "settings",
+        lambda user_id: (state_store.get(user_id), tuple(reminder_scheduler.describe(user_id).values())),
+        miniapp_settings,
+    )
+
+    metrics.add_gauge("bot_outbound_queue_depth", "Outbound calls waiting for rate limit", lambda: outbound.queued)
+    metrics.add_gauge("bot_outbound_in_flight", "Outbound calls in progress", lambda: outbound.in_flight)
+    metrics.add_gauge("bot_chat_cache_hit_rate", "Chat reply cache hit rate", lambda: response_cache.stats()["hit_rate"])
+    metrics.add_gauge("bot_reminders_pending", "Scheduled reminders", lambda: reminder_scheduler.pending())
+    metrics.add_gauge("bot_activity_users", "Users with an activity histogram", lambda: len(activity))
+    metrics.add_gauge("bot_token_estimate_ratio", "Correction applied to local token estimates",
+                      lambda: prompts.counter.ratio)
+    for kind in ("confession", "morning", "evening"):
+        metrics.add_gauge(f"bot_pool_{kind}_size", f"Pregenerated {kind} texts", lambda kind=kind: text_pool.size(kind))
+
+    dp = Dispatcher(storage=SQLiteFSMStorage(config.data_path) if config.fsm_storage == "sqlite" else None)
+    # Все записи лога при обработке апдейта (обработчик, LLM, отправка) несут его ID
+    dp.update.outer_middleware(logs.CorrelationMiddleware())
+    dp.message.outer_middleware(ActivityMiddleware(
+        lambda user_id, timestamp: activity.record(
+            user_id, timestamp, reminder_scheduler.timezone(state_store.get(user_id))
+        ),
+        users=config.reminder_recipients,
+    ))
+    # Сообщения, пришедшие подряд, получают один ответ; ответы в чате — по очереди
+    dp.message.middleware(CoalescingMiddleware(
+        window=config.chat_debounce,
+        max_concurrency=config.chat_max_concurrency,
+    ))
+    dp.message.middleware(metrics.MetricsMiddleware())
+    dp.callback_query.middleware(metrics.MetricsMiddleware())
+    dp.error.register(error_handler)
+    dp.include_router(router)
+    return dp
 
-# Хранилища для активных напоминаний (для GIRLFRIEND_ID)
-morning_active = False  # Изменено на False, чтобы активировать только после /start от Иры
-evening_active = False  # Изменено на False, чтобы активировать только после /start от Иры
 
 # State группы для будущих функций
 class QuizState(StatesGroup):
@@ -52,325 +255,592 @@ class QuizState(StatesGroup):
 
 # ==================== ФУНКЦИИ ====================
 
-def get_main_keyboard() -> InlineKeyboardMarkup:
-    """Создает основную клавиатуру с кнопкой Mini App и справкой"""
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text="💌 Открыть сюрприз",
-                    web_app=WebAppInfo(url=MINI_APP_URL)
-                )
-            ],
-            [
-                InlineKeyboardButton(
-                    text="❓ Справка",
-                    callback_data="help_callback"
-                )
-            ]
-        ]
-    )
-    return keyboard
+def get_main_keyboard(locale: str = DEFAULT_LOCALE) -> InlineKeyboardMarkup:
+    """Основная клавиатура с кнопкой Mini App и справкой (общий объект, не изменять)"""
+    return templates.main_keyboard(locale)
 
 
 def get_days_together() -> tuple:
     """Подсчитывает количество дней, часов, минут и секунд в отношениях"""
-    try:
-        start_date = datetime.strptime(RELATIONSHIP_START_DATE, '%Y-%m-%d %H:%M:%S')
-        now = datetime.now()
-        
-        time_diff = now - start_date
-        
-        days = time_diff.days
-        seconds = time_diff.seconds
-        
-        hours = seconds // 3600
-        minutes = (seconds % 3600) // 60
-        secs = seconds % 60
-        
-        return days, hours, minutes, secs
-    except ValueError:
-        logger.error(f"Неверный формат даты: {RELATIONSHIP_START_DATE}")
+    # Дата разбирается и проверяется один раз при загрузке конфига
+    start_date = config.relationship_start
+    if start_date is None:
+        logger.error("RELATIONSHIP_START_DATE не задан")
         return 0, 0, 0, 0
+    
+    time_diff = datetime.now() - start_date
+    
+    days = time_diff.days
+    seconds = time_diff.seconds
+    
+    hours = seconds // 3600
+    minutes = (seconds % 3600) // 60
+    secs = seconds % 60
+    
+    return days, hours, minutes, secs
+
+
+# Промпт признания; им же начинаются пакетные запросы для пула
+CONFESSION_PROMPT = (
+    "Напиши короткое и искреннее признание в чувствах для девушки. "
+    "Это признание от Саши, написанное через тёплого телеграм-бота. "
+    "1–2 предложения максимум. Начни с имени (выбери либо 'Ира,', либо 'Иришка,'). "
+    "Имя должно быть ТОЛЬКО в начале и больше не повторяться. "
+    "Пиши простым, понятным языком, без цветистых слов, пафоса и лирики. "
+    "Говори о живых, реальных чувствах: почему она важна, что в ней ценят, "
+    "как спокойно и хорошо с ней. "
+    "Избегай штампов, метафор и обобщённых фраз. "
+    "Каждый раз генерируй новый, уникальный текст."
+)
+
+# С какого имени должны начинаться признания и напоминания
+GIRLFRIEND_NAMES = ("Ира", "Иришка")
+
+# Длинные инструкции — системным сообщением (одинаковый префикс у всех
+# запросов), короткая просьба — пользовательским
+CONFESSION_BUILDER = prompts.PromptBuilder("confession", CONFESSION_PROMPT)
+SINGLE_TEXT_REQUEST = "Напиши один вариант."
+
+
+async def complete_prompt(prompt: prompts.Prompt, temperature: float, max_tokens: int,
+                          kind: str, timeout: Optional[float] = None) -> str:
+    """llm.complete для собранного промпта: оценка токенов сверяется с ответом провайдера"""
+    return await llm.complete(
+        messages=prompt.messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        kind=kind,
+        timeout=timeout,
+        prompt_tokens=prompt.total,
+    )
+
+
+async def request_confession() -> str:
+    """Запрашивает признание у LLM (без запасного текста, ошибки пробрасываются)"""
+    return await complete_prompt(
+        CONFESSION_BUILDER.build(SINGLE_TEXT_REQUEST),
+        temperature=0.9,
+        max_tokens=200,
+        kind="confession",
+        timeout=config.llm_chat_timeout,
+    )
+
+
+# Запасные тексты, если ИИ недоступен. Они не считаются отправленными:
+# не попадают в отпечатки, пул и историю признаний Mini App
+CONFESSION_FALLBACK_TEXT = "Ты для меня самая важная... 💕"
+REMINDER_FALLBACK_TEXTS = {
+    "morning": "Доброе утро, Иришка! 🌅\nИмей чудесный день! Я думаю о тебе 💕",
+    "evening": "Спокойной ночи, Иришка! 🌙\nСладких снов тебе! 💕",
+}
+
+
+def is_fallback_text(kind: str, text: str) -> bool:
+    """Запасной ли это текст вместо сгенерированного"""
+    if kind == "confession":
+        return text == CONFESSION_FALLBACK_TEXT
+    return text == REMINDER_FALLBACK_TEXTS.get(kind)
 
 
 async def generate_confession() -> str:
     """Генерирует уникальное признание через Groq API"""
     try:
-        message = groq_client.chat.completions.create(
-            messages = [
-                {
-                    "role": "user",
-                    "content": (
-                        "Напиши короткое и искреннее признание в чувствах для девушки. "
-                        "Это признание от Саши, написанное через тёплого телеграм-бота. "
-                        "1–2 предложения максимум. Начни с имени (выбери либо 'Ира,', либо 'Иришка,'). "
-                        "Имя должно быть ТОЛЬКО в начале и больше не повторяться. "
-                        "Пиши простым, понятным языком, без цветистых слов, пафоса и лирики. "
-                        "Говори о живых, реальных чувствах: почему она важна, что в ней ценят, "
-                        "как спокойно и хорошо с ней. "
-                        "Избегай штампов, метафор и обобщённых фраз. "
-                        "Каждый раз генерируй новый, уникальный текст."
-                    )
-                }
-            ],
-            model="llama-3.3-70b-versatile",
-            temperature=0.9,
-            max_tokens=200,
-        )
-        
-        confession = message.choices[0].message.content
-        return confession
+        return await request_confession()
     except Exception as e:
-        logger.error(f"Ошибка генерации признания: {e}")
-        return "Ты для меня самая важная... 💕"
+        logger.error("Ошибка генерации признания: %s", e)
+        return CONFESSION_FALLBACK_TEXT
 
 
+# Системный промпт для ИИ-ответов в чате
+CHAT_SYSTEM_PROMPT = (
+    "Ты — телеграм-бот, созданный Сашей как тёплый подарок для его девушки Иры (Иришки). "
+    "Ты не заменяешь Сашу, а мягко напоминаешь о нём и его заботе. "
+    "Отвечай на сообщения Иры коротко, тепло и искренне, 1–2 предложениями. "
+    "Будь добрым, внимательным и немного игривым, но без пафоса и давления. "
+    "Иногда уместно упоминать Сашу как человека, который думает о ней и скучает, "
+    "но не делай этого в каждом ответе. "
+    "Если Ира пишет длинное сообщение — отвечай кратко и с любовью. 💕"
+)
+
+# Запасной ответ, если ИИ недоступен
+CHAT_FALLBACK_TEXT = "Ты мне очень нравишься! 💕"
 
-async def generate_chat_response(user_message: str) -> str:
-    """Генерирует умный ответ на сообщение пользователя через ИИ"""
-    try:
-        system_prompt = (
-            "Ты — телеграм-бот, созданный Сашей как тёплый подарок для его девушки Иры (Иришки). "
-            "Ты не заменяешь Сашу, а мягко напоминаешь о нём и его заботе. "
-            "Отвечай на сообщения Иры коротко, тепло и искренне, 1–2 предложениями. "
-            "Будь добрым, внимательным и немного игривым, но без пафоса и давления. "
-            "Иногда уместно упоминать Сашу как человека, который думает о ней и скучает, "
-            "но не делай этого в каждом ответе. "
-            "Если Ира пишет длинное сообщение — отвечай кратко и с любовью. 💕"
-        )
 
-        message = groq_client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": system_prompt
-                },
-                {
-                    "role": "user",
-                    "content": user_message
-                }
-            ],
-            model="llama-3.3-70b-versatile",
+def build_chat_messages(user_message: str, history=None, kind: str = "chat") -> prompts.Prompt:
+    """
+    Собирает промпт: системная инструкция, история чата и новое сообщение
+    (длинное сообщение обрезается до CHAT_INPUT_TOKENS)
+    """
+    return chat_prompt.build(
+        user_message,
+        chat_history.context(history) if history is not None else (),
+        kind=kind,
+    )
+
+
+def use_response_cache(user_message: Optional[str], history) -> bool:
+    """
+    Можно ли ответить из кеша (и положить туда ответ). Кеш не знает
+    разговора, поэтому только для сообщений, не зависящих от него:
+    приветствий и эмодзи — или первого сообщения в чате. Ответы на них
+    генерируются без истории, чтобы не ссылаться на чужие реплики.
+    """
+    if not response_cache.cacheable(user_message):
+        return False
+    return response_cache.standalone(user_message) or history is None or not chat_history.context(history)
+
+
+async def generate_chat_response(user_message: str, chat_id: Optional[int] = None) -> str:
+    """Генерирует умный ответ на сообщение пользователя через ИИ (с учетом истории чата)"""
+    try:
+        history = await chat_history.get(chat_id) if chat_id is not None else None
+        
+        # Частые короткие сообщения ("привет", эмодзи) отвечаем из кеша
+        cacheable = use_response_cache(user_message, history)
+        if cacheable:
+            cached = response_cache.get(user_message)
+            if cached is not None:
+                if history is not None:
+                    chat_history.append(chat_id, history, user_message, cached)
+                return cached
+        
+        response = await complete_prompt(
+            build_chat_messages(user_message, None if cacheable else history),
             temperature=0.8,
             max_tokens=200,
+            kind="chat",
+            timeout=config.llm_chat_timeout,
         )
         
-        return message.choices[0].message.content
+        # Запоминаем только удачные ответы, запасные тексты в историю и кеш не попадают
+        if history is not None and user_message:
+            chat_history.append(chat_id, history, user_message, response)
+        if cacheable:
+            response_cache.put(user_message, response)
+        return response
     except Exception as e:
-        logger.error(f"Ошибка генерации ответа: {e}")
-        return "Ты мне очень нравишься! 💕"
+        logger.error("Ошибка генерации ответа: %s", e)
+        return CHAT_FALLBACK_TEXT
 
 
-async def generate_reminder(reminder_type: str) -> str:
-    """Генерирует напоминание через Groq API"""
+async def stream_chat_response(message: types.Message, burst: Optional[ChatBurst] = None):
+    """Отвечает потоково: первые слова видны сразу, дальше сообщение дописывается правками"""
+    started = time.perf_counter()
+    chat_id = message.chat.id
+    user_text = burst.text if burst is not None else message.text
+    keyboard = get_main_keyboard(templates.locale(message.from_user))
+    history = await chat_history.get(chat_id)
+    
+    # Ответ из кеша показываем сразу целиком
+    cacheable = use_response_cache(user_text, history)
+    cached = response_cache.get(user_text) if cacheable else None
+    if cached is not None:
+        if burst is not None:
+            burst.commit()
+        chat_history.append(chat_id, history, user_text, cached)
+        await message.answer(cached, reply_markup=keyboard)
+        return
+    
+    reply = ProgressiveMessage(message, min_interval=config.stream_edit_interval)
+    text = ""
+    
     try:
-        prompts = {
-            "morning": (
-                "Напиши короткое, тёплое утреннее сообщение для девушки по имени Ира (или Иришка). "
-                "1–2 предложения максимум. Начни с её имени. "
-                "Пожелай ей хорошего и спокойного дня, скажи что-то искренне приятное. "
-                "Иногда уместно мягко напоминать, что Саша думает о ней или скучает, "
-                "но не делай этого в каждом сообщении. "
-                "Пиши просто, живо и без штампов. Каждый раз другой текст."
-            ),
-            "evening": (
-                "Напиши короткое, нежное вечернее сообщение перед сном для девушки по имени Ира (или Иришка). "
-                "1–2 предложения максимум. Начни с её имени. "
-                "Пожелай ей спокойной ночи и тёплых снов, скажи что-то ласковое и поддерживающее. "
-                "Иногда можно мягко упомянуть Сашу как человека, который с теплом думает о ней, "
-                "но не делай этого слишком часто. "
-                "Пиши просто и искренне, без пафоса и штампов. Каждый раз другой текст."
-            )
-        }
-
-        message = groq_client.chat.completions.create(
-            messages=[{"role": "user", "content": prompts[reminder_type]}],
-            model="llama-3.3-70b-versatile",
-            temperature=0.85,
-            max_tokens=150,
-        )
-        
-        return message.choices[0].message.content
+        async for delta in llm.stream(
+            build_chat_messages(user_text, None if cacheable else history, kind="chat_stream").messages,
+            temperature=0.8,
+            max_tokens=200,
+            kind="chat_stream",
+            timeout=config.llm_chat_timeout,
+        ):
+            text += delta
+            # С первыми словами ответ уже виден: новые сообщения его не отменяют
+            if burst is not None:
+                burst.commit()
+            await reply.update(text)
+        if not text:
+            raise RuntimeError("пустой ответ")
     except Exception as e:
-        logger.error(f"Ошибка генерации напоминания: {e}")
-        if reminder_type == "morning":
-            return "Доброе утро, Иришка! 🌅\nИмей чудесный день! Я думаю о тебе 💕"
+        logger.error("Ошибка потоковой генерации ответа: %s", e)
+        if reply.started:
+            # Обрывок ответа заменяем запасным текстом
+            await reply.finish(CHAT_FALLBACK_TEXT, reply_markup=keyboard)
         else:
-            return "Спокойной ночи, Иришка! 🌙\nСладких снов тебе! 💕"
-
-
-async def send_morning_reminder():
-    """Отправляет утреннее напоминание"""
-    global morning_active
-    if not morning_active:
+            # Пользователь еще ничего не видел — отвечаем обычным путем
+            response = await generate_chat_response(user_text, chat_id=chat_id)
+            if burst is not None:
+                burst.commit()
+            await reply.finish(response, reply_markup=keyboard)
         return
     
-    reminder_text = await generate_reminder("morning")
-    
+    await reply.finish(text, reply_markup=keyboard)
+    if user_text:
+        chat_history.append(chat_id, history, user_text, text)
+    if cacheable:
+        response_cache.put(user_text, text)
+    logs.log_event(
+        logger, "first_text", "Первый текст ответа показан через %.2fс", reply.first_visible_at - started,
+        duration_ms=(reply.first_visible_at - started) * 1000, chat_id=chat_id,
+    )
+
+
+SUMMARY_BUILDER = prompts.PromptBuilder(
+    "summary",
+    "Кратко, в 2–3 предложениях, перескажи главное из переписки: что Ира рассказала о себе, "
+    "её настроение и планы, о чём договорились. Только факты, без оценок.",
+)
+
+
+async def summarize_conversation(summary: str, turns: list) -> str:
+    """Сворачивает старые реплики диалога в короткое резюме"""
+    dialog = "\n".join(
+        f"{'Ира' if role == 'user' else 'Бот'}: {text}" for role, text in turns
+    )
+    return await complete_prompt(
+        SUMMARY_BUILDER.build(f"Предыдущее резюме: {summary or 'нет'}\n\nНовые сообщения:\n{dialog}"),
+        temperature=0.3,
+        max_tokens=150,
+        kind="summary",
+    )
+
+
+# Промпты для напоминаний
+REMINDER_PROMPTS = {
+    "morning": (
+        "Напиши короткое, тёплое утреннее сообщение для девушки по имени Ира (или Иришка). "
+        "1–2 предложения максимум. Начни с её имени. "
+        "Пожелай ей хорошего и спокойного дня, скажи что-то искренне приятное. "
+        "Иногда уместно мягко напоминать, что Саша думает о ней или скучает, "
+        "но не делай этого в каждом сообщении. "
+        "Пиши просто, живо и без штампов. Каждый раз другой текст."
+    ),
+    "evening": (
+        "Напиши короткое, нежное вечернее сообщение перед сном для девушки по имени Ира (или Иришка). "
+        "1–2 предложения максимум. Начни с её имени. "
+        "Пожелай ей спокойной ночи и тёплых снов, скажи что-то ласковое и поддерживающее. "
+        "Иногда можно мягко упомянуть Сашу как человека, который с теплом думает о ней, "
+        "но не делай этого слишком часто. "
+        "Пиши просто и искренне, без пафоса и штампов. Каждый раз другой текст."
+    )
+}
+
+
+REMINDER_BUILDERS = {
+    reminder_type: prompts.PromptBuilder(reminder_type, prompt) for reminder_type, prompt in REMINDER_PROMPTS.items()
+}
+
+
+async def request_reminder(reminder_type: str) -> str:
+    """Запрашивает напоминание у LLM (без запасного текста, ошибки пробрасываются)"""
+    return await complete_prompt(
+        REMINDER_BUILDERS[reminder_type].build(SINGLE_TEXT_REQUEST),
+        temperature=0.85,
+        max_tokens=150,
+        kind=reminder_type,
+    )
+
+
+async def request_batch(kind: str, count: int) -> list:
+    """
+    Одним запросом получает до count разных текстов (признаний или
+    напоминаний) в виде JSON-массива. Тексты, нарушающие правила промпта
+    (не с имени, больше двух предложений, повторы), отбрасываются.
+    """
+    builder = CONFESSION_BUILDER if kind == "confession" else REMINDER_BUILDERS[kind]
+    raw = await complete_prompt(
+        builder.build(batch_instruction(count), kind=f"{kind}_batch"),
+        temperature=0.9 if kind == "confession" else 0.85,
+        max_tokens=min(4000, 150 * count + 50),
+        kind=f"{kind}_batch",
+    )
+    return split_batch(raw, kind, GIRLFRIEND_NAMES)[:count]
+
+
+async def generate_reminder(reminder_type: str) -> str:
+    """Генерирует напоминание через Groq API"""
     try:
-        await bot.send_message(
-            chat_id=GIRLFRIEND_ID,
-            text=f"☀️ Утреннее напоминание:\n\n{reminder_text}"
-        )
-        logger.info(f"Утреннее напоминание отправлено Ире (ID: {GIRLFRIEND_ID})")
-        
-        # Отправляем копию владельцу для тестирования
-        await bot.send_message(
-            chat_id=OWNER_ID,
-            text=f"📤 Отправлено Ире:\n☀️ Утреннее напоминание:\n\n{reminder_text}"
-        )
+        return await request_reminder(reminder_type)
     except Exception as e:
-        logger.error(f"Ошибка при отправке утреннего напоминания: {e}")
+        logger.error("Ошибка генерации напоминания: %s", e)
+        return REMINDER_FALLBACK_TEXTS[reminder_type]
 
 
-async def send_evening_reminder():
-    """Отправляет вечернее напоминание"""
-    global evening_active
-    if not evening_active:
-        return
+def get_reminder_target(user_id: int) -> Optional[int]:
+    """Чьи напоминания может переключать пользователь: свои (получатель) или Иры (владелец)"""
+    if user_id in config.reminder_recipients:
+        return user_id
+    if user_id == config.owner_id:
+        return config.girlfriend_id
+    return None
+
+
+# Заголовки напоминаний по типу
+REMINDER_TITLES = {
+    "morning": "☀️ Утреннее напоминание",
+    "evening": "🌙 Вечернее напоминание",
+}
+
+
+async def get_reminder_texts(reminder_type: str, count: int) -> list:
+    """
+    Берет тексты напоминаний из пула, недостающие генерирует пачками
+    (один запрос на llm_batch_size текстов); что не удалось — по одному.
+    """
+    texts = []
+    while len(texts) < count:
+        text = text_pool.pop(reminder_type)
+        if text is None:
+            break
+        texts.append(text)
     
-    reminder_text = await generate_reminder("evening")
+    missing = count - len(texts)
+    if missing:
+        size = config.llm_batch_size
+        batches = await asyncio.gather(
+            *(request_batch(reminder_type, min(size, missing - i)) for i in range(0, missing, size)),
+            return_exceptions=True,
+        )
+        for batch in batches:
+            if isinstance(batch, BaseException):
+                logger.error("Ошибка пакетной генерации напоминаний: %s", batch)
+                continue
+            texts += batch
     
-    try:
-        await bot.send_message(
-            chat_id=GIRLFRIEND_ID,
-            text=f"🌙 Вечернее напоминание:\n\n{reminder_text}"
+    missing = count - len(texts)
+    if missing > 0:
+        texts += await asyncio.gather(*(generate_reminder(reminder_type) for _ in range(missing)))
+    return texts[:count]
+
+
+async def avoid_repeat(user_id: int, kind: str, text: str, regenerate) -> str:
+    """
+    Если текст почти повторяет уже отправленный получателю, меняет его
+    на другой из пула или генерирует заново (несколько попыток).
+
+    regenerate — запрос к LLM без запасного текста: если он упал, новые
+    попытки не делаются и уходит то, что есть. Запасные тексты не проверяются.
+    """
+    if is_fallback_text(kind, text):
+        return text
+    for _ in range(3):
+        if not sent_texts.is_duplicate(user_id, text):
+            return text
+        replacement = text_pool.pop(kind)
+        metrics.DUPLICATE_TEXTS.inc(kind, "regenerated" if replacement is None else "swapped")
+        if replacement is None:
+            try:
+                replacement = await regenerate()
+            except Exception as e:
+                logger.error("Не удалось сгенерировать замену повтору '%s': %s", kind, e)
+                break
+        text = replacement
+    if sent_texts.is_duplicate(user_id, text):
+        metrics.DUPLICATE_TEXTS.inc(kind, "sent")
+        logger.warning("Не удалось подобрать неповторяющийся текст '%s' для %s", kind, user_id)
+    return text
+
+
+async def claim_reminders(reminder_type: str, entries: List[Tuple[int, str]],
+                          claims: Optional[ReminderClaims]) -> Set[int]:
+    """
+    Отбирает получателей, которым напоминание за этот день еще не
+    отправлялось (нет ключа в журнале), — до генерации текстов. При
+    нескольких воркерах оставшиеся еще и забираются в общей таблице.
+    """
+    keys = {user_id: outbox_key(user_id, reminder_type, day) for user_id, day in entries}
+    existing = await outbox.existing(keys.values())
+    fresh = [(user_id, day) for user_id, day in entries if keys[user_id] not in existing]
+    if claims is not None and fresh:
+        return await claims.claim(reminder_type, fresh)
+    return {user_id for user_id, _ in fresh}
+
+
+async def send_reminder(user_id: int, reminder_type: str, reminder_text: str, day: date):
+    """Записывает напоминание в журнал и отправляет получателю"""
+    key = outbox_key(user_id, reminder_type, day.isoformat())
+    # Каждая отправка — своя задача планировщика: ID не протекает в соседние
+    logs.correlation_id.set(key)
+    reminder_text = await avoid_repeat(
+        user_id, reminder_type, reminder_text, lambda: request_reminder(reminder_type)
+    )
+    if not await outbox.put(key, user_id, reminder_type, reminder_text):
+        logger.info("Напоминание %s уже есть в журнале, повторно не отправляем", key)
+        return
+    await deliver_reminder(key, user_id, reminder_type, reminder_text)
+
+
+async def deliver_reminder(key: str, user_id: int, reminder_type: str, reminder_text: str):
+    """Отправляет записанное в журнал напоминание и отмечает доставку"""
+    title = REMINDER_TITLES[reminder_type]
+    sends = [
+        bot.send_message(
+            chat_id=user_id,
+            text=f"{title}:\n\n{reminder_text}"
         )
-        logger.info(f"Вечернее напоминание отправлено Ире (ID: {GIRLFRIEND_ID})")
-        
-        # Отправляем копию владельцу для тестирования
-        await bot.send_message(
-            chat_id=OWNER_ID,
-            text=f"📤 Отправлено Ире:\n🌙 Вечернее напоминание:\n\n{reminder_text}"
+    ]
+    
+    # Копию напоминаний Иры параллельно отправляем владельцу для тестирования
+    if user_id == config.girlfriend_id:
+        sends.append(
+            bot.send_message(
+                chat_id=config.owner_id,
+                text=f"📤 Отправлено Ире:\n{title}:\n\n{reminder_text}"
+            )
         )
-    except Exception as e:
-        logger.error(f"Ошибка при отправке вечернего напоминания: {e}")
+    
+    results = await asyncio.gather(*sends, return_exceptions=True)
+    if isinstance(results[0], BaseException):
+        if isinstance(results[0], TelegramForbiddenError):
+            # Получатель заблокировал бота: досылать после перезапуска бессмысленно
+            await outbox.drop(key)
+        raise results[0]
+    await outbox.mark_sent(key)
+    if not is_fallback_text(reminder_type, reminder_text):
+        text_pool.mark_sent(reminder_type, reminder_text)
+        sent_texts.add(user_id, reminder_text)
+    logger.info("%s отправлено пользователю %s", title, user_id,
+                extra={"user_id": user_id, "type": reminder_type})
+    if len(results) > 1 and isinstance(results[1], BaseException):
+        logger.error("Не удалось отправить копию владельцу: %s", results[1])
+
+
+async def replay_outbox():
+    """Досылает напоминания, записанные в журнал, но не доставленные до перезапуска"""
+    entries = await outbox.pending()
+    if not entries:
+        return
+    logger.info("📮 Досылаем напоминаний из журнала: %s", len(entries))
+    for entry in entries:
+        token = logs.correlation_id.set(entry.key)
+        try:
+            await deliver_reminder(entry.key, entry.user_id, entry.type, entry.text)
+            metrics.OUTBOX_ENTRIES.inc("replayed")
+        except Exception as e:
+            logger.error("Не удалось дослать напоминание %s: %s", entry.key, e)
+        finally:
+            logs.correlation_id.reset(token)
+
+
+# ==================== MINI APP ====================
+
+def miniapp_days(user_id: int) -> dict:
+    """Счетчики «мы вместе» для Mini App (одинаковые для всех, обновляются раз в минуту)"""
+    days, hours, minutes, secs = get_days_together()
+    start = config.relationship_start
+    total_seconds = days * 86400 + hours * 3600 + minutes * 60 + secs
+    return {
+        "start": start.isoformat() if start else None,
+        "days": days,
+        "hours": hours,
+        "minutes": minutes,
+        "seconds": secs,
+        "total_hours": total_seconds // 3600,
+        "total_minutes": total_seconds // 60,
+        "total_seconds": total_seconds,
+        "as_of": int(time.time()),
+    }
+
+
+def miniapp_confessions(user_id: int) -> dict:
+    """Последние признания получателя, новые первыми"""
+    return {
+        "confessions": [
+            {"text": text, "sent_at": int(sent_at)}
+            for text, sent_at in recent_texts.get(user_id, "confession")
+        ]
+    }
+
+
+def miniapp_settings(user_id: int) -> dict:
+    """Окна напоминаний, включены ли они и когда ближайшее"""
+    settings = state_store.get(user_id)
+    due = reminder_scheduler.describe(user_id)
+    payload = {"timezone": settings.timezone or config.reminder_timezone}
+    for reminder_type in ("morning", "evening"):
+        payload[reminder_type] = {
+            "active": getattr(settings, f"{reminder_type}_active"),
+            "window": [getattr(settings, f"{reminder_type}_start"), getattr(settings, f"{reminder_type}_end")],
+            "next": due[reminder_type].isoformat() if reminder_type in due else None,
+        }
+    return payload
 
 
 # ==================== ОБРАБОТЧИКИ КОМАНД ====================
 
-@dp.message(CommandStart())
+@router.message(CommandStart())
 async def cmd_start(message: types.Message):
     """Обработчик команды /start"""
-    global morning_active, evening_active
     first_name = message.from_user.first_name or "Иришка"
     user_id = message.from_user.id
     
-    # Активируем напоминания для GIRLFRIEND_ID
-    if user_id == GIRLFRIEND_ID:
-        morning_active = True
-        evening_active = True
-        logger.info(f"Ира активирована для напоминаний")
-    
-    welcome_text = (
-        f"💕 Привет, Иришка!\n\n"
-        f"Я приготовил для тебя что-то на День Святого Валентина... 💘"
-    )
+    # Активируем напоминания для Иры и других получателей
+    if user_id in config.reminder_recipients:
+        state_store.update(
+            user_id,
+            morning_active=True,
+            evening_active=True,
+            activated_at=time.time(),
+        )
+        reminder_scheduler.sync_user(user_id)
+        logger.info("Пользователь %s активирован для напоминаний", user_id)
     
+    locale = templates.locale(message.from_user)
     await message.answer(
-        welcome_text,
-        reply_markup=get_main_keyboard()
+        templates.text("welcome", locale),
+        reply_markup=get_main_keyboard(locale)
     )
     
-    logger.info(f"User {user_id} ({first_name}) started the bot")
+    logger.info("User %s (%s) started the bot", user_id, first_name)
 
 
-@dp.message(Command("help"))
+@router.message(Command("help"))
 async def cmd_help(message: types.Message):
     """Обработчик команды /help"""
-    help_text = (
-        "🎯 Вот что я умею:\n\n"
-        "📱 Основное:\n"
-        "💌 Открыть сюрприз\n\n"
-        "⏱️ Команды:\n"
-        "/days - Счетчик дней вместе (в днях, часах, секундах)\n"
-        "/confession - Случайное признание (новое каждый раз)\n"
-        "/help - Эта справка\n"
-        "/disable_morning - Отключить утренние напоминания\n"
-        "/enable_morning - Включить утренние напоминания\n"
-        "/disable_evening - Отключить вечерние напоминания\n"
-        "/enable_evening - Включить вечерние напоминания\n\n"
-        "🎭 Дополнительно:\n"
-        "Напиши мне что-нибудь - я отвечу! 💕"
-    )
-    
-    await message.answer(help_text, reply_markup=get_main_keyboard())
-
-
-@dp.callback_query(lambda c: c.data == "help_callback")
+    locale = templates.locale(message.from_user)
+    await message.answer(templates.text("help", locale), reply_markup=get_main_keyboard(locale))
+
+
+@router.callback_query(lambda c: c.data == "help_callback")
 async def callback_help(callback_query: CallbackQuery):
     """Обработчик кнопки справки"""
-    help_text = (
-        "🎯 Вот что я умею:\n\n"
-        "📱 Основное:\n"
-        "💌 Открыть сюрприз\n\n"
-        "⏱️ Команды:\n"
-        "/days - Счетчик дней вместе (в днях, часах, секундах)\n"
-        "/confession - Случайное признание (новое каждый раз)\n"
-        "/help - Эта справка\n"
-        "/disable_morning - Отключить утренние напоминания\n"
-        "/enable_morning - Включить утренние напоминания\n"
-        "/disable_evening - Отключить вечерние напоминания\n"
-        "/enable_evening - Включить вечерние напоминания\n\n"
-        "🎭 Дополнительно:\n"
-        "Напиши мне что-нибудь - я отвечу! 💕"
-    )
-    
+    locale = templates.locale(callback_query.from_user)
     await callback_query.message.edit_text(
-        help_text,
-        reply_markup=InlineKeyboardMarkup(
-            inline_keyboard=[
-                [
-                    InlineKeyboardButton(
-                        text="⬅️ Назад",
-                        callback_data="back_to_main"
-                    )
-                ]
-            ]
-        )
+        templates.text("help", locale),
+        reply_markup=templates.back_keyboard(locale)
     )
     
     await callback_query.answer()
 
 
-@dp.callback_query(lambda c: c.data == "back_to_main")
+@router.callback_query(lambda c: c.data == "back_to_main")
 async def callback_back_to_main(callback_query: CallbackQuery):
     """Обработчик кнопки возврата в главное меню"""
-    main_text = (
-        f"💕 Привет, Иришка!\n\n"
-        f"Я приготовил для тебя что-то на День Святого Валентина... 💘"
-    )
-    
+    locale = templates.locale(callback_query.from_user)
     await callback_query.message.edit_text(
-        main_text,
-        reply_markup=get_main_keyboard()
+        templates.text("welcome", locale),
+        reply_markup=get_main_keyboard(locale)
     )
     
     await callback_query.answer()
 
 
-@dp.message(Command("status"))
+@router.message(Command("status"))
 async def cmd_status(message: types.Message):
     """Обработчик команды /status"""
-    user_id = message.from_user.id
-    username = message.from_user.username or "No username"
-    
-    status_text = (
-        f"✅ Бот работает!\n\n"
-        f"👤 Твой ID: {user_id}\n"
-        f"📝 Ник: @{username}\n"
-        f"💕 Статус: Готов к признаниям!\n\n"
-        f"Нажми кнопку ниже, чтобы открыть сюрприз 💌"
+    locale = templates.locale(message.from_user)
+    status_text = templates.text(
+        "status",
+        locale,
+        user_id=message.from_user.id,
+        username=message.from_user.username or templates.text("no_username", locale),
     )
     
     await message.answer(
         status_text,
-        reply_markup=get_main_keyboard()
+        reply_markup=get_main_keyboard(locale)
     )
 
 
-@dp.message(Command("days"))
+@router.message(Command("days"))
 async def cmd_days(message: types.Message):
     """Обработчик команды /days - показывает счетчик дней в разных единицах"""
     days, hours, minutes, secs = get_days_together()
@@ -381,108 +851,139 @@ async def cmd_days(message: types.Message):
     total_seconds = days * 86400 + hours * 3600 + minutes * 60 + secs
     
     # Красивый формат для дней
-    if days == 0:
-        days_display = "0 (сегодня наш первый день!)"
-    elif days == 1:
-        days_display = "1"
-    else:
-        days_display = str(days)
+    locale = templates.locale(message.from_user)
+    days_display = templates.text("days_first", locale) if days == 0 else str(days)
     
-    response = (
-        f"💕 Мы вместе {days_display} дней\n"
-        f"в часах это {total_hours} часов\n"
-        f"в минутах это {total_minutes:,} минут\n"
-        f"а в секундах целых {total_seconds:,}\n\n"
-        f"Каждая секунда с тобой - волшебство ✨\n"
-        f"Открой сюрприз, чтобы узнать, как сильно ты мне нужна 💌"
+    response = templates.text(
+        "days",
+        locale,
+        days=days_display,
+        hours=total_hours,
+        minutes=total_minutes,
+        seconds=total_seconds,
     )
     
     await message.answer(
         response,
-        reply_markup=get_main_keyboard()
+        reply_markup=get_main_keyboard(locale)
     )
 
 
-@dp.message(Command("confession"))
+@router.message(Command("confession"))
 async def cmd_confession(message: types.Message):
     """Обработчик команды /confession - генерирует ИИ признание"""
-    # Показываем индикатор печати
-    await bot.send_chat_action(chat_id=message.chat.id, action="typing")
-    confession = await generate_confession()
-    
-    response = (
-        f"💕 Вот что я хочу сказать:\n\n"
-        f"{confession}\n\n"
-        f"Посмотри полный сюрприз - нажми кнопку ниже 💌"
-    )
+    # Берем готовое признание из пула; если пул пуст — генерируем на лету
+    confession = text_pool.pop("confession")
+    if confession is None:
+        logger.info("Пул 'confession' пуст, генерируем текст на лету")
+        # Показываем индикатор печати
+        await bot.send_chat_action(chat_id=message.chat.id, action="typing")
+        confession = await generate_confession()
+    confession = await avoid_repeat(message.from_user.id, "confession", confession, request_confession)
+    if not is_fallback_text("confession", confession):
+        text_pool.mark_sent("confession", confession)
+        sent_texts.add(message.from_user.id, confession)
+        recent_texts.add(message.from_user.id, "confession", confession)
     
+    locale = templates.locale(message.from_user)
     await message.answer(
-        response,
-        reply_markup=get_main_keyboard()
+        templates.text("confession", locale, confession=confession),
+        reply_markup=get_main_keyboard(locale)
     )
 
 
-@dp.message(Command("disable_morning"))
+@router.message(Command("disable_morning"))
 async def cmd_disable_morning(message: types.Message):
     """Обработчик команды /disable_morning - отключает утренние напоминания"""
-    global morning_active
-    user_id = message.from_user.id
-    if user_id != GIRLFRIEND_ID and user_id != OWNER_ID:
-        await message.answer("Эта команда доступна только для Иры или владельца.")
+    target_id = get_reminder_target(message.from_user.id)
+    if target_id is None:
+        await message.answer(templates.text("recipients_only", templates.locale(message.from_user)))
         return
     
-    morning_active = False
-    await message.answer("Утренние напоминания отключены. 💤")
+    state_store.update(target_id, morning_active=False)
+    reminder_scheduler.sync_user(target_id)
+    await message.answer(templates.text("morning_disabled", templates.locale(message.from_user)))
     logger.info("Утренние напоминания отключены.")
 
 
-@dp.message(Command("enable_morning"))
+@router.message(Command("enable_morning"))
 async def cmd_enable_morning(message: types.Message):
     """Обработчик команды /enable_morning - включает утренние напоминания"""
-    global morning_active
-    user_id = message.from_user.id
-    if user_id != GIRLFRIEND_ID and user_id != OWNER_ID:
-        await message.answer("Эта команда доступна только для Иры или владельца.")
+    target_id = get_reminder_target(message.from_user.id)
+    if target_id is None:
+        await message.answer(templates.text("recipients_only", templates.locale(message.from_user)))
         return
     
-    morning_active = True
-    await message.answer("Утренние напоминания включены. ☀️")
+    state_store.update(target_id, morning_active=True)
+    reminder_scheduler.sync_user(target_id)
+    await message.answer(templates.text("morning_enabled", templates.locale(message.from_user)))
     logger.info("Утренние напоминания включены.")
 
 
-@dp.message(Command("disable_evening"))
+@router.message(Command("disable_evening"))
 async def cmd_disable_evening(message: types.Message):
     """Обработчик команды /disable_evening - отключает вечерние напоминания"""
-    global evening_active
-    user_id = message.from_user.id
-    if user_id != GIRLFRIEND_ID and user_id != OWNER_ID:
-        await message.answer("Эта команда доступна только для Иры или владельца.")
+    target_id = get_reminder_target(message.from_user.id)
+    if target_id is None:
+        await message.answer(templates.text("recipients_only", templates.locale(message.from_user)))
         return
     
-    evening_active = False
-    await message.answer("Вечерние напоминания отключены. 🌙💤")
+    state_store.update(target_id, evening_active=False)
+    reminder_scheduler.sync_user(target_id)
+    await message.answer(templates.text("evening_disabled", templates.locale(message.from_user)))
     logger.info("Вечерние напоминания отключены.")
 
 
-@dp.message(Command("enable_evening"))
+@router.message(Command("enable_evening"))
 async def cmd_enable_evening(message: types.Message):
     """Обработчик команды /enable_evening - включает вечерние напоминания"""
-    global evening_active
-    user_id = message.from_user.id
-    if user_id != GIRLFRIEND_ID and user_id != OWNER_ID:
-        await message.answer("Эта команда доступна только для Иры или владельца.")
+    target_id = get_reminder_target(message.from_user.id)
+    if target_id is None:
+        await message.answer(templates.text("recipients_only", templates.locale(message.from_user)))
         return
     
-    evening_active = True
-    await message.answer("Вечерние напоминания включены. 🌙")
+    state_store.update(target_id, evening_active=True)
+    reminder_scheduler.sync_user(target_id)
+    await message.answer(templates.text("evening_enabled", templates.locale(message.from_user)))
     logger.info("Вечерние напоминания включены.")
 
 
+@router.message(Command("stats"))
+async def cmd_stats(message: types.Message):
+    """Обработчик команды /stats - сводка метрик для владельца"""
+    locale = templates.locale(message.from_user)
+    if message.from_user.id != config.owner_id:
+        await message.answer(templates.text("owner_only", locale))
+        return
+    
+    cache = response_cache.stats()
+    sending = outbound.stats()
+    lines = [templates.text("stats_title", locale)]
+    lines.extend(metrics.summary(locale))
+    lines.append(templates.text("stats_models", locale, models=", ".join(llm.status())))
+    lines.append(templates.text("stats_cache", locale, size=cache["size"], hit_rate=cache["hit_rate"]))
+    lines.append(templates.text(
+        "stats_sending", locale, sent=sending["sent"], failed=sending["failed"],
+        queue_depth=sending["queue_depth"], p99=sending["latency_p99"] * 1000,
+    ))
+    lines.append(templates.text("stats_pool", locale, sizes=", ".join(
+        f"{kind} {text_pool.size(kind)}" for kind in ("confession", "morning", "evening")
+    )))
+    lines.append(templates.text("stats_scheduled", locale, count=reminder_scheduler.pending()))
+    lines.append(templates.text("stats_activity", locale, count=len(activity)))
+    await message.answer("\n".join(lines))
+
+
 # ==================== ОБРАБОТЧИКИ ТЕКСТА ====================
 
-@dp.message()
-async def default_handler(message: types.Message):
-    """Обрабатывает любые сообщения с ИИ-ответом"""
+@router.message(flags={"coalesce": True})
+async def default_handler(message: types.Message, burst: Optional[ChatBurst] = None):
+    """
+    Обрабатывает любые сообщения с ИИ-ответом.
+
+    Несколько сообщений подряд приходят одной пачкой (burst, см.
+    CoalescingMiddleware): на них дается один ответ на последнее сообщение.
+    """
     try:
         # Показываем статус "печатает"
         await bot.send_chat_action(
@@ -490,91 +991,208 @@ async def default_handler(message: types.Message):
             action="typing"
         )
         
+        # Потоковый режим: ответ появляется по мере генерации
+        if config.chat_streaming:
+            await stream_chat_response(message, burst)
+            return
+        
         # Генерируем ответ через ИИ
-        response = await generate_chat_response(message.text)
+        user_text = burst.text if burst is not None else message.text
+        response = await generate_chat_response(user_text, chat_id=message.chat.id)
+        if burst is not None:
+            burst.commit()
         
         # Отправляем ответ с клавиатурой
         await message.answer(
             response,
-            reply_markup=get_main_keyboard()
+            reply_markup=get_main_keyboard(templates.locale(message.from_user))
         )
         
     except Exception as e:
-        logger.error(f"Ошибка в default_handler: {e}")
+        logger.error("Ошибка в default_handler: %s", e, exc_info=True)
+        locale = templates.locale(message.from_user)
         await message.answer(
-            "Что-то пошло не так... Напиши /help 💕",
-            reply_markup=get_main_keyboard()
+            templates.text("error", locale),
+            reply_markup=get_main_keyboard(locale)
         )
 
 
 # ==================== ОБРАБОТЧИК ERRORS ====================
 
-async def error_handler(update: types.Update, exception: Exception):
+async def error_handler(event: types.ErrorEvent):
     """Обработчик ошибок бота"""
-    logger.error(f"Update {update}, caused error {exception}")
+    update = event.update
+    # Сам апдейт в лог не пишем: его repr большой и собирается на event loop.
+    # По update_id (он же correlation ID) запись связывается с остальными
+    logger.error("Update %s caused error %r", update.update_id, event.exception, exc_info=event.exception)
     
     # Пошлем сообщение об ошибке пользователю если возможно
     if update.message:
         try:
             await update.message.answer(
-                "Произошла ошибка 😔\nПопробуй еще раз или используй /start"
+                templates.text("update_error", templates.locale(update.message.from_user))
             )
         except Exception as e:
-            logger.error(f"Failed to send error message: {e}")
+            logger.error("Failed to send error message: %s", e)
 
 
 # ==================== ЗАПУСК БОТА ====================
 
-async def main():
-    """Главная функция запуска"""
+def setup_logging(prefix: str = ""):
+    """Простой лог до загрузки конфига; в main() его заменяет logs.configure()"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format=logs.TEXT_FORMAT.format(prefix=prefix)
+    )
+
+
+def run_worker(index: int, port: int, secret: str):
+    """Точка входа процесса-обработчика в кластерном режиме (WORKERS > 1)"""
+    setup_logging(prefix=f"worker-{index} - ")
+    try:
+        asyncio.run(main(worker=(index, port, secret)))
+    except KeyboardInterrupt:
+        pass
+
+
+async def main(worker: Optional[tuple] = None):
+    """
+    Главная функция запуска.
+
+    worker = (номер, порт, секрет) — процесс-обработчик кластера: принимает
+    апдейты от фронта на локальном порту, планировщик напоминаний работает
+    только в процессе-лидере.
+    """
+    app_config = load_config()
+    # Запись лога уходит в очередь; форматирует и пишет ее фоновый поток
+    log_listener = logs.configure(
+        app_config.log_format,
+        level=app_config.log_level,
+        sample_rate=app_config.log_sample_rate,
+        slow_ms=app_config.log_slow_ms,
+        worker=f"worker-{worker[0]}" if worker is not None else None,
+    )
+    atexit.register(log_listener.stop)
+    if worker is None and app_config.workers > 1:
+        await run_cluster(
+            app_config,
+            create_bot(app_config),
+            run_worker,
+            allowed_updates=router.resolve_used_update_types(),
+        )
+        return
+    
+    worker_index = worker[0] if worker is not None else None
+    dp = create_app(app_config, worker_index=worker_index)
+    
     logger.info("🤖 Бот запущен!")
-    logger.info(f"Mini App URL: {MINI_APP_URL}")
-    logger.info(f"Напоминания будут отправляться Ире (ID: {GIRLFRIEND_ID})")
+    logger.info(f"Mini App URL: {config.mini_app_url}")
+    logger.info(f"Напоминания будут отправляться Ире (ID: {config.girlfriend_id})")
+    logger.info(f"Режим получения апдейтов: {config.bot_mode}")
     
-    # Установка обработчика ошибок
-    dp.error.register(error_handler)
+    # Загрузка сохраненных настроек напоминаний
+    await state_store.start()
     
-    # Инициализация scheduler
-    scheduler.start()
-    
-    # Настройка расписания для напоминаний
-    # Утреннее напоминание: случайное время с 9:00 до 12:00
-    morning_hour = random.randint(9, 11)
-    morning_minute = random.randint(0, 59)
-    scheduler.add_job(
-        send_morning_reminder,
-        CronTrigger(hour=morning_hour, minute=morning_minute),
-        id='morning_reminder',
-        name='Утреннее напоминание'
-    )
-    logger.info(f"⏰ Утреннее напоминание: {morning_hour:02d}:{morning_minute:02d}")
-    
-    # Вечернее напоминание: случайное время с 21:00 до 23:00
-    evening_hour = random.randint(21, 22)
-    evening_minute = random.randint(0, 59)
-    scheduler.add_job(
-        send_evening_reminder,
-        CronTrigger(hour=evening_hour, minute=evening_minute),
-        id='evening_reminder',
-        name='Вечернее напоминание'
-    )
-    logger.info(f"⏰ Вечернее напоминание: {evening_hour:02d}:{evening_minute:02d}")
-    
-    # Запуск polling'а
-    try:
-        await dp.start_polling(
-            bot,
-            allowed_updates=dp.resolve_used_update_types()
+    # Загрузка пула текстов и запуск фонового пополнения
+    await text_pool.start()
+    
+    # Фоновая запись истории переписки
+    chat_history.start()
+    
+    # Гистограммы активности получателей (нужны планировщику до первого расчета)
+    await activity.start()
+    
+    # Отпечатки отправленных текстов (защита от повторов)
+    await sent_texts.start()
+    
+    # Последние признания для Mini App
+    await recent_texts.start()
+    
+    # Планировщик напоминаний: время выбирается заново каждый день внутри окна,
+    # ближе к часам, когда получатель обычно пишет. Перед стартом досылаются
+    # напоминания, которые не успели уйти до перезапуска.
+    # В кластере его запускает только процесс, которому досталась аренда
+    election = None
+    if worker is None:
+        await replay_outbox()
+        reminder_scheduler.start()
+        for reminder_type, due in reminder_scheduler.describe(config.girlfriend_id).items():
+            logger.info(f"⏰ {REMINDER_TITLES[reminder_type]}: {due:%Y-%m-%d %H:%M}")
+    else:
+        async def on_elected():
+            await replay_outbox()
+            reminder_scheduler.start()
+        
+        election = LeaderElection(
+            Lease(config.data_path, "reminders", owner=f"{socket.gethostname()}:{os.getpid()}", ttl=config.lease_ttl),
+            on_elected=on_elected,
+            on_lost=reminder_scheduler.stop,
         )
+        election.start()
+    
+    # Запуск в выбранном режиме: long polling или вебхук
+    metrics_runner = None
+    miniapp_runner = None
+    try:
+        if worker is not None:
+            _, port, secret = worker
+            await run_webhook(
+                dp,
+                bot,
+                host=WORKER_HOST,
+                port=port,
+                path=WORKER_PATH,
+                secret_token=secret,
+                drain_timeout=config.webhook_drain_timeout,
+            )
+        elif config.bot_mode == 'webhook':
+            await run_webhook(
+                dp,
+                bot,
+                host=config.webhook_host,
+                port=config.webhook_port,
+                path=config.webhook_path,
+                base_url=config.webhook_url,
+                secret_token=config.webhook_secret,
+                drain_timeout=config.webhook_drain_timeout,
+                miniapp_api=miniapp_api,
+            )
+        else:
+            if config.metrics_port:
+                metrics_runner = await metrics.start_server(config.webhook_host, config.metrics_port)
+                logger.info(f"📈 Метрики: http://{config.webhook_host}:{config.metrics_port}/metrics")
+            if config.miniapp_api_port:
+                miniapp_runner = await miniapp.start_server(miniapp_api, config.webhook_host, config.miniapp_api_port)
+                logger.info(f"📱 API Mini App: http://{config.webhook_host}:{config.miniapp_api_port}/api/")
+            await dp.start_polling(
+                bot,
+                allowed_updates=dp.resolve_used_update_types()
+            )
     finally:
-        scheduler.shutdown()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        if miniapp_runner is not None:
+            await miniapp_runner.cleanup()
+        if election is not None:
+            await election.stop()
+        await reminder_scheduler.stop()
+        await text_pool.stop()
+        await chat_history.stop()
+        await activity.stop()
+        await sent_texts.stop()
+        await recent_texts.stop()
+        await outbox.close()
+        await state_store.stop()
+        await dp.storage.close()
+        await llm.close()
         await bot.session.close()
 
 
 if __name__ == "__main__":
-    import asyncio
-    
+    setup_logging()
     try:
         asyncio.run(main())
+    except ConfigError as e:
+        raise SystemExit(str(e))
     except KeyboardInterrupt:
-        logger.info("🛑 Бот остановлен")
\ No newline at end of file
+        logger.info("🛑 Бот остановлен")
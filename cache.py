@@ -0,0 +1,210 @@
+import random
+import re
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+np = None
+
+
+def _load_numpy() -> bool:
+    """Импортирует NumPy при первом создании кеша (поиск похожих сообщений необязателен)"""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return False
+        np = numpy
+    return True
+
+_PUNCTUATION = re.compile(r"[.,!?;:…\"'«»()\-–—]+")
+_REPEATS = re.compile(r"(.)\1{2,}")
+_WORDS = re.compile(r"\w+")
+
+# Сообщения, ответ на которые не зависит от разговора (после normalize)
+STANDALONE_PHRASES = frozenset({
+    "привет", "приветик", "хай", "доброе утро", "добрый день", "добрый вечер",
+    "спокойной ночи", "сладких снов", "пока", "скучаю", "я скучаю", "скучаю по тебе",
+    "люблю", "люблю тебя", "я тебя люблю", "обнимаю", "целую", "спасибо", "как дела",
+    "hi", "hello", "good morning", "good night", "i love you", "i miss you", "thank you",
+})
+# Слова, которые меняют смысл на противоположный: "люблю" и "не люблю" не похожи
+_NEGATIONS = frozenset({"не", "нет", "ни", "неа", "no", "not", "never", "dont"})
+
+
+def normalize(text: str) -> str:
+    """Приводит сообщение к ключу кеша: регистр, пунктуация, повторы букв, пробелы"""
+    text = text.lower().replace("ё", "е")
+    text = _PUNCTUATION.sub(" ", text)
+    text = _REPEATS.sub(r"\1", text)
+    return " ".join(text.split())
+
+
+def _negations(key: str) -> frozenset:
+    return frozenset(_WORDS.findall(key)) & _NEGATIONS
+
+
+class _Entry:
+    __slots__ = ("answers", "created_at", "last_served")
+
+    def __init__(self, created_at: float):
+        self.answers: List[str] = []
+        self.created_at = created_at
+        self.last_served: Optional[int] = None
+
+
+class ResponseCache:
+    """
+    Кеш ИИ-ответов на частые короткие сообщения ("привет", "спокойной ночи", эмодзи).
+
+    Для каждого ключа копит до variants разных ответов: пока их меньше,
+    запрос считается промахом и идет в LLM, новый ответ добавляется в кеш.
+    Дальше ответы выдаются случайно, без повтора подряд. Если установлен
+    NumPy, похожие сообщения находятся через косинусную близость векторов
+    символьных триграмм (но не с разными отрицаниями).
+
+    Ключ — только текст сообщения, поэтому кешировать можно лишь ответы,
+    которые не зависят от разговора (см. standalone()).
+    """
+
+    def __init__(self, capacity: int = 500, ttl: float = 24 * 3600, variants: int = 3,
+                 max_length: int = 40, similarity: float = 0.75, dim: int = 512):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.variants = variants
+        self.max_length = max_length
+        self.similarity = similarity
+        self.dim = dim
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+        # Индекс похожести: строка матрицы на каждый ключ
+        self._use_index = capacity > 0 and _load_numpy()
+        if self._use_index:
+            self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+            self._slot_keys: List[Optional[str]] = [None] * capacity
+            self._slots: Dict[str, int] = {}
+            self._free = list(range(capacity - 1, -1, -1))
+
+    # ---------- Индекс похожести ----------
+
+    def _vectorize(self, key: str):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        padded = f" {key} "
+        for i in range(len(padded) - 2):
+            vector[zlib.crc32(padded[i:i + 3].encode("utf-8")) % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _index_add(self, key: str):
+        slot = self._free.pop()
+        self._vectors[slot] = self._vectorize(key)
+        self._slot_keys[slot] = key
+        self._slots[key] = slot
+
+    def _index_remove(self, key: str):
+        slot = self._slots.pop(key, None)
+        if slot is not None:
+            self._vectors[slot] = 0.0
+            self._slot_keys[slot] = None
+            self._free.append(slot)
+
+    def _nearest(self, key: str) -> Optional[str]:
+        if not self._slots:
+            return None
+        scores = self._vectors @ self._vectorize(key)
+        slot = int(np.argmax(scores))
+        if scores[slot] < self.similarity:
+            return None
+        similar = self._slot_keys[slot]
+        # Триграммы почти не замечают "не": такое сообщение значит обратное
+        if _negations(similar) != _negations(key):
+            return None
+        return similar
+
+    # ---------- Публичный API ----------
+
+    def cacheable(self, text: Optional[str]) -> bool:
+        if not text or self.capacity <= 0:
+            return False
+        key = normalize(text)
+        return 0 < len(key) <= self.max_length
+
+    @staticmethod
+    def standalone(text: Optional[str]) -> bool:
+        """Приветствие, пожелание или одни эмодзи: ответ не зависит от истории чата"""
+        if not text:
+            return False
+        key = normalize(text)
+        return key in STANDALONE_PHRASES or (bool(key) and not _WORDS.search(key))
+
+    def _remove(self, key: str):
+        self._entries.pop(key, None)
+        if self._use_index:
+            self._index_remove(key)
+
+    def _lookup(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None and time.time() - entry.created_at > self.ttl:
+            self._remove(key)
+            return None
+        return entry
+
+    def get(self, text: Optional[str]) -> Optional[str]:
+        """Готовый ответ или None (промах)"""
+        if not self.cacheable(text):
+            return None
+        key = normalize(text)
+        entry = self._lookup(key)
+        near = False
+        if entry is None and self._use_index:
+            similar = self._nearest(key)
+            if similar is not None:
+                entry = self._lookup(similar)
+                key, near = similar, True
+        if entry is None or len(entry.answers) < self.variants:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        # Не повторяем последний отданный вариант, если есть из чего выбрать
+        choices = [i for i in range(len(entry.answers)) if i != entry.last_served]
+        index = random.choice(choices) if choices else 0
+        entry.last_served = index
+        if near:
+            self.near_hits += 1
+        else:
+            self.hits += 1
+        return entry.answers[index]
+
+    def put(self, text: Optional[str], answer: str):
+        """Добавляет вариант ответа для сообщения"""
+        if not self.cacheable(text):
+            return
+        key = normalize(text)
+        entry = self._lookup(key)
+        if entry is None:
+            while len(self._entries) >= self.capacity:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+            entry = self._entries[key] = _Entry(time.time())
+            if self._use_index:
+                self._index_add(key)
+        self._entries.move_to_end(key)
+        if answer not in entry.answers and len(entry.answers) < self.variants:
+            entry.answers.append(answer)
+
+    def stats(self) -> dict:
+        total = self.hits + self.near_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.near_hits) / total if total else 0.0,
+        }
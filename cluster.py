@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import multiprocessing
+import secrets
+import signal
+from typing import Callable, Dict, List, Optional
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, web
+from aiogram import Bot
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+WORKER_PATH = "/updates"
+WORKER_HOST = "127.0.0.1"
+
+
+def routing_key(update: dict) -> int:
+    """ID чата (или пользователя) апдейта: все апдейты одного чата идут в один процесс"""
+    for field in ("message", "edited_message", "channel_post", "edited_channel_post", "business_message"):
+        event = update.get(field)
+        if event:
+            return event["chat"]["id"]
+    callback = update.get("callback_query")
+    if callback:
+        message = callback.get("message")
+        return message["chat"]["id"] if message else callback["from"]["id"]
+    for event in update.values():
+        if isinstance(event, dict):
+            for field in ("chat", "from", "user"):
+                if isinstance(event.get(field), dict) and "id" in event[field]:
+                    return event[field]["id"]
+    return update.get("update_id", 0)
+
+
+class WorkerPool:
+    """
+    Процессы-обработчики на одной машине.
+
+    Каждый процесс — обычный бот в режиме вебхука на локальном порту;
+    фронт пересылает ему апдейты его чатов. Упавший процесс перезапускается.
+    """
+
+    def __init__(self, target: Callable[[int, int, str], None], count: int, base_port: int,
+                 drain_timeout: float = 30.0, retries: int = 5):
+        self.target = target
+        self.count = count
+        self.base_port = base_port
+        self.drain_timeout = drain_timeout
+        self.retries = retries
+        self.secret = secrets.token_urlsafe(24)
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: Dict[int, multiprocessing.Process] = {}
+        self._session: Optional[ClientSession] = None
+        self._monitor: Optional[asyncio.Task] = None
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=self.target, args=(index, self.base_port + index, self.secret), name=f"bot-worker-{index}"
+        )
+        process.start()
+        self._processes[index] = process
+        logger.info(f"Запущен обработчик {index} (pid {process.pid}, порт {self.base_port + index})")
+
+    def alive(self) -> int:
+        return sum(process.is_alive() for process in self._processes.values())
+
+    def url(self, index: int) -> str:
+        return f"http://{WORKER_HOST}:{self.base_port + index}"
+
+    async def _wait_ready(self, index: int, timeout: float = 60.0):
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            try:
+                async with self._session.get(self.url(index) + "/healthz") as response:
+                    if response.status == 200:
+                        return
+            except ClientError:
+                pass
+            if asyncio.get_running_loop().time() > deadline:
+                raise RuntimeError(f"Обработчик {index} не поднялся за {timeout:.0f}с")
+            await asyncio.sleep(0.2)
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(1.0)
+            for index, process in list(self._processes.items()):
+                # Код 0 — штатная остановка (например, Ctrl+C), не перезапускаем
+                if not process.is_alive() and process.exitcode != 0:
+                    logger.error("Обработчик %s завершился с кодом %s, перезапускаем", index, process.exitcode)
+                    self._spawn(index)
+
+    async def start(self):
+        self._session = ClientSession(timeout=ClientTimeout(total=10))
+        for index in range(self.count):
+            self._spawn(index)
+        await asyncio.gather(*(self._wait_ready(index) for index in range(self.count)))
+        self._monitor = asyncio.create_task(self._watch())
+
+    async def forward(self, update: dict, body: Optional[bytes] = None) -> bool:
+        """Передает апдейт процессу его чата; повторяет, пока процесс перезапускается"""
+        index = routing_key(update) % self.count
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self.secret, "Content-Type": "application/json"}
+        for attempt in range(self.retries):
+            try:
+                async with self._session.post(
+                    self.url(index) + WORKER_PATH, data=body, json=None if body else update, headers=headers,
+                ) as response:
+                    if response.status == 200:
+                        return True
+                    logger.warning("Обработчик %s ответил %s", index, response.status)
+            except ClientError as e:
+                logger.warning("Обработчик %s недоступен: %s", index, e)
+            await asyncio.sleep(0.2 * 2 ** attempt)
+        logger.error("Апдейт %s не доставлен обработчику %s", update.get("update_id"), index)
+        return False
+
+    async def stop(self):
+        if self._monitor is not None:
+            self._monitor.cancel()
+            try:
+                await self._monitor
+            except asyncio.CancelledError:
+                pass
+        # SIGTERM: обработчики дорабатывают принятые апдейты (см. webhook.run_webhook)
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = self.drain_timeout + 5
+        for index, process in self._processes.items():
+            await asyncio.to_thread(process.join, deadline)
+            if process.is_alive():
+                logger.warning("Обработчик %s не остановился, завершаем принудительно", index)
+                process.kill()
+                await asyncio.to_thread(process.join)
+        if self._session is not None:
+            await self._session.close()
+
+
+async def _poll(bot: Bot, workers: WorkerPool, allowed_updates: List[str], stop: asyncio.Event):
+    offset = None
+    while not stop.is_set():
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=25, allowed_updates=allowed_updates)
+        except Exception as e:
+            logger.error("Ошибка getUpdates: %s", e)
+            await asyncio.sleep(1.0)
+            continue
+        if not updates:
+            continue
+        # Внутри одного процесса-обработчика порядок апдейтов сохраняется
+        groups: Dict[int, list] = {}
+        for update in updates:
+            data = update.model_dump(mode="json", by_alias=True, exclude_none=True)
+            groups.setdefault(routing_key(data) % workers.count, []).append(data)
+
+        async def deliver(batch):
+            for data in batch:
+                await workers.forward(data)
+
+        await asyncio.gather(*(deliver(batch) for batch in groups.values()))
+        offset = updates[-1].update_id + 1
+
+
+def _webhook_app(config: Config, workers: WorkerPool) -> web.Application:
+    async def handle(request: web.Request) -> web.Response:
+        if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != config.webhook_secret:
+            return web.Response(status=401, text="Unauthorized")
+        body = await request.read()
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400, text="bad json")
+        # 503 — Telegram повторит доставку позже
+        delivered = await workers.forward(update, body)
+        return web.Response(status=200 if delivered else 503)
+
+    async def health(request: web.Request) -> web.Response:
+        alive = workers.alive()
+        return web.json_response({"status": "ok", "workers": alive}, status=200 if alive else 503)
+
+    app = web.Application()
+    app.router.add_post(config.webhook_path, handle)
+    app.router.add_get("/healthz", health)
+    return app
+
+
+async def run_cluster(config: Config, bot: Bot, worker_target: Callable[[int, int, str], None],
+                      allowed_updates: List[str]):
+    """
+    Фронт кластерного режима: получает апдейты (polling или вебхук)
+    и раскладывает их по процессам-обработчикам по ID чата.
+    """
+    workers = WorkerPool(worker_target, config.workers, config.worker_base_port,
+                         drain_timeout=config.webhook_drain_timeout)
+    await workers.start()
+    logger.info(f"🧩 Кластер: {config.workers} обработчиков, режим {config.bot_mode}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    runner = None
+    try:
+        if config.bot_mode == "webhook":
+            runner = web.AppRunner(_webhook_app(config, workers), handle_signals=False)
+            await runner.setup()
+            await web.TCPSite(runner, config.webhook_host, config.webhook_port).start()
+            if config.webhook_url:
+                await bot.set_webhook(
+                    url=config.webhook_url.rstrip("/") + config.webhook_path,
+                    secret_token=config.webhook_secret,
+                    allowed_updates=allowed_updates,
+                )
+            await stop.wait()
+        else:
+            poller = asyncio.create_task(_poll(bot, workers, allowed_updates, stop))
+            await stop.wait()
+            poller.cancel()
+            try:
+                await poller
+            except asyncio.CancelledError:
+                pass
+    finally:
+        logger.info("🛑 Останавливаем кластер")
+        if runner is not None:
+            await runner.cleanup()
+        await workers.stop()
+        await bot.session.close()
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+
+class ChatBurst:
+    """Сообщения чата, на которые обработчик отвечает одним ответом"""
+
+    def __init__(self, messages: List[Message]):
+        self.messages = messages
+        self.committed = False
+
+    @property
+    def text(self) -> Optional[str]:
+        texts = [message.text for message in self.messages if message.text]
+        return "\n".join(texts) if texts else None
+
+    def commit(self):
+        """Ответ начал отправляться: новые сообщения его больше не отменяют"""
+        self.committed = True
+
+
+class _ChatState:
+    __slots__ = ("pending", "seq", "task", "burst", "lock")
+
+    def __init__(self):
+        self.pending: List[Message] = []
+        self.seq = 0
+        self.task: Optional[asyncio.Task] = None
+        self.burst: Optional[ChatBurst] = None
+        self.lock = asyncio.Lock()
+
+
+class CoalescingMiddleware(BaseMiddleware):
+    """
+    Склейка сообщений одного чата для обработчиков с флагом coalesce.
+
+    Сообщения, пришедшие с паузой меньше window секунд, обрабатываются
+    одним вызовом (в data["burst"] — ChatBurst со всеми сообщениями).
+    Ответы в чате идут строго по очереди. Если пришло новое сообщение,
+    а ответ на предыдущие еще генерируется (burst.commit() не вызван),
+    генерация отменяется и старые сообщения войдут в новый ответ.
+    max_concurrency ограничивает число одновременных ответов во всех чатах.
+    """
+
+    def __init__(self, window: float = 0.7, max_concurrency: int = 8, max_burst: int = 10):
+        self.window = window
+        self.max_burst = max_burst
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self._chats: Dict[int, _ChatState] = {}
+
+    async def __call__(self, handler, event, data):
+        if not get_flag(data, "coalesce") or not isinstance(event, Message):
+            return await handler(event, data)
+
+        chat_id = event.chat.id
+        state = self._chats.get(chat_id)
+        if state is None:
+            state = self._chats[chat_id] = _ChatState()
+        state.pending.append(event)
+        state.seq += 1
+        seq = state.seq
+
+        # Ответ на прошлые сообщения еще не начал отправляться — он устарел
+        if state.task is not None and state.burst is not None and not state.burst.committed:
+            state.task.cancel()
+
+        # Пока сообщения продолжают приходить, ждем паузы (но не копим бесконечно)
+        if self.window > 0 and len(state.pending) < self.max_burst:
+            await asyncio.sleep(self.window)
+        if seq != state.seq:
+            # Пришло сообщение новее: отвечать будет его вызов
+            return None
+
+        try:
+            async with state.lock:
+                if seq != state.seq or not state.pending:
+                    return None
+                burst = ChatBurst(list(state.pending))
+                data["burst"] = burst
+                async with self._semaphore:
+                    if seq != state.seq:
+                        return None
+                    task = asyncio.ensure_future(handler(burst.messages[-1], data))
+                    state.task, state.burst = task, burst
+                    superseded = False
+                    try:
+                        return await task
+                    except asyncio.CancelledError:
+                        if task.cancelled() and seq != state.seq:
+                            superseded = True
+                            logger.info("Ответ в чате %s отменен: пришли новые сообщения", chat_id)
+                            return None
+                        raise
+                    finally:
+                        state.task = state.burst = None
+                        # Отвеченные сообщения убираем, пришедшие во время ответа остаются;
+                        # сообщения отмененного ответа войдут в следующий
+                        if not superseded:
+                            del state.pending[:len(burst.messages)]
+        finally:
+            if not state.pending and not state.lock.locked():
+                self._chats.pop(chat_id, None)
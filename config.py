@@ -0,0 +1,294 @@
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import FrozenSet, List, Mapping, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+START_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class ConfigError(ValueError):
+    """Ошибки конфигурации; в сообщении перечислены все проблемные переменные"""
+
+    def __init__(self, errors: List[str]):
+        super().__init__("Неверная конфигурация:\n  " + "\n  ".join(errors))
+        self.errors = errors
+
+
+@dataclass(frozen=True)
+class Config:
+    """Настройки бота; собираются из окружения один раз при старте"""
+
+    bot_token: str
+    girlfriend_id: int
+    owner_id: int
+    mini_app_url: str = ""
+    groq_api_key: Optional[str] = None
+    relationship_start: Optional[datetime] = None
+
+    reminder_recipients: FrozenSet[int] = field(default_factory=frozenset)
+    reminder_timezone: Optional[str] = None
+    reminder_max_concurrency: int = 20
+    reminder_rate_limit: float = 25.0
+    reminder_adaptive: bool = True
+    activity_prior: float = 2.0
+    activity_half_life_days: float = 28.0
+    outbox_max_age_hours: float = 3.0
+
+    llm_max_concurrency: int = 8
+    llm_timeout: float = 20.0
+    llm_chat_timeout: float = 8.0
+    llm_base_url: Optional[str] = None
+    llm_models: Tuple[str, ...] = ("llama-3.3-70b-versatile", "llama-3.1-8b-instant")
+    llm_fallback_base_url: Optional[str] = None
+    llm_fallback_api_key: Optional[str] = None
+    llm_fallback_models: Tuple[str, ...] = ()
+    llm_hedge_quantile: float = 0.95
+    llm_hedge_delay: float = 2.0
+    llm_breaker_failures: int = 5
+    llm_breaker_cooldown: float = 30.0
+    llm_batch_size: int = 10
+    telegram_api_url: Optional[str] = None
+
+    db_path: str = "valentine.db"
+    storage_backend: str = "sqlite"
+    pool_size: int = 3
+    pool_ttl_hours: float = 48.0
+    dedup_capacity: int = 1000
+    dedup_max_distance: int = 12
+
+    chat_history_turns: int = 12
+    chat_history_tokens: int = 600
+    chat_input_tokens: int = 400
+    chat_history_max_chats: int = 1000
+    chat_streaming: bool = False
+    stream_edit_interval: float = 1.0
+    chat_cache_size: int = 500
+    chat_cache_ttl_hours: float = 24.0
+    chat_cache_variants: int = 3
+    chat_cache_similarity: float = 0.75
+    chat_debounce: float = 0.7
+    chat_max_concurrency: int = 8
+
+    send_global_rate: float = 30.0
+    send_chat_rate: float = 1.0
+    send_max_retries: int = 5
+
+    bot_mode: str = "polling"
+    webhook_url: Optional[str] = None
+    webhook_path: str = "/webhook"
+    webhook_secret: Optional[str] = None
+    webhook_host: str = "0.0.0.0"
+    webhook_port: int = 8080
+    webhook_drain_timeout: float = 30.0
+    metrics_port: int = 0
+    miniapp_api_port: int = 0
+    miniapp_init_data_ttl: float = 86400.0
+
+    workers: int = 1
+    worker_base_port: int = 8100
+    fsm_storage: str = "memory"
+    lease_ttl: float = 15.0
+
+    log_format: str = "text"
+    log_level: str = "INFO"
+    log_sample_rate: float = 0.1
+    log_slow_ms: float = 1000.0
+
+    def __post_init__(self):
+        # Ира всегда получает напоминания
+        object.__setattr__(self, "reminder_recipients",
+                           frozenset(self.reminder_recipients) | {self.girlfriend_id})
+
+    @property
+    def data_path(self) -> str:
+        """База SQLite для всех хранилищ бота; при STORAGE_BACKEND=memory — память процесса"""
+        return ":memory:" if self.storage_backend == "memory" else self.db_path
+
+    @classmethod
+    def from_env(cls, env: Mapping[str, str] = os.environ) -> "Config":
+        """Читает и проверяет переменные окружения; все ошибки сообщаются разом"""
+        errors: List[str] = []
+
+        def get(name: str) -> Optional[str]:
+            value = env.get(name)
+            return value.strip() if value and value.strip() else None
+
+        def required(name: str) -> Optional[str]:
+            value = get(name)
+            if value is None:
+                errors.append(f"{name}: переменная обязательна")
+            return value
+
+        def number(name: str, kind, default, minimum=None):
+            raw = get(name)
+            if raw is None:
+                return default
+            try:
+                value = kind(raw)
+            except ValueError:
+                errors.append(f"{name}: ожидается число, получено {raw!r}")
+                return default
+            if minimum is not None and value < minimum:
+                errors.append(f"{name}: значение должно быть не меньше {minimum}")
+            return value
+
+        def items(name: str) -> Optional[Tuple[str, ...]]:
+            raw = get(name)
+            if raw is None:
+                return None
+            return tuple(item.strip() for item in raw.split(",") if item.strip())
+
+        def flag(name: str, default: bool = False) -> bool:
+            raw = get(name)
+            return default if raw is None else raw.lower() in ("1", "true", "yes")
+
+        bot_token = required("BOT_TOKEN")
+        if bot_token is not None and ":" not in bot_token:
+            errors.append("BOT_TOKEN: ожидается токен вида 123456:ABC...")
+        girlfriend_id = required("GIRLFRIEND_ID") and number("GIRLFRIEND_ID", int, 0)
+        owner_id = required("OWNER_ID") and number("OWNER_ID", int, 0)
+
+        relationship_start = None
+        raw_start = get("RELATIONSHIP_START_DATE")
+        if raw_start is not None:
+            try:
+                relationship_start = datetime.strptime(raw_start, START_DATE_FORMAT)
+            except ValueError:
+                errors.append(f"RELATIONSHIP_START_DATE: ожидается формат 'ГГГГ-ММ-ДД ЧЧ:ММ:СС', получено {raw_start!r}")
+
+        recipients = set()
+        for item in (get("REMINDER_RECIPIENTS") or "").split(","):
+            if item.strip():
+                try:
+                    recipients.add(int(item))
+                except ValueError:
+                    errors.append(f"REMINDER_RECIPIENTS: {item.strip()!r} не является ID")
+
+        timezone = get("REMINDER_TIMEZONE")
+        if timezone is not None:
+            try:
+                ZoneInfo(timezone)
+            except (ZoneInfoNotFoundError, ValueError):
+                errors.append(f"REMINDER_TIMEZONE: неизвестный часовой пояс {timezone!r}")
+
+        bot_mode = (get("BOT_MODE") or "polling").lower()
+        if bot_mode not in ("polling", "webhook"):
+            errors.append(f"BOT_MODE: ожидается polling или webhook, получено {bot_mode!r}")
+        webhook_secret = get("WEBHOOK_SECRET")
+        if bot_mode == "webhook" and webhook_secret is None:
+            # Без секрета любой, кто знает адрес, может прислать поддельный апдейт
+            errors.append("WEBHOOK_SECRET обязателен при BOT_MODE=webhook")
+        elif webhook_secret is not None and not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", webhook_secret):
+            errors.append("WEBHOOK_SECRET: 1–256 символов A-Z, a-z, 0-9, _ и -")
+        storage_backend = (get("STORAGE_BACKEND") or "sqlite").lower()
+        if storage_backend not in ("sqlite", "memory"):
+            errors.append(f"STORAGE_BACKEND: ожидается sqlite или memory, получено {storage_backend!r}")
+
+        workers = number("WORKERS", int, 1, 1)
+        db_path = get("DB_PATH") or "valentine.db"
+        if workers > 1:
+            # Процессы делят состояние только через общий файл базы
+            if storage_backend != "sqlite" or db_path == ":memory:":
+                errors.append("WORKERS > 1 требует STORAGE_BACKEND=sqlite и DB_PATH в файле")
+        fsm_storage = (get("FSM_STORAGE") or ("sqlite" if workers > 1 else "memory")).lower()
+        if fsm_storage not in ("memory", "sqlite"):
+            errors.append(f"FSM_STORAGE: ожидается memory или sqlite, получено {fsm_storage!r}")
+        elif workers > 1 and fsm_storage == "memory":
+            errors.append("FSM_STORAGE=memory не работает при WORKERS > 1")
+
+        log_format = (get("LOG_FORMAT") or "text").lower()
+        if log_format not in ("text", "json"):
+            errors.append(f"LOG_FORMAT: ожидается text или json, получено {log_format!r}")
+        log_level = (get("LOG_LEVEL") or "INFO").upper()
+        if log_level not in ("DEBUG", "INFO", "WARNING", "ERROR"):
+            errors.append(f"LOG_LEVEL: ожидается DEBUG, INFO, WARNING или ERROR, получено {log_level!r}")
+        log_sample_rate = number("LOG_SAMPLE_RATE", float, 0.1, 0)
+        if log_sample_rate > 1:
+            errors.append("LOG_SAMPLE_RATE: ожидается доля от 0 до 1")
+
+        hedge_quantile = number("LLM_HEDGE_QUANTILE", float, 0.95, 0)
+        if not hedge_quantile < 1:
+            errors.append("LLM_HEDGE_QUANTILE: ожидается доля меньше 1, например 0.95")
+
+        config = dict(
+            bot_token=bot_token or "",
+            girlfriend_id=girlfriend_id or 0,
+            owner_id=owner_id or 0,
+            mini_app_url=get("MINI_APP_URL") or "",
+            groq_api_key=get("GROQ_API_KEY"),
+            relationship_start=relationship_start,
+            reminder_recipients=frozenset(recipients),
+            reminder_timezone=timezone,
+            reminder_max_concurrency=number("REMINDER_MAX_CONCURRENCY", int, 20, 1),
+            reminder_rate_limit=number("REMINDER_RATE_LIMIT", float, 25.0, 0.1),
+            reminder_adaptive=flag("REMINDER_ADAPTIVE", True),
+            activity_prior=number("ACTIVITY_PRIOR", float, 2.0, 0.01),
+            activity_half_life_days=number("ACTIVITY_HALF_LIFE_DAYS", float, 28.0, 1),
+            outbox_max_age_hours=number("OUTBOX_MAX_AGE_HOURS", float, 3.0, 0),
+            llm_max_concurrency=number("LLM_MAX_CONCURRENCY", int, 8, 1),
+            llm_timeout=number("LLM_TIMEOUT", float, 20.0, 0.1),
+            llm_chat_timeout=number("LLM_CHAT_TIMEOUT", float, 8.0, 0.1),
+            llm_base_url=get("LLM_BASE_URL"),
+            llm_models=items("LLM_MODELS") or ("llama-3.3-70b-versatile", "llama-3.1-8b-instant"),
+            llm_fallback_base_url=get("LLM_FALLBACK_BASE_URL"),
+            llm_fallback_api_key=get("LLM_FALLBACK_API_KEY"),
+            llm_fallback_models=items("LLM_FALLBACK_MODELS") or (),
+            llm_hedge_quantile=hedge_quantile,
+            llm_hedge_delay=number("LLM_HEDGE_DELAY", float, 2.0, 0),
+            llm_breaker_failures=number("LLM_BREAKER_FAILURES", int, 5, 1),
+            llm_breaker_cooldown=number("LLM_BREAKER_COOLDOWN", float, 30.0, 0),
+            llm_batch_size=number("LLM_BATCH_SIZE", int, 10, 1),
+            telegram_api_url=get("TELEGRAM_API_URL"),
+            db_path=db_path,
+            storage_backend=storage_backend,
+            pool_size=number("POOL_SIZE", int, 3, 0),
+            pool_ttl_hours=number("POOL_TTL_HOURS", float, 48.0, 0),
+            dedup_capacity=number("DEDUP_CAPACITY", int, 1000, 1),
+            dedup_max_distance=number("DEDUP_MAX_DISTANCE", int, 12, 0),
+            chat_history_turns=number("CHAT_HISTORY_TURNS", int, 12, 1),
+            chat_history_tokens=number("CHAT_HISTORY_TOKENS", int, 600, 0),
+            chat_input_tokens=number("CHAT_INPUT_TOKENS", int, 400, 20),
+            chat_history_max_chats=number("CHAT_HISTORY_MAX_CHATS", int, 1000, 1),
+            chat_streaming=flag("CHAT_STREAMING"),
+            stream_edit_interval=number("STREAM_EDIT_INTERVAL", float, 1.0, 0),
+            chat_cache_size=number("CHAT_CACHE_SIZE", int, 500, 0),
+            chat_cache_ttl_hours=number("CHAT_CACHE_TTL_HOURS", float, 24.0, 0),
+            chat_cache_variants=number("CHAT_CACHE_VARIANTS", int, 3, 1),
+            chat_cache_similarity=number("CHAT_CACHE_SIMILARITY", float, 0.75, 0),
+            chat_debounce=number("CHAT_DEBOUNCE", float, 0.7, 0),
+            chat_max_concurrency=number("CHAT_MAX_CONCURRENCY", int, 8, 1),
+            send_global_rate=number("SEND_GLOBAL_RATE", float, 30.0, 0.1),
+            send_chat_rate=number("SEND_CHAT_RATE", float, 1.0, 0.01),
+            send_max_retries=number("SEND_MAX_RETRIES", int, 5, 0),
+            bot_mode=bot_mode,
+            webhook_url=get("WEBHOOK_URL"),
+            webhook_path=get("WEBHOOK_PATH") or "/webhook",
+            webhook_secret=webhook_secret,
+            webhook_host=get("WEBHOOK_HOST") or "0.0.0.0",
+            webhook_port=number("PORT", int, 8080, 1),
+            webhook_drain_timeout=number("WEBHOOK_DRAIN_TIMEOUT", float, 30.0, 0),
+            metrics_port=number("METRICS_PORT", int, 0, 0),
+            miniapp_api_port=number("MINI_APP_API_PORT", int, 0, 0),
+            miniapp_init_data_ttl=number("MINI_APP_INIT_DATA_TTL", float, 86400.0, 0),
+            workers=workers,
+            worker_base_port=number("WORKER_BASE_PORT", int, 8100, 1),
+            fsm_storage=fsm_storage,
+            lease_ttl=number("LEASE_TTL", float, 15.0, 1),
+            log_format=log_format,
+            log_level=log_level,
+            log_sample_rate=log_sample_rate,
+            log_slow_ms=number("LOG_SLOW_MS", float, 1000.0, 0),
+        )
+        if errors:
+            raise ConfigError(errors)
+        return cls(**config)
+
+
+def load_config() -> Config:
+    """Подхватывает .env (если есть) и собирает конфиг из окружения"""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return Config.from_env()
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from storage import open_sqlite
+
+logger = logging.getLogger(__name__)
+
+
+class Lease:
+    """
+    Аренда с истечением в общем файле SQLite.
+
+    В каждый момент у имени не больше одного владельца; владелец должен
+    продлевать аренду чаще ttl, иначе ее может забрать другой процесс.
+    """
+
+    def __init__(self, path: str, name: str, owner: str, ttl: float = 15.0):
+        self.path = path
+        self.name = name
+        self.owner = owner
+        self.ttl = ttl
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = open_sqlite(self.path)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _try_acquire(self) -> bool:
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            # Одна атомарная операция: захват свободной/просроченной аренды или продление своей
+            conn.execute(
+                """
+                INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+                """,
+                (self.name, self.owner, now + self.ttl, now),
+            )
+            conn.commit()
+            row = conn.execute("SELECT owner FROM leases WHERE name = ?", (self.name,)).fetchone()
+            return row is not None and row[0] == self.owner
+
+    def _release(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (self.name, self.owner))
+            conn.commit()
+            conn.close()
+            self._conn = None
+
+    async def acquire(self) -> bool:
+        """Захватывает или продлевает аренду; False — она у другого процесса"""
+        return await asyncio.to_thread(self._try_acquire)
+
+    async def release(self):
+        await asyncio.to_thread(self._release)
+
+
+class LeaderElection:
+    """
+    Выбор лидера через Lease: пока аренда наша, работает on_elected-часть
+    (например, планировщик напоминаний), при потере — вызывается on_lost.
+    """
+
+    def __init__(self, lease: Lease,
+                 on_elected: Callable[[], Awaitable],
+                 on_lost: Callable[[], Awaitable],
+                 renew_interval: Optional[float] = None):
+        self.lease = lease
+        self.on_elected = on_elected
+        self.on_lost = on_lost
+        self.renew_interval = renew_interval or lease.ttl / 3
+        self.is_leader = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def _step(self):
+        try:
+            acquired = await self.lease.acquire()
+        except Exception as e:
+            # Не можем продлить — считаем, что аренду скоро заберут
+            logger.error("Ошибка продления аренды %s: %s", self.lease.name, e)
+            acquired = False
+        if acquired and not self.is_leader:
+            self.is_leader = True
+            logger.info("👑 %s стал лидером (%s)", self.lease.owner, self.lease.name)
+            await self.on_elected()
+        elif not acquired and self.is_leader:
+            self.is_leader = False
+            logger.warning("%s потерял лидерство (%s)", self.lease.owner, self.lease.name)
+            await self.on_lost()
+
+    async def _run(self):
+        while True:
+            await self._step()
+            await asyncio.sleep(self.renew_interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.is_leader:
+            self.is_leader = False
+            await self.on_lost()
+            # Освобождаем сразу, чтобы другой процесс не ждал истечения ttl
+            await self.lease.release()
+
+
+class ReminderClaims:
+    """
+    Отметки об отправке напоминаний: пару (получатель, тип, день) может
+    забрать только один процесс, даже если лидеров на миг оказалось двое.
+    """
+
+    def __init__(self, path: str, keep_days: int = 7):
+        self.path = path
+        self.keep_days = keep_days
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._cleaned_at = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = open_sqlite(self.path)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS reminder_claims (
+                    user_id INTEGER NOT NULL,
+                    type TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    claimed_at REAL NOT NULL,
+                    PRIMARY KEY (user_id, type, day)
+                )
+                """
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _claim(self, reminder_type: str, entries: List[Tuple[int, str]]) -> Set[int]:
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            claimed = set()
+            with conn:
+                for user_id, day in entries:
+                    cursor = conn.execute(
+                        "INSERT OR IGNORE INTO reminder_claims (user_id, type, day, claimed_at) VALUES (?, ?, ?, ?)",
+                        (user_id, reminder_type, day, now),
+                    )
+                    if cursor.rowcount:
+                        claimed.add(user_id)
+                if now - self._cleaned_at > 3600:
+                    conn.execute("DELETE FROM reminder_claims WHERE claimed_at < ?", (now - self.keep_days * 86400,))
+                    self._cleaned_at = now
+            return claimed
+
+    async def claim(self, reminder_type: str, entries: List[Tuple[int, str]]) -> Set[int]:
+        """Забирает напоминания (user_id, день); возвращает ID, которые достались нам"""
+        return await asyncio.to_thread(self._claim, reminder_type, entries)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,226 @@
+import asyncio
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from storage import open_sqlite
+
+logger = logging.getLogger(__name__)
+
+BITS = 64
+_WORD = re.compile(r"\w+")
+
+# 64 счетчика SimHash упакованы в одно большое число по 16 бит на счетчик:
+# _SPREAD[k][b] раскладывает биты байта b хеша (k-го по счету) по счетчикам,
+# так что признак учитывается восемью сложениями вместо цикла по 64 битам.
+_LANE = 16
+_SPREAD = [
+    [sum(1 << ((8 * k + j) * _LANE) for j in range(8) if byte >> j & 1) for byte in range(256)]
+    for k in range(8)
+]
+
+
+def _features(text: str) -> List[str]:
+    """Признаки текста: «основы» слов (первые 5 букв) и пары соседних слов"""
+    words = [word[:5] for word in _WORD.findall(text.lower().replace("ё", "е"))]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def simhash(text: str) -> int:
+    """
+    64-битный SimHash: у похожих текстов отпечатки отличаются в немногих
+    битах (расстояние Хэмминга), у разных — примерно в половине.
+    """
+    features = _features(text)
+    packed = 0
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        for k, byte in enumerate(digest):
+            packed += _SPREAD[k][byte]
+    # Бит отпечатка равен 1, если он стоял у большинства признаков
+    mask = (1 << _LANE) - 1
+    fingerprint = 0
+    for bit in range(BITS):
+        if 2 * (packed >> (bit * _LANE) & mask) > len(features):
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+if hasattr(int, "bit_count"):
+    def hamming(a: int, b: int) -> int:
+        return (a ^ b).bit_count()
+else:
+    def hamming(a: int, b: int) -> int:
+        return bin(a ^ b).count("1")
+
+
+def _to_signed(value: int) -> int:
+    # SQLite хранит знаковые 64-битные числа
+    return value - (1 << BITS) if value >= 1 << (BITS - 1) else value
+
+
+class FingerprintIndex:
+    """
+    Отпечатки текстов, уже отправленных каждому получателю.
+
+    На получателя — кольцевой буфер array('Q') из capacity отпечатков
+    (8 байт каждый): память ограничена, самые старые тексты забываются.
+    Проверка — линейный проход по буферу, для тысячи отпечатков это
+    доли миллисекунды. Новые отпечатки дописываются в SQLite пачками
+    в фоне; refresh() подтягивает записанные другими процессами.
+    """
+
+    def __init__(self, path: str, capacity: int = 1000, max_distance: int = 12,
+                 flush_interval: float = 5.0, refresh_interval: Optional[float] = None):
+        self.path = path
+        self.capacity = max(1, capacity)
+        self.max_distance = max_distance
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+        # user_id -> (буфер, позиция следующей записи после заполнения)
+        self._rings: Dict[int, Tuple[array, List[int]]] = {}
+        self._pending: List[Tuple[int, int]] = []
+        self._last_id = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------- SQLite (выполняется в отдельном потоке) ----------
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = open_sqlite(self.path)
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS sent_fingerprints (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    fingerprint INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS sent_fingerprints_user ON sent_fingerprints (user_id, id);
+                """
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _load_rows(self, after_id: int) -> list:
+        with self._db_lock:
+            return self._connect().execute(
+                "SELECT id, user_id, fingerprint FROM sent_fingerprints WHERE id > ? ORDER BY id",
+                (after_id,),
+            ).fetchall()
+
+    def _save(self, rows: List[Tuple[int, int]]):
+        with self._db_lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO sent_fingerprints (user_id, fingerprint) VALUES (?, ?)",
+                    [(user_id, _to_signed(fingerprint)) for user_id, fingerprint in rows],
+                )
+                # На диске тоже не больше capacity отпечатков на получателя
+                for user_id in {user_id for user_id, _ in rows}:
+                    conn.execute(
+                        "DELETE FROM sent_fingerprints WHERE user_id = ? AND id <= ("
+                        "SELECT id FROM sent_fingerprints WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                        (user_id, user_id, self.capacity),
+                    )
+
+    def _close(self):
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _apply_rows(self, rows: list):
+        for row_id, user_id, fingerprint in rows:
+            self._last_id = max(self._last_id, row_id)
+            fingerprint &= (1 << BITS) - 1
+            ring = self._rings.get(user_id)
+            # Свои же записи возвращаются при refresh(): повторно не добавляем
+            if ring is None or fingerprint not in ring[0]:
+                self._append(user_id, fingerprint)
+
+    # ---------- Кольцевой буфер ----------
+
+    def _append(self, user_id: int, fingerprint: int):
+        ring = self._rings.get(user_id)
+        if ring is None:
+            ring = self._rings[user_id] = (array("Q"), [0])
+        values, head = ring
+        if len(values) < self.capacity:
+            values.append(fingerprint)
+        else:
+            values[head[0]] = fingerprint
+            head[0] = (head[0] + 1) % self.capacity
+
+    # ---------- Публичный API ----------
+
+    def nearest(self, user_id: int, text: str) -> Optional[int]:
+        """Расстояние до самого похожего отправленного текста (None — не отправляли ничего)"""
+        ring = self._rings.get(user_id)
+        if not ring or not ring[0]:
+            return None
+        fingerprint = simhash(text)
+        return min(hamming(fingerprint, value) for value in ring[0])
+
+    def is_duplicate(self, user_id: int, text: str) -> bool:
+        """Почти повторяет ли текст что-то, уже отправленное получателю"""
+        distance = self.nearest(user_id, text)
+        return distance is not None and distance <= self.max_distance
+
+    def add(self, user_id: int, text: str):
+        """Запоминает отправленный текст"""
+        fingerprint = simhash(text)
+        self._append(user_id, fingerprint)
+        self._pending.append((user_id, fingerprint))
+
+    def __len__(self) -> int:
+        return len(self._rings)
+
+    async def load(self):
+        self._apply_rows(await asyncio.to_thread(self._load_rows, 0))
+        logger.info(f"Загружены отпечатки отправленных текстов для {len(self._rings)} получателей")
+
+    async def refresh(self):
+        """Подтягивает отпечатки, записанные другими процессами"""
+        self._apply_rows(await asyncio.to_thread(self._load_rows, self._last_id))
+
+    async def flush(self):
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        try:
+            await asyncio.to_thread(self._save, rows)
+        except Exception as e:
+            logger.error("Ошибка записи отпечатков: %s", e)
+            self._pending = rows + self._pending
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.shield(self.flush())
+            if self.refresh_interval is not None:
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    logger.error("Ошибка чтения отпечатков: %s", e)
+
+    async def start(self):
+        await self.load()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        await asyncio.to_thread(self._close)
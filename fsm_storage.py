@@ -0,0 +1,83 @@
+import asyncio
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from storage import open_sqlite
+
+
+class SQLiteFSMStorage(BaseStorage):
+    """
+    FSM-хранилище aiogram в файле SQLite.
+
+    В отличие от MemoryStorage, состояние видно всем процессам, которые
+    работают с одной базой (кластерный режим).
+    """
+
+    def __init__(self, path: str, key_builder: Optional[KeyBuilder] = None):
+        self.path = path
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = open_sqlite(self.path)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS fsm_state (
+                    key TEXT PRIMARY KEY,
+                    state TEXT,
+                    data TEXT NOT NULL DEFAULT '{}'
+                )
+                """
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple, fetch: bool = False):
+        with self._lock:
+            conn = self._connect()
+            if fetch:
+                return conn.execute(sql, params).fetchone()
+            conn.execute(sql, params)
+            conn.commit()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT INTO fsm_state (key, state) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET state = excluded.state",
+            (self.key_builder.build(key), value),
+        )
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = await asyncio.to_thread(
+            self._execute, "SELECT state FROM fsm_state WHERE key = ?", (self.key_builder.build(key),), True
+        )
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT INTO fsm_state (key, data) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET data = excluded.data",
+            (self.key_builder.build(key), json.dumps(dict(data), ensure_ascii=False)),
+        )
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await asyncio.to_thread(
+            self._execute, "SELECT data FROM fsm_state WHERE key = ?", (self.key_builder.build(key),), True
+        )
+        return json.loads(row[0]) if row else {}
+
+    async def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
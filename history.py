@@ -0,0 +1,206 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from prompts import estimate_tokens
+from storage import open_sqlite
+
+logger = logging.getLogger(__name__)
+
+
+class ChatHistory:
+    """История одного чата: кольцевой буфер последних реплик и резюме более старых"""
+
+    __slots__ = ("turns", "summary", "pending", "summarizing")
+
+    def __init__(self, max_turns: int, summary: str = ""):
+        self.turns = deque(maxlen=max_turns)
+        self.summary = summary
+        # Реплики, вытесненные из буфера, но еще не вошедшие в резюме
+        self.pending: List[Tuple[str, str]] = []
+        self.summarizing = False
+
+    def add(self, role: str, text: str):
+        if len(self.turns) == self.turns.maxlen:
+            self.pending.append(self.turns[0])
+        self.turns.append((role, text))
+
+    def context(self, token_budget: int) -> List[dict]:
+        """Сообщения для промпта: резюме и самые свежие реплики в пределах бюджета"""
+        messages = []
+        used = 0
+        if self.summary:
+            used = estimate_tokens(self.summary)
+        for role, text in reversed(self.turns):
+            cost = estimate_tokens(text)
+            if used + cost > token_budget:
+                break
+            used += cost
+            messages.append({"role": role, "content": text})
+        messages.reverse()
+        if self.summary:
+            messages.insert(0, {
+                "role": "system",
+                "content": f"Краткое содержание прошлого разговора: {self.summary}",
+            })
+        return messages
+
+
+class HistoryStore:
+    """
+    Хранилище истории чатов.
+
+    В памяти держит не больше max_chats историй (LRU), остальные лежат в SQLite
+    и подгружаются при обращении. Изменения сбрасываются на диск пачкой в фоне,
+    старые реплики постепенно сворачиваются в резюме через summarizer.
+    """
+
+    def __init__(self, path: str, summarizer: Callable[[str, List[Tuple[str, str]]], Awaitable[str]],
+                 max_turns: int = 12, token_budget: int = 600, max_chats: int = 1000,
+                 summarize_every: int = 4, flush_interval: float = 2.0):
+        self.path = path
+        self.summarizer = summarizer
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.max_chats = max_chats
+        self.summarize_every = summarize_every
+        self.flush_interval = flush_interval
+
+        self._chats: "OrderedDict[int, ChatHistory]" = OrderedDict()
+        self._dirty: Dict[int, ChatHistory] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._background = set()
+
+    # ---------- SQLite ----------
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = open_sqlite(self.path)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chat_history (
+                    chat_id INTEGER PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    turns TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _load(self, chat_id: int) -> ChatHistory:
+        with self._db_lock:
+            row = self._connect().execute(
+                "SELECT summary, turns FROM chat_history WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+        if row is None:
+            return ChatHistory(self.max_turns)
+        summary, turns = row
+        history = ChatHistory(self.max_turns, summary=summary)
+        # Реплики, не успевшие попасть в резюме, снова окажутся в pending
+        for role, text in json.loads(turns):
+            history.add(role, text)
+        return history
+
+    def _save(self, records: List[tuple]):
+        with self._db_lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO chat_history (chat_id, summary, turns, updated_at) VALUES (?, ?, ?, ?)",
+                records,
+            )
+            conn.commit()
+
+    # ---------- Публичный API ----------
+
+    async def get(self, chat_id: int) -> ChatHistory:
+        history = self._chats.get(chat_id)
+        if history is not None:
+            self._chats.move_to_end(chat_id)
+            return history
+        history = self._dirty.get(chat_id)
+        if history is None:
+            history = await asyncio.to_thread(self._load, chat_id)
+            # Пока грузили, история могла появиться из параллельного обработчика
+            history = self._chats.get(chat_id, history)
+        self._chats[chat_id] = history
+        self._chats.move_to_end(chat_id)
+        while len(self._chats) > self.max_chats:
+            # Несохраненные истории остаются в _dirty до ближайшего сброса
+            self._chats.popitem(last=False)
+        return history
+
+    def context(self, history: ChatHistory) -> List[dict]:
+        return history.context(self.token_budget)
+
+    def append(self, chat_id: int, history: ChatHistory, user_text: str, reply: str):
+        """Добавляет обмен репликами; при необходимости запускает сжатие в резюме"""
+        history.add("user", user_text)
+        history.add("assistant", reply)
+        self._dirty[chat_id] = history
+        if len(history.pending) > self.max_turns:
+            # Если резюме долго не получается, старые реплики просто отбрасываются
+            del history.pending[:len(history.pending) - self.max_turns]
+        if len(history.pending) >= self.summarize_every and not history.summarizing:
+            task = asyncio.create_task(self._summarize(chat_id, history))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    async def _summarize(self, chat_id: int, history: ChatHistory):
+        history.summarizing = True
+        batch = list(history.pending)
+        try:
+            history.summary = await self.summarizer(history.summary, batch)
+            del history.pending[:len(batch)]
+            self._dirty[chat_id] = history
+        except Exception as e:
+            logger.error("Ошибка сжатия истории чата %s: %s", chat_id, e)
+        finally:
+            history.summarizing = False
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        now = time.time()
+        records = [
+            (chat_id, history.summary, json.dumps(history.pending + list(history.turns), ensure_ascii=False), now)
+            for chat_id, history in dirty.items()
+        ]
+        try:
+            await asyncio.to_thread(self._save, records)
+        except Exception as e:
+            logger.error("Ошибка записи истории чатов: %s", e)
+            for chat_id, history in dirty.items():
+                self._dirty.setdefault(chat_id, history)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.shield(self.flush())
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        await self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,369 @@
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from metrics import LLM_HEDGES, LLM_ROUTE_DURATION, LLM_ROUTE_REQUESTS, LLMTimer, record_llm_usage
+from prompts import counter as token_counter
+
+if TYPE_CHECKING:
+    import httpx
+    from groq import AsyncGroq
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "llama-3.3-70b-versatile"
+FAST_MODEL = "llama-3.1-8b-instant"
+
+# Сколько удачных ответов маршрута нужно, чтобы доверять его p95
+HEDGE_MIN_SAMPLES = 20
+
+# Настройки по умолчанию (переопределяются через configure())
+_settings = {
+    "api_key": None,
+    "base_url": None,
+    "models": (DEFAULT_MODEL,),
+    "fallback_api_key": None,
+    "fallback_base_url": None,
+    "fallback_models": (),
+    "max_concurrency": 8,
+    "timeout": 20.0,
+    "max_retries": 0,
+    "hedge_quantile": 0.95,
+    "hedge_delay": 2.0,
+    "breaker_failures": 5,
+    "breaker_cooldown": 30.0,
+}
+
+_routes: Optional[List["Route"]] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+class LLMUnavailable(RuntimeError):
+    """Все модели временно отключены предохранителем"""
+
+
+class Provider:
+    """OpenAI/Groq-совместимый API: ключ, адрес и свой пул соединений"""
+
+    def __init__(self, name: str, api_key: Optional[str], base_url: Optional[str] = None,
+                 timeout: float = 20.0, max_retries: int = 0, max_connections: int = 8):
+        self.name = name
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_connections = max_connections
+        self._client: Optional["AsyncGroq"] = None
+        self._http_client: Optional["httpx.AsyncClient"] = None
+
+    def client(self) -> "AsyncGroq":
+        if self._client is None:
+            if not self.api_key:
+                # Проверяем до создания пула, чтобы не плодить соединения на каждом вызове
+                raise RuntimeError(f"{self.name}: API ключ не задан")
+            # SDK импортируется только при первом запросе: это заметная часть времени старта
+            import httpx
+            from groq import AsyncGroq
+
+            limits = httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+            )
+            self._http_client = httpx.AsyncClient(limits=limits, timeout=self.timeout)
+            self._client = AsyncGroq(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                timeout=self.timeout,
+                max_retries=self.max_retries,
+                http_client=self._http_client,
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+        if self._http_client is not None:
+            await self._http_client.aclose()
+        self._client = None
+        self._http_client = None
+
+
+class CircuitBreaker:
+    """
+    Предохранитель: после failures ошибок подряд маршрут пропускается
+    cooldown секунд, затем снова пробуется (первая же ошибка опять его отключает).
+    """
+
+    def __init__(self, failures: int = 5, cooldown: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.clock = clock
+        self.errors = 0
+        self.opened_at: Optional[float] = None
+
+    def allow(self) -> bool:
+        return self.opened_at is None or self.clock() - self.opened_at >= self.cooldown
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self.allow() else "open"
+
+    def success(self):
+        self.errors = 0
+        self.opened_at = None
+
+    def failure(self):
+        self.errors += 1
+        if self.errors >= self.failures:
+            if self.opened_at is None or self.allow():
+                logger.warning("Предохранитель сработал после %s ошибок подряд", self.errors)
+            self.opened_at = self.clock()
+
+
+class Route:
+    """Модель у конкретного провайдера со своим предохранителем"""
+
+    def __init__(self, provider: Provider, model: str, breaker: CircuitBreaker):
+        self.provider = provider
+        self.model = model
+        self.breaker = breaker
+        self.name = f"{provider.name}/{model}"
+
+    def hedge_delay(self, quantile: float, default: float) -> float:
+        """Через сколько ждать подстраховку: p95 удачных ответов этого маршрута"""
+        series = LLM_ROUTE_DURATION.series().get((self.name,))
+        if series is None or series.count < HEDGE_MIN_SAMPLES:
+            return default
+        return max(0.05, LLM_ROUTE_DURATION.quantile(quantile, self.name))
+
+
+def configure(api_key: Optional[str] = None, base_url: Optional[str] = None,
+              max_concurrency: int = 8, timeout: float = 20.0, max_retries: int = 0,
+              models: Sequence[str] = (DEFAULT_MODEL,),
+              fallback_api_key: Optional[str] = None, fallback_base_url: Optional[str] = None,
+              fallback_models: Sequence[str] = (),
+              hedge_quantile: float = 0.95, hedge_delay: float = 2.0,
+              breaker_failures: int = 5, breaker_cooldown: float = 30.0):
+    """
+    Задает провайдеров и модели; клиенты создаются лениво при первом запросе.
+
+    Маршруты пробуются по порядку: сначала models основного провайдера,
+    затем fallback_models запасного (если задан fallback_base_url или
+    fallback_api_key; иначе запасные модели берутся у основного).
+    """
+    global _routes
+    _settings.update(
+        api_key=api_key,
+        base_url=base_url,
+        models=tuple(models) or (DEFAULT_MODEL,),
+        fallback_api_key=fallback_api_key,
+        fallback_base_url=fallback_base_url,
+        fallback_models=tuple(fallback_models),
+        max_concurrency=max(1, max_concurrency),
+        timeout=timeout,
+        max_retries=max_retries,
+        hedge_quantile=hedge_quantile,
+        hedge_delay=hedge_delay,
+        breaker_failures=max(1, breaker_failures),
+        breaker_cooldown=breaker_cooldown,
+    )
+    _routes = None
+
+
+def get_routes() -> List[Route]:
+    """Маршруты (провайдер, модель) в порядке предпочтения"""
+    global _routes
+    if _routes is None:
+        def provider(name: str, api_key: Optional[str], base_url: Optional[str]) -> Provider:
+            return Provider(
+                name, api_key, base_url,
+                timeout=_settings["timeout"],
+                max_retries=_settings["max_retries"],
+                max_connections=_settings["max_concurrency"],
+            )
+
+        def breaker() -> CircuitBreaker:
+            return CircuitBreaker(_settings["breaker_failures"], _settings["breaker_cooldown"])
+
+        main = provider("main", _settings["api_key"], _settings["base_url"])
+        fallback = main
+        if _settings["fallback_base_url"] or _settings["fallback_api_key"]:
+            fallback = provider(
+                "fallback",
+                _settings["fallback_api_key"] or _settings["api_key"],
+                _settings["fallback_base_url"] or _settings["base_url"],
+            )
+        _routes = [Route(main, model, breaker()) for model in _settings["models"]]
+        _routes += [Route(fallback, model, breaker()) for model in _settings["fallback_models"]]
+    return _routes
+
+
+def _available_routes() -> List[Route]:
+    routes = [route for route in get_routes() if route.breaker.allow()]
+    if not routes:
+        raise LLMUnavailable("все модели LLM временно отключены после ошибок")
+    return routes
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(_settings["max_concurrency"])
+    return _semaphore
+
+
+async def _attempt(route: Route, request: Callable[[Route], Awaitable]):
+    """Один запрос к маршруту; результат учитывается предохранителем и метриками"""
+    async with _get_semaphore():
+        started = time.perf_counter()
+        try:
+            result = await request(route)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            route.breaker.failure()
+            LLM_ROUTE_REQUESTS.inc(route.name, "error")
+            raise
+    route.breaker.success()
+    LLM_ROUTE_REQUESTS.inc(route.name, "ok")
+    LLM_ROUTE_DURATION.observe(time.perf_counter() - started, route.name)
+    return result
+
+
+async def _hedged(routes: List[Route], request: Callable[[Route], Awaitable], timeout: float, kind: str):
+    """
+    Запрос с подстраховкой: если первый маршрут не ответил за свой p95,
+    параллельно запускается следующий (обычно более быстрая модель), и
+    берется тот ответ, что пришел раньше. При ошибке сразу пробуется
+    следующий маршрут. Общий срок — timeout.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    remaining = list(routes)
+    pending: Dict[asyncio.Task, Route] = {}
+    last_error: Optional[BaseException] = None
+
+    def launch():
+        route = remaining.pop(0)
+        pending[asyncio.create_task(_attempt(route, request))] = route
+
+    launch()
+    hedge_at = None
+    if remaining:
+        hedge_at = loop.time() + routes[0].hedge_delay(_settings["hedge_quantile"], _settings["hedge_delay"])
+    try:
+        while pending:
+            wake = deadline if hedge_at is None else min(hedge_at, deadline)
+            done, _ = await asyncio.wait(pending, timeout=max(0.0, wake - loop.time()),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                route = pending.pop(task)
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+                logger.warning("LLM %s: %r", route.name, last_error)
+                if remaining:
+                    launch()
+            if done:
+                continue
+            if loop.time() >= deadline:
+                for route in pending.values():
+                    route.breaker.failure()
+                    LLM_ROUTE_REQUESTS.inc(route.name, "timeout")
+                raise asyncio.TimeoutError(f"LLM не ответила за {timeout:.1f}с")
+            if hedge_at is not None and loop.time() >= hedge_at:
+                hedge_at = None
+                if remaining:
+                    LLM_HEDGES.inc(kind)
+                    launch()
+        raise last_error
+    finally:
+        # Проигравшие и просроченные запросы больше не нужны
+        for task in pending:
+            task.cancel()
+
+
+async def complete(messages: list, temperature: float, max_tokens: int,
+                   kind: str = "other", timeout: Optional[float] = None,
+                   prompt_tokens: Optional[int] = None) -> str:
+    """
+    Делает запрос к LLM, не блокируя event loop; kind — тип промпта для метрик.
+
+    timeout — общий срок на вызов с учетом подстраховки и запасных
+    маршрутов (по умолчанию из configure()). prompt_tokens — локальная
+    оценка промпта: по настоящему числу из ответа подстраивается счетчик.
+    """
+    routes = _available_routes()
+
+    def request(route: Route):
+        return route.provider.client().chat.completions.create(
+            messages=messages,
+            model=route.model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+
+    with LLMTimer(kind):
+        response = await _hedged(routes, request, timeout or _settings["timeout"], kind)
+    usage = getattr(response, "usage", None)
+    record_llm_usage(kind, usage)
+    if prompt_tokens is not None and usage is not None:
+        token_counter.observe(prompt_tokens, getattr(usage, "prompt_tokens", 0) or 0)
+    return response.choices[0].message.content
+
+
+async def stream(messages: list, temperature: float, max_tokens: int,
+                 kind: str = "other", timeout: Optional[float] = None) -> AsyncIterator[str]:
+    """
+    Потоковый запрос к LLM: отдает фрагменты текста по мере генерации.
+
+    Поток не подстраховывается (пользователь уже видит текст), но если
+    маршрут не открыл поток за timeout или упал, пробуется следующий.
+    """
+    routes = _available_routes()
+    async with _get_semaphore():
+        with LLMTimer(kind):
+            response = None
+            for route in routes:
+                try:
+                    response = await asyncio.wait_for(
+                        route.provider.client().chat.completions.create(
+                            messages=messages,
+                            model=route.model,
+                            temperature=temperature,
+                            max_tokens=max_tokens,
+                            stream=True,
+                        ),
+                        timeout=timeout or _settings["timeout"],
+                    )
+                except Exception as e:
+                    route.breaker.failure()
+                    LLM_ROUTE_REQUESTS.inc(route.name, "error")
+                    logger.warning("LLM %s: %r", route.name, e)
+                    if route is routes[-1]:
+                        raise
+                    continue
+                route.breaker.success()
+                LLM_ROUTE_REQUESTS.inc(route.name, "ok")
+                break
+            async for chunk in response:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+
+
+def status() -> List[str]:
+    """Состояние маршрутов для /stats"""
+    return [f"{route.name}: {route.breaker.state}" for route in get_routes()]
+
+
+async def close():
+    """Закрывает пулы соединений всех провайдеров"""
+    if _routes is None:
+        return
+    for provider in {id(route.provider): route.provider for route in _routes}.values():
+        await provider.close()
@@ -0,0 +1,156 @@
+import json
+import logging
+import queue
+import random
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import IO, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+TEXT_FORMAT = "%(asctime)s - {prefix}%(name)s - %(levelname)s - %(message)s"
+
+# ID цепочки событий: апдейт, напоминание... Наследуется задачами asyncio,
+# так что вызовы LLM и отправки внутри обработчика получают тот же ID
+correlation_id: ContextVar[Optional[str]] = ContextVar("correlation_id", default=None)
+
+# Библиотеки, которые пишут INFO на каждый апдейт и каждый HTTP-запрос:
+# их записи прореживаются так же, как события
+SAMPLED_LOGGERS = frozenset({"aiogram.event", "httpx"})
+
+# Атрибуты LogRecord; все остальное пришло через extra= и попадет в JSON полями
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "correlation_id", "taskName",
+}
+
+
+def log_event(logger: logging.Logger, event: str, msg: str, *args, level: int = logging.INFO, **fields):
+    """
+    Структурное событие: текст форматируется только если запись дойдет
+    до вывода, поля (duration_ms, chat_id...) идут в JSON как есть.
+    Такие записи ниже WARNING прореживаются по LOG_SAMPLE_RATE.
+    """
+    if logger.isEnabledFor(level):
+        fields["event"] = event
+        logger.log(level, msg, *args, extra=fields)
+
+
+class ContextFilter(logging.Filter):
+    """Добавляет к записи correlation_id текущей задачи (до передачи в другой поток)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Прореживает частые события: записи с полем event и записи
+    SAMPLED_LOGGERS ниже WARNING.
+
+    Решение принимается по correlation_id, а не по каждой записи:
+    цепочка апдейта попадает в лог целиком или не попадает вовсе.
+    Медленные события (duration_ms >= slow_ms) пишутся всегда.
+    """
+
+    def __init__(self, rate: float = 1.0, slow_ms: float = 1000.0):
+        super().__init__()
+        self.rate = rate
+        self.slow_ms = slow_ms
+        self._threshold = int(rate * 0xFFFFFFFF)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1 or record.levelno >= logging.WARNING:
+            return True
+        if getattr(record, "event", None) is None and record.name not in SAMPLED_LOGGERS:
+            return True
+        if getattr(record, "duration_ms", 0) >= self.slow_ms:
+            return True
+        cid = getattr(record, "correlation_id", None)
+        if cid is None:
+            return random.random() < self.rate
+        return zlib.crc32(cid.encode()) <= self._threshold
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON"""
+
+    def __init__(self, worker: Optional[str] = None):
+        super().__init__()
+        self.worker = worker
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if self.worker is not None:
+            payload["worker"] = self.worker
+        cid = getattr(record, "correlation_id", None)
+        if cid is not None:
+            payload["cid"] = cid
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class _LocalQueueHandler(QueueHandler):
+    """
+    QueueHandler для очереди внутри процесса: запись передается как есть,
+    без форматирования — сообщение, JSON и traceback собирает поток
+    QueueListener, а не event loop.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def configure(log_format: str = "text", level: str = "INFO", sample_rate: float = 1.0,
+              slow_ms: float = 1000.0, worker: Optional[str] = None,
+              stream: Optional[IO[str]] = None) -> QueueListener:
+    """
+    Заменяет обработчики корневого логгера очередью: event loop только
+    кладет записи в очередь, форматирует и пишет их фоновый поток.
+    Возвращает запущенный QueueListener (остановить при выходе — stop()).
+    """
+    output = logging.StreamHandler(stream)
+    if log_format == "json":
+        output.setFormatter(JsonFormatter(worker))
+    else:
+        prefix = f"{worker} - " if worker else ""
+        output.setFormatter(logging.Formatter(TEXT_FORMAT.format(prefix=prefix)))
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler = _LocalQueueHandler(records)
+    handler.addFilter(ContextFilter())
+    handler.addFilter(SamplingFilter(sample_rate, slow_ms))
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+        old.close()
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    listener = QueueListener(records, output, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+class CorrelationMiddleware(BaseMiddleware):
+    """Outer middleware для dp.update: все записи обработки апдейта получают его ID"""
+
+    async def __call__(self, handler, event, data):
+        token = correlation_id.set(f"u{event.update_id}" if isinstance(event, Update) else None)
+        try:
+            return await handler(event, data)
+        finally:
+            correlation_id.reset(token)
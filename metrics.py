@@ -0,0 +1,286 @@
+import bisect
+import logging
+import time
+from typing import Callable, Dict, List, Tuple
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+
+from logs import log_event
+from templates import DEFAULT_LOCALE, TEXTS
+
+logger = logging.getLogger(__name__)
+
+# Границы бакетов гистограмм задержки, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, value: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + value
+
+    def get(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def total(self) -> float:
+        return sum(self._values.values())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Gauge:
+    """Значение, которое читается из функции в момент выдачи метрик"""
+
+    def __init__(self, name: str, help_text: str, fn: Callable[[], float]):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.fn()}"]
+
+
+class _HistogramSeries:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, ...], _HistogramSeries] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = _HistogramSeries(len(self.buckets) + 1)
+        # Храним счетчики по бакетам, кумулятивные суммы считаются при выдаче
+        series.counts[bisect.bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def series(self) -> Dict[Tuple[str, ...], _HistogramSeries]:
+        return self._series
+
+    def quantile(self, q: float, *labels: str) -> float:
+        """Оценка квантиля по бакетам (линейная интерполяция)"""
+        series = self._series.get(labels)
+        if series is None or series.count == 0:
+            return 0.0
+        target = q * series.count
+        seen = 0
+        lower = 0.0
+        for i, count in enumerate(series.counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+            if count and seen + count >= target:
+                return lower + (upper - lower) * (target - seen) / count
+            seen += count
+            lower = upper
+        return self.buckets[-1]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series.counts):
+                cumulative += count
+                bucket_labels = _format_labels(self.labels, labels, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            inf_labels = _format_labels(self.labels, labels, 'le="+Inf"')
+            plain_labels = _format_labels(self.labels, labels)
+            lines.append(f"{self.name}_bucket{inf_labels} {series.count}")
+            lines.append(f"{self.name}_sum{plain_labels} {series.sum}")
+            lines.append(f"{self.name}_count{plain_labels} {series.count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        # Повторная регистрация (например, при пересоздании приложения) заменяет метрику
+        self._metrics = [m for m in self._metrics if m.name != metric.name]
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_DURATION = REGISTRY.register(Histogram(
+    "bot_handler_duration_seconds", "Handler latency", ("handler",)))
+HANDLER_ERRORS = REGISTRY.register(Counter(
+    "bot_handler_errors_total", "Unhandled handler exceptions", ("handler",)))
+LLM_DURATION = REGISTRY.register(Histogram(
+    "bot_llm_request_duration_seconds", "LLM call latency", ("kind",)))
+LLM_REQUESTS = REGISTRY.register(Counter(
+    "bot_llm_requests_total", "LLM calls by result", ("kind", "status")))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "bot_llm_tokens_total", "LLM tokens used", ("kind", "type")))
+PROMPT_TOKENS = REGISTRY.register(Counter(
+    "bot_prompt_tokens_estimated_total", "Locally estimated prompt tokens by prompt part", ("kind", "part")))
+PROMPT_TRUNCATED = REGISTRY.register(Counter(
+    "bot_prompt_truncated_total", "User inputs cut down to the token budget", ("kind",)))
+LLM_ROUTE_DURATION = REGISTRY.register(Histogram(
+    "bot_llm_route_duration_seconds", "Successful LLM attempt latency per provider/model", ("route",)))
+LLM_ROUTE_REQUESTS = REGISTRY.register(Counter(
+    "bot_llm_route_requests_total", "LLM attempts per provider/model by result", ("route", "status")))
+LLM_BATCH_TEXTS = REGISTRY.register(Counter(
+    "bot_llm_batch_texts_total", "Texts from batched LLM calls by validation result", ("kind", "status")))
+DUPLICATE_TEXTS = REGISTRY.register(Counter(
+    "bot_duplicate_texts_total", "Near-duplicate texts caught before sending", ("kind", "action")))
+LLM_HEDGES = REGISTRY.register(Counter(
+    "bot_llm_hedges_total", "Hedged LLM requests fired after the p95 delay", ("kind",)))
+REMINDER_LAG = REGISTRY.register(Histogram(
+    "bot_reminder_lag_seconds", "Delay between planned and actual reminder run", ("type",)))
+OUTBOX_COMMIT = REGISTRY.register(Histogram(
+    "bot_outbox_commit_duration_seconds", "Reminder outbox group commit latency"))
+OUTBOX_ENTRIES = REGISTRY.register(Counter(
+    "bot_outbox_entries_total", "Reminder outbox writes by resulting state", ("state",)))
+OUTBOUND_LATENCY = REGISTRY.register(Histogram(
+    "bot_outbound_send_duration_seconds", "Outbound Bot API call latency incl. rate limiting and retries"))
+MINIAPP_REQUESTS = REGISTRY.register(Counter(
+    "bot_miniapp_requests_total", "Mini App API requests by endpoint and HTTP status", ("endpoint", "status")))
+
+
+def add_gauge(name: str, help_text: str, fn: Callable[[], float]):
+    REGISTRY.register(Gauge(name, help_text, fn))
+
+
+class LLMTimer:
+    """Контекстный менеджер для учета одного вызова LLM"""
+
+    __slots__ = ("kind", "started")
+
+    def __init__(self, kind: str):
+        self.kind = kind
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.started
+        status = "error" if exc_type else "ok"
+        LLM_DURATION.observe(duration, self.kind)
+        LLM_REQUESTS.inc(self.kind, status)
+        log_event(logger, "llm", "LLM %s: %s за %.0fмс", self.kind, status, duration * 1000,
+                  kind=self.kind, status=status, duration_ms=duration * 1000)
+        return False
+
+
+def record_llm_usage(kind: str, usage) -> None:
+    if usage is None:
+        return
+    LLM_TOKENS.inc(kind, "prompt", value=getattr(usage, "prompt_tokens", 0) or 0)
+    LLM_TOKENS.inc(kind, "completion", value=getattr(usage, "completion_tokens", 0) or 0)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Меряет время работы обработчиков aiogram (регистрируется как inner middleware)"""
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        callback = getattr(handler_object, "callback", None)
+        name = getattr(callback, "__name__", "unknown")
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = "error"
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            HANDLER_DURATION.observe(duration, name)
+            log_event(logger, "handler", "Обработчик %s: %s за %.0fмс", name, status, duration * 1000,
+                      handler=name, status=status, duration_ms=duration * 1000)
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    """GET /metrics в формате Prometheus"""
+    return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_server(host: str, port: int) -> web.AppRunner:
+    """Отдельный сервер /metrics (для режима polling)"""
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def summary(locale: str = DEFAULT_LOCALE) -> List[str]:
+    """Короткая текстовая сводка для команды /stats"""
+    texts = TEXTS[locale]
+    lines = []
+    for labels, series in sorted(HANDLER_DURATION.series().items(), key=lambda item: -item[1].count):
+        name = labels[0]
+        lines.append(texts["stats_handler"].format(
+            name=name, count=series.count,
+            p50=HANDLER_DURATION.quantile(0.5, name) * 1000, p99=HANDLER_DURATION.quantile(0.99, name) * 1000,
+        ))
+    for labels, series in sorted(LLM_DURATION.series().items()):
+        kind = labels[0]
+        line = texts["stats_llm"].format(
+            kind=kind, count=series.count, errors=LLM_REQUESTS.get(kind, "error"), hedges=LLM_HEDGES.get(kind),
+            p50=LLM_DURATION.quantile(0.5, kind),
+            tokens=LLM_TOKENS.get(kind, "prompt") + LLM_TOKENS.get(kind, "completion"),
+        )
+        estimated = sum(PROMPT_TOKENS.get(kind, part) for part in ("system", "history", "user"))
+        if estimated:
+            line += texts["stats_llm_prompt"].format(tokens=estimated / series.count)
+        if PROMPT_TRUNCATED.get(kind):
+            line += texts["stats_llm_truncated"].format(count=PROMPT_TRUNCATED.get(kind))
+        lines.append(line)
+    for labels, series in sorted(LLM_ROUTE_DURATION.series().items()):
+        route = labels[0]
+        lines.append(texts["stats_route"].format(
+            route=route, ok=series.count, errors=LLM_ROUTE_REQUESTS.get(route, "error"),
+            timeouts=LLM_ROUTE_REQUESTS.get(route, "timeout"), p95=LLM_ROUTE_DURATION.quantile(0.95, route),
+        ))
+    for labels, series in sorted(REMINDER_LAG.series().items()):
+        lines.append(texts["stats_reminder_lag"].format(type=labels[0], lag=series.sum / series.count))
+    commits = OUTBOX_COMMIT.series().get(())
+    if commits is not None:
+        lines.append(texts["stats_outbox"].format(
+            commits=commits.count, p99=OUTBOX_COMMIT.quantile(0.99) * 1000, replayed=OUTBOX_ENTRIES.get("replayed"),
+        ))
+    if MINIAPP_REQUESTS.total():
+        not_modified = sum(value for (_, status), value in MINIAPP_REQUESTS._values.items() if status == "304")
+        lines.append(texts["stats_miniapp"].format(requests=MINIAPP_REQUESTS.total(), not_modified=not_modified))
+    return lines
@@ -0,0 +1,348 @@
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from aiohttp import web
+
+from metrics import MINIAPP_REQUESTS
+from storage import open_sqlite
+
+logger = logging.getLogger(__name__)
+
+# Ответы короче этого не сжимаются: gzip их только увеличит
+GZIP_MIN_SIZE = 256
+
+
+class InitDataError(ValueError):
+    """initData Mini App не прошла проверку"""
+
+
+# ---------- Проверка initData ----------
+
+def webapp_secret(bot_token: str) -> bytes:
+    """Ключ проверки initData: HMAC-SHA256 токена бота с ключом "WebAppData" """
+    return hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+
+
+def validate_init_data(init_data: str, secret: bytes, max_age: float = 86400,
+                       now: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Проверяет подпись initData (Telegram.WebApp.initData) и возвращает ее
+    поля; user — уже разобранный JSON. Подпись — HMAC-SHA256 отсортированных
+    пар key=value (кроме hash) через перевод строки.
+    """
+    try:
+        fields = dict(parse_qsl(init_data, keep_blank_values=True, strict_parsing=True))
+    except ValueError:
+        raise InitDataError("initData не разбирается")
+    received = fields.pop("hash", None)
+    if not received:
+        raise InitDataError("в initData нет hash")
+    check = "\n".join(f"{key}={value}" for key, value in sorted(fields.items()))
+    expected = hmac.new(secret, check.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, received):
+        raise InitDataError("неверная подпись initData")
+    try:
+        auth_date = int(fields.get("auth_date", ""))
+        user = json.loads(fields.get("user", "null"))
+    except ValueError:
+        raise InitDataError("неверные поля initData")
+    if max_age and (time.time() if now is None else now) - auth_date > max_age:
+        raise InitDataError("initData устарела")
+    if not isinstance(user, dict) or not isinstance(user.get("id"), int):
+        raise InitDataError("в initData нет пользователя")
+    fields["user"] = user
+    return fields
+
+
+# ---------- Последние отправленные тексты ----------
+
+class RecentTexts:
+    """
+    Последние limit текстов каждого вида на получателя (для Mini App).
+
+    Хранятся в памяти; новые записи сбрасываются в SQLite пачками в
+    фоне. version(user_id) меняется при каждом добавлении — по ней
+    кеш ответов API понимает, что payload устарел.
+    """
+
+    def __init__(self, path: str, limit: int = 20, flush_interval: float = 5.0):
+        self.path = path
+        self.limit = limit
+        self.flush_interval = flush_interval
+        self._texts: Dict[Tuple[int, str], deque] = {}
+        self._versions: Dict[int, int] = {}
+        self._pending: List[Tuple[int, str, str, float]] = []
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------- SQLite (выполняется в отдельном потоке) ----------
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = open_sqlite(self.path)
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS recent_texts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    sent_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS recent_texts_user ON recent_texts (user_id, kind, id);
+                """
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _load_rows(self) -> list:
+        with self._db_lock:
+            return self._connect().execute(
+                "SELECT user_id, kind, text, sent_at FROM recent_texts ORDER BY id"
+            ).fetchall()
+
+    def _save(self, rows: List[Tuple[int, str, str, float]]):
+        with self._db_lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO recent_texts (user_id, kind, text, sent_at) VALUES (?, ?, ?, ?)", rows
+                )
+                for user_id, kind in {(user_id, kind) for user_id, kind, _, _ in rows}:
+                    conn.execute(
+                        "DELETE FROM recent_texts WHERE user_id = ? AND kind = ? AND id <= ("
+                        "SELECT id FROM recent_texts WHERE user_id = ? AND kind = ? "
+                        "ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                        (user_id, kind, user_id, kind, self.limit),
+                    )
+
+    def _close(self):
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # ---------- Публичный API ----------
+
+    def _append(self, user_id: int, kind: str, text: str, sent_at: float):
+        texts = self._texts.get((user_id, kind))
+        if texts is None:
+            texts = self._texts[(user_id, kind)] = deque(maxlen=self.limit)
+        texts.append((text, sent_at))
+        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def add(self, user_id: int, kind: str, text: str):
+        sent_at = time.time()
+        self._append(user_id, kind, text, sent_at)
+        self._pending.append((user_id, kind, text, sent_at))
+
+    def get(self, user_id: int, kind: str) -> List[Tuple[str, float]]:
+        """Тексты (text, sent_at), новые первыми"""
+        return list(reversed(self._texts.get((user_id, kind), ())))
+
+    def version(self, user_id: int) -> int:
+        return self._versions.get(user_id, 0)
+
+    async def load(self):
+        for user_id, kind, text, sent_at in await asyncio.to_thread(self._load_rows):
+            self._append(user_id, kind, text, sent_at)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        try:
+            await asyncio.to_thread(self._save, rows)
+        except Exception as e:
+            logger.error("Ошибка записи последних текстов: %s", e)
+            self._pending = rows + self._pending
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.shield(self.flush())
+
+    async def start(self):
+        await self.load()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        await asyncio.to_thread(self._close)
+
+
+# ---------- Кеш готовых ответов ----------
+
+class CachedPayload:
+    """JSON, сериализованный и сжатый один раз, с ETag"""
+
+    __slots__ = ("version", "body", "gzipped", "etag")
+
+    def __init__(self, version: Hashable, data: Any):
+        self.version = version
+        self.body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+        self.gzipped = gzip.compress(self.body, compresslevel=6) if len(self.body) >= GZIP_MIN_SIZE else None
+        # Слабый ETag: одинаков для сжатого и несжатого представления
+        self.etag = f'W/"{hashlib.blake2b(self.body, digest_size=8).hexdigest()}"'
+
+    def response(self, request: web.Request, max_age: int) -> web.Response:
+        headers = {
+            "ETag": self.etag,
+            "Cache-Control": f"private, max-age={max_age}",
+            "Vary": "Accept-Encoding, Authorization",
+        }
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match and self.etag in (tag.strip() for tag in if_none_match.split(",")):
+            return web.Response(status=304, headers=headers)
+        body = self.body
+        if self.gzipped is not None and "gzip" in request.headers.get("Accept-Encoding", ""):
+            body = self.gzipped
+            headers["Content-Encoding"] = "gzip"
+        return web.Response(body=body, content_type="application/json", charset="utf-8", headers=headers)
+
+
+class PayloadCache:
+    """
+    Готовые ответы по ключу (эндпоинт, пользователь). Ответ собирается
+    заново, только если у источника сменилась версия.
+    """
+
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        self._items: Dict[Hashable, CachedPayload] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, version: Hashable, build: Callable[[], Any]) -> CachedPayload:
+        payload = self._items.get(key)
+        if payload is not None and payload.version == version:
+            self.hits += 1
+            return payload
+        self.misses += 1
+        payload = CachedPayload(version, build())
+        self._items.pop(key, None)
+        self._items[key] = payload
+        if len(self._items) > self.capacity:
+            del self._items[next(iter(self._items))]
+        return payload
+
+
+# ---------- HTTP API ----------
+
+class _Endpoint:
+    __slots__ = ("version", "build", "shared", "max_age")
+
+    def __init__(self, version, build, shared: bool, max_age: int):
+        self.version = version
+        self.build = build
+        self.shared = shared
+        self.max_age = max_age
+
+
+class MiniAppAPI:
+    """
+    HTTP API для Mini App: GET /api/<имя> с заголовком
+    Authorization: tma <initData>.
+
+    Эндпоинты добавляются через add_endpoint(): version(user_id) — дешевая
+    метка актуальности данных, build(user_id) — сам payload (вызывается,
+    только когда метка сменилась). shared — payload общий для всех.
+    Ответы отдаются из PayloadCache: с ETag (304 на If-None-Match) и gzip.
+    """
+
+    def __init__(self, bot_token: str, allowed_users: Iterable[int],
+                 origin: Optional[str] = None, init_data_ttl: float = 86400):
+        self._secret = webapp_secret(bot_token)
+        self.allowed_users = frozenset(allowed_users)
+        self.init_data_ttl = init_data_ttl
+        self.cache = PayloadCache()
+        self._endpoints: Dict[str, _Endpoint] = {}
+        self._cors = {
+            "Access-Control-Allow-Origin": origin,
+            "Access-Control-Expose-Headers": "ETag",
+        } if origin else {}
+
+    def add_endpoint(self, name: str, version: Callable[[int], Hashable], build: Callable[[int], Any],
+                     shared: bool = False, max_age: int = 0):
+        self._endpoints[name] = _Endpoint(version, build, shared, max_age)
+
+    def authenticate(self, request: web.Request) -> int:
+        """ID пользователя из проверенной initData или HTTP-ошибка"""
+        scheme, _, init_data = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != "tma" or not init_data:
+            raise web.HTTPUnauthorized(text="нужен заголовок Authorization: tma <initData>")
+        try:
+            fields = validate_init_data(init_data, self._secret, self.init_data_ttl)
+        except InitDataError as e:
+            raise web.HTTPUnauthorized(text=str(e))
+        user_id = fields["user"]["id"]
+        if user_id not in self.allowed_users:
+            raise web.HTTPForbidden(text="нет доступа")
+        return user_id
+
+    async def handle(self, request: web.Request) -> web.Response:
+        name = request.match_info["name"]
+        endpoint = self._endpoints.get(name)
+        try:
+            if endpoint is None:
+                raise web.HTTPNotFound()
+            user_id = self.authenticate(request)
+            payload = self.cache.get(
+                (name, None if endpoint.shared else user_id),
+                endpoint.version(user_id),
+                lambda: endpoint.build(user_id),
+            )
+            response = payload.response(request, endpoint.max_age)
+        except web.HTTPException as e:
+            e.headers.update(self._cors)
+            MINIAPP_REQUESTS.inc(name if endpoint else "unknown", str(e.status))
+            raise
+        response.headers.update(self._cors)
+        MINIAPP_REQUESTS.inc(name, str(response.status))
+        return response
+
+    async def preflight(self, request: web.Request) -> web.Response:
+        return web.Response(status=204, headers={
+            **self._cors,
+            "Access-Control-Allow-Methods": "GET",
+            "Access-Control-Allow-Headers": "Authorization, If-None-Match",
+            "Access-Control-Max-Age": "86400",
+        })
+
+    def register(self, app: web.Application):
+        app.router.add_get("/api/{name}", self.handle)
+        app.router.add_route("OPTIONS", "/api/{name}", self.preflight)
+
+
+def mini_app_origin(url: str) -> Optional[str]:
+    """Origin страницы Mini App (для CORS): схема и хост MINI_APP_URL"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}" if parts.scheme and parts.netloc else None
+
+
+async def start_server(api: MiniAppAPI, host: str, port: int) -> web.AppRunner:
+    """Отдельный сервер API (для режима polling)"""
+    app = web.Application()
+    api.register(app)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Set, Tuple
+
+from metrics import OUTBOX_COMMIT, OUTBOX_ENTRIES
+from storage import open_sqlite
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+SENT = "sent"
+DROPPED = "dropped"
+
+
+def outbox_key(user_id: int, reminder_type: str, day: str) -> str:
+    """Ключ идемпотентности: одно напоминание типа в день на получателя"""
+    return f"{reminder_type}:{user_id}:{day}"
+
+
+@dataclass(frozen=True)
+class OutboxEntry:
+    key: str
+    user_id: int
+    type: str
+    text: str
+    created_at: float
+
+
+class Outbox:
+    """
+    Журнал исходящих напоминаний.
+
+    Напоминание с готовым текстом записывается на диск до отправки
+    (put), после доставки помечается отправленным (mark_sent). Если
+    процесс упал между этими шагами, при следующем запуске pending()
+    вернет неотправленные записи — их дослать, а не генерировать заново.
+    Повторный put с тем же ключом ничего не меняет, так что одно
+    напоминание не уйдет дважды (кроме падения в миг между ответом
+    Telegram и записью отметки — тогда оно будет дослано повторно).
+
+    Записи группируются (group commit): пока одна транзакция пишется
+    в отдельном потоке, следующие операции копятся и уходят одной
+    транзакцией, поэтому fsync делается раз на пачку, а не на каждое
+    напоминание.
+    """
+
+    def __init__(self, path: str, max_age: float = 3 * 3600, keep_days: int = 7):
+        self.path = path
+        self.max_age = max_age
+        self.keep_days = keep_days
+        self._ops: List[Tuple[str, tuple, asyncio.Future]] = []
+        self._writing: List[Tuple[str, tuple, asyncio.Future]] = []
+        self._writer: Optional[asyncio.Task] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._cleaned_at = 0.0
+
+    # ---------- SQLite (выполняется в отдельном потоке) ----------
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = open_sqlite(self.path)
+            if self.path != ":memory:":
+                # Запись должна пережить не только падение процесса, но и машины
+                self._conn.execute("PRAGMA synchronous=FULL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS reminder_outbox (
+                    key TEXT PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    type TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS reminder_outbox_state ON reminder_outbox (state, created_at);
+                """
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _apply(self, ops: List[Tuple[str, tuple, asyncio.Future]]) -> list:
+        with self._db_lock:
+            conn = self._connect()
+            now = time.time()
+            results = []
+            with conn:
+                for op, args, _ in ops:
+                    if op == "put":
+                        cursor = conn.execute(
+                            "INSERT OR IGNORE INTO reminder_outbox "
+                            "(key, user_id, type, text, state, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (*args, PENDING, now, now),
+                        )
+                        results.append(cursor.rowcount == 1)
+                    else:
+                        key, state = args
+                        conn.execute(
+                            "UPDATE reminder_outbox SET state = ?, updated_at = ? WHERE key = ?",
+                            (state, now, key),
+                        )
+                        results.append(True)
+                if now - self._cleaned_at > 3600:
+                    conn.execute(
+                        "DELETE FROM reminder_outbox WHERE state != ? AND updated_at < ?",
+                        (PENDING, now - self.keep_days * 86400),
+                    )
+                    self._cleaned_at = now
+            return results
+
+    def _load_pending(self) -> list:
+        with self._db_lock:
+            return self._connect().execute(
+                "SELECT key, user_id, type, text, created_at FROM reminder_outbox "
+                "WHERE state = ? ORDER BY created_at",
+                (PENDING,),
+            ).fetchall()
+
+    def _find(self, keys: List[str]) -> Set[str]:
+        found = set()
+        with self._db_lock:
+            conn = self._connect()
+            # Не больше 500 параметров в запросе (лимит SQLite на старых сборках — 999)
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT key FROM reminder_outbox WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update(key for key, in rows)
+        return found
+
+    def _close(self):
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # ---------- Группировка записей ----------
+
+    def _submit(self, op: str, args: tuple) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._ops.append((op, args, future))
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write())
+        return future
+
+    async def _write(self):
+        while self._ops:
+            ops, self._ops = self._ops, []
+            self._writing = ops
+            started = time.perf_counter()
+            try:
+                results = await asyncio.to_thread(self._apply, ops)
+            except Exception as e:
+                self._writing = []
+                logger.error("Ошибка записи журнала напоминаний: %s", e)
+                for _, _, future in ops:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self._writing = []
+            OUTBOX_COMMIT.observe(time.perf_counter() - started)
+            for (op, args, future), result in zip(ops, results):
+                if op != "put" or result:
+                    OUTBOX_ENTRIES.inc(PENDING if op == "put" else args[1])
+                if not future.done():
+                    future.set_result(result)
+
+    # ---------- Публичный API ----------
+
+    async def put(self, key: str, user_id: int, reminder_type: str, text: str) -> bool:
+        """
+        Записывает напоминание до отправки; возвращает False, если запись
+        с таким ключом уже есть (напоминание отправлено или ждет досылки).
+        """
+        return await asyncio.shield(self._submit("put", (key, user_id, reminder_type, text)))
+
+    async def existing(self, keys: Iterable[str]) -> Set[str]:
+        """
+        Какие из ключей уже есть в журнале, включая еще не записанные put.
+        Позволяет отсеять отправленные напоминания до генерации текстов.
+        """
+        keys = list(keys)
+        if not keys:
+            return set()
+        queued = {args[0] for op, args, _ in self._ops + self._writing if op == "put"}
+        found = await asyncio.to_thread(self._find, keys)
+        return found | queued.intersection(keys)
+
+    async def mark_sent(self, key: str):
+        await asyncio.shield(self._submit("state", (key, SENT)))
+
+    async def drop(self, key: str):
+        """Напоминание досылать не нужно (устарело или получатель недоступен)"""
+        await asyncio.shield(self._submit("state", (key, DROPPED)))
+
+    async def pending(self) -> List[OutboxEntry]:
+        """
+        Неотправленные напоминания, записанные не раньше max_age секунд назад.
+        Более старые помечаются пропущенными: утреннее напоминание вечером
+        уже ни к чему.
+        """
+        rows = await asyncio.to_thread(self._load_pending)
+        cutoff = time.time() - self.max_age
+        entries, stale = [], []
+        for key, user_id, reminder_type, text, created_at in rows:
+            if created_at < cutoff:
+                logger.warning("Напоминание %s не было доставлено и устарело", key)
+                stale.append(self.drop(key))
+                continue
+            entries.append(OutboxEntry(key, user_id, reminder_type, text, created_at))
+        await asyncio.gather(*stale)
+        return entries
+
+    async def close(self):
+        if self._writer is not None:
+            await self._writer
+            self._writer = None
+        await asyncio.to_thread(self._close)
@@ -0,0 +1,247 @@
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from storage import open_sqlite
+
+logger = logging.getLogger(__name__)
+
+
+def text_key(text: str) -> str:
+    """Ключ для дедупликации: хеш нормализованного текста"""
+    normalized = " ".join(text.lower().split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+class TextPool:
+    """
+    Пул заранее сгенерированных текстов (признания, напоминания) с фоновым пополнением.
+
+    Если базу делят несколько процессов, у каждого свой owner: процесс
+    загружает и выдает только свои тексты, поэтому один текст не уйдет дважды.
+
+    Для типов из batch_generators пул пополняется одним запросом на
+    несколько текстов (до max_batch); generators — запасной путь по одному.
+    """
+
+    def __init__(self, path: str, generators: Dict[str, Callable[[], Awaitable[str]]],
+                 target_size: int = 3, ttl: float = 48 * 3600,
+                 refill_interval: float = 300, recent_limit: int = 200, owner: str = "",
+                 batch_generators: Optional[Dict[str, Callable[[int], Awaitable[List[str]]]]] = None,
+                 max_batch: int = 10):
+        self.path = path
+        self.owner = owner
+        self.generators = generators
+        self.batch_generators = batch_generators or {}
+        self.max_batch = max(1, max_batch)
+        self.target_size = target_size
+        self.ttl = ttl
+        self.refill_interval = refill_interval
+        self.recent_limit = recent_limit
+
+        # kind -> deque[(row_id, text, created_at)]
+        self._items: Dict[str, deque] = {kind: deque() for kind in generators}
+        # kind -> (deque ключей в порядке отправки, set тех же ключей)
+        self._recent: Dict[str, tuple] = {kind: (deque(), set()) for kind in generators}
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._pending = set()
+
+    # ---------- SQLite (выполняется в отдельном потоке) ----------
+
+    def _open(self):
+        self._conn = open_sqlite(self.path)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS text_pool (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                text TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                owner TEXT NOT NULL DEFAULT ''
+            );
+            CREATE TABLE IF NOT EXISTS sent_texts (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                sent_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS sent_texts_kind ON sent_texts (kind, sent_at);
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(text_pool)")}
+        if "owner" not in columns:
+            self._conn.execute("ALTER TABLE text_pool ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+        self._conn.commit()
+
+    def _load(self):
+        with self._db_lock:
+            self._conn.execute("DELETE FROM text_pool WHERE created_at < ?", (time.time() - self.ttl,))
+            self._conn.commit()
+            for row_id, kind, text, created_at in self._conn.execute(
+                "SELECT id, kind, text, created_at FROM text_pool WHERE owner = ? ORDER BY id",
+                (self.owner,),
+            ):
+                if kind in self._items:
+                    self._items[kind].append((row_id, text, created_at))
+            for kind in self._recent:
+                rows = self._conn.execute(
+                    "SELECT key FROM sent_texts WHERE kind = ? ORDER BY sent_at DESC LIMIT ?",
+                    (kind, self.recent_limit),
+                ).fetchall()
+                for (key,) in reversed(rows):
+                    self._remember(kind, key)
+
+    def _insert(self, kind: str, text: str, created_at: float) -> int:
+        with self._db_lock:
+            cursor = self._conn.execute(
+                "INSERT INTO text_pool (kind, text, created_at, owner) VALUES (?, ?, ?, ?)",
+                (kind, text, created_at, self.owner),
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def _delete(self, row_ids: list):
+        with self._db_lock:
+            self._conn.executemany("DELETE FROM text_pool WHERE id = ?", [(i,) for i in row_ids])
+            self._conn.commit()
+
+    def _record_sent(self, kind: str, key: str, sent_at: float):
+        with self._db_lock:
+            self._conn.execute(
+                "INSERT INTO sent_texts (kind, key, sent_at) VALUES (?, ?, ?)",
+                (kind, key, sent_at),
+            )
+            # Храним только последние recent_limit ключей на тип
+            self._conn.execute(
+                "DELETE FROM sent_texts WHERE kind = ? AND sent_at < ("
+                "SELECT MIN(sent_at) FROM (SELECT sent_at FROM sent_texts WHERE kind = ? "
+                "ORDER BY sent_at DESC LIMIT ?))",
+                (kind, kind, self.recent_limit),
+            )
+            self._conn.commit()
+
+    def _background(self, func, *args):
+        """Запускает запись в БД в фоне, не задерживая обработчик"""
+        task = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    # ---------- Дедупликация ----------
+
+    def _remember(self, kind: str, key: str):
+        order, keys = self._recent[kind]
+        if key in keys:
+            return
+        order.append(key)
+        keys.add(key)
+        while len(order) > self.recent_limit:
+            keys.discard(order.popleft())
+
+    def _is_duplicate(self, kind: str, text: str) -> bool:
+        key = text_key(text)
+        if key in self._recent[kind][1]:
+            return True
+        return any(text_key(item[1]) == key for item in self._items[kind])
+
+    # ---------- Публичный API ----------
+
+    def size(self, kind: str) -> int:
+        return len(self._items[kind])
+
+    def pop(self, kind: str) -> Optional[str]:
+        """Достает готовый текст за O(1); None, если пул пуст"""
+        items = self._items[kind]
+        expired = []
+        result = None
+        deadline = time.time() - self.ttl
+        while items:
+            row_id, text, created_at = items.popleft()
+            expired.append(row_id)
+            if created_at >= deadline and text_key(text) not in self._recent[kind][1]:
+                result = text
+                break
+        if expired and self._conn is not None:
+            self._background(self._delete, expired)
+        if len(items) < self.target_size:
+            self._wakeup.set()
+        return result
+
+    def mark_sent(self, kind: str, text: str):
+        """Запоминает отправленный текст, чтобы не повторять его"""
+        key = text_key(text)
+        self._remember(kind, key)
+        if self._conn is not None:
+            self._background(self._record_sent, kind, key, time.time())
+
+    async def refill(self):
+        """Догенерирует тексты для всех типов до target_size"""
+        for kind, generator in self.generators.items():
+            missing = self.target_size - len(self._items[kind])
+            if missing <= 0:
+                continue
+            results = []
+            if kind in self.batch_generators:
+                try:
+                    results = await self.batch_generators[kind](min(missing, self.max_batch))
+                except Exception as e:
+                    logger.error("Ошибка пакетного пополнения пула '%s': %s", kind, e)
+            if not results:
+                results = await asyncio.gather(
+                    *(generator() for _ in range(missing)), return_exceptions=True
+                )
+            for text in results:
+                if isinstance(text, BaseException):
+                    logger.error("Ошибка пополнения пула '%s': %s", kind, text)
+                    continue
+                if not text or self._is_duplicate(kind, text):
+                    continue
+                if len(self._items[kind]) >= self.target_size:
+                    break
+                created_at = time.time()
+                row_id = await asyncio.to_thread(self._insert, kind, text, created_at)
+                self._items[kind].append((row_id, text, created_at))
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refill()
+            except Exception as e:
+                logger.error("Ошибка фонового пополнения пула: %s", e)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.refill_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self):
+        """Загружает пул с диска и запускает фоновое пополнение"""
+        await asyncio.to_thread(self._open)
+        await asyncio.to_thread(self._load)
+        logger.info(
+            "Пул текстов загружен: "
+            + ", ".join(f"{kind}={len(items)}" for kind, items in self._items.items())
+        )
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает пополнение и дожидается фоновых записей"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,150 @@
+import math
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from metrics import PROMPT_TOKENS, PROMPT_TRUNCATED
+
+# Служебные токены шаблона чата на каждое сообщение (роль, разделители)
+MESSAGE_OVERHEAD = 4
+PROMPT_PARTS = ("system", "history", "user")
+TRUNCATION_MARK = " … "
+
+# Куски текста, которые BPE-токенизатор (Llama 3, GPT) режет по-разному:
+# латиница, другие алфавиты (кириллица), числа, пробелы, прочие символы
+_PIECES = re.compile(r"[A-Za-z]+|[^\W\d_A-Za-z]+|\d+|\s+|[^\w\s]+")
+# Вариантный селектор и ZWJ входят в эмодзи и отдельных токенов почти не дают
+_JOINERS = frozenset("\ufe0f\u200d")
+
+
+@lru_cache(maxsize=1024)
+def _raw_tokens(text: str) -> int:
+    tokens = 0
+    for piece in _PIECES.findall(text):
+        first = piece[0]
+        if first.isspace():
+            # Одиночный пробел склеивается со следующим словом; переводы строк — отдельные токены
+            tokens += min(piece.count("\n"), 2)
+        elif first.isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        elif first.isascii() and first.isalpha():
+            tokens += math.ceil(len(piece) / 5)
+        elif first.isalpha():
+            # Русское слово — обычно 2–4 токена: словарь модели в основном английский
+            tokens += math.ceil(len(piece) / 3)
+        else:
+            # Знаки препинания часто склеиваются парами, эмодзи — 1–3 токена байтового BPE
+            ascii_marks = sum(1 for ch in piece if ch.isascii())
+            symbols = sum(1 for ch in piece if not ch.isascii() and ch not in _JOINERS)
+            tokens += math.ceil(ascii_marks / 2) + 2 * symbols
+    return max(1, tokens)
+
+
+class TokenCounter:
+    """
+    Оценка числа токенов без токенизатора модели.
+
+    Правила приблизительные, поэтому оценка поправляется множителем,
+    который подстраивается под prompt_tokens из ответов провайдера
+    (скользящее среднее отношения настоящего числа к оценке).
+    """
+
+    def __init__(self, ratio: float = 1.0, alpha: float = 0.05):
+        self.ratio = ratio
+        self.alpha = alpha
+
+    def count(self, text: str) -> int:
+        return math.ceil(_raw_tokens(text) * self.ratio) if text else 0
+
+    def count_messages(self, messages: Sequence[dict]) -> int:
+        return sum(self.count(message.get("content") or "") + MESSAGE_OVERHEAD for message in messages)
+
+    def observe(self, estimated: int, actual: int):
+        """Учитывает настоящее число токенов промпта, оцененного в estimated"""
+        if estimated <= 0 or actual <= 0:
+            return
+        observed = min(3.0, max(0.3, self.ratio * actual / estimated))
+        self.ratio += self.alpha * (observed - self.ratio)
+
+
+counter = TokenCounter()
+
+
+def estimate_tokens(text: str) -> int:
+    return counter.count(text)
+
+
+def _drop_partial_word(piece: str, at_end: bool) -> str:
+    """Убирает слово, разрезанное на границе куска (если кусок не из одного слова)"""
+    parts = piece.rsplit(None, 1) if at_end else piece.split(None, 1)
+    if len(parts) < 2:
+        return piece
+    return parts[0] if at_end else parts[1]
+
+
+def truncate(text: str, budget: int) -> Tuple[str, bool]:
+    """
+    Укладывает текст в budget токенов: оставляет начало и конец
+    (в конце длинного сообщения обычно вопрос), середину заменяет «…».
+    """
+    if budget <= 0 or counter.count(text) <= budget:
+        return text, False
+    chars = int(len(text) * budget / counter.count(text)) - len(TRUNCATION_MARK)
+    while chars > 0:
+        head = _drop_partial_word(text[:chars * 2 // 3], at_end=True)
+        tail = _drop_partial_word(text[len(text) - chars // 3:], at_end=False)
+        result = head + TRUNCATION_MARK + tail
+        if counter.count(result) <= budget:
+            return result, True
+        chars = int(chars * 0.9)
+    return text[:max(1, budget)], True
+
+
+class Prompt:
+    """Сообщения для LLM и оценка токенов по частям (system, history, user)"""
+
+    __slots__ = ("messages", "tokens", "truncated")
+
+    def __init__(self, messages: List[dict], tokens: Dict[str, int], truncated: bool = False):
+        self.messages = messages
+        self.tokens = tokens
+        self.truncated = truncated
+
+    @property
+    def total(self) -> int:
+        return sum(self.tokens.values())
+
+
+class PromptBuilder:
+    """
+    Промпт с неизменной системной частью.
+
+    Системное сообщение создается один раз и идет первым в каждом
+    запросе: префикс запроса байт в байт одинаков, так что провайдер
+    может переиспользовать его из кеша промптов, а его токены не
+    пересчитываются. Переменная часть (история, текст пользователя,
+    инструкция для пачки) всегда идет после него. Текст пользователя
+    обрезается до input_budget токенов.
+    """
+
+    def __init__(self, kind: str, system: str, input_budget: Optional[int] = None):
+        self.kind = kind
+        self.input_budget = input_budget
+        self._system = {"role": "system", "content": system}
+
+    def build(self, user: str, history: Sequence[dict] = (), kind: Optional[str] = None) -> Prompt:
+        kind = kind or self.kind
+        truncated = False
+        if self.input_budget is not None:
+            user, truncated = truncate(user, self.input_budget)
+            if truncated:
+                PROMPT_TRUNCATED.inc(kind)
+        messages = [self._system, *history, {"role": "user", "content": user}]
+        tokens = {
+            "system": counter.count_messages((self._system,)),
+            "history": counter.count_messages(history),
+            "user": counter.count(user) + MESSAGE_OVERHEAD,
+        }
+        for part, value in tokens.items():
+            PROMPT_TOKENS.inc(kind, part, value=value)
+        return Prompt(messages, tokens, truncated)
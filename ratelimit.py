@@ -0,0 +1,52 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты по алгоритму token bucket.
+
+    Работает через резервирование: каждый вызов acquire() сразу забирает
+    токен (баланс может уйти в минус) и спит ровно столько, сколько нужно
+    до его появления. Поэтому ожидающие обслуживаются по порядку без блокировок.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], Awaitable] = asyncio.sleep):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """Забирает токены и возвращает, сколько секунд нужно подождать"""
+        self._refill()
+        self._tokens -= tokens
+        if self._tokens >= 0:
+            return 0.0
+        return -self._tokens / self.rate
+
+    def penalize(self, seconds: float):
+        """Запрещает выдачу токенов на ближайшие seconds секунд (например, после 429)"""
+        self._refill()
+        # Следующий acquire() получит токен ровно через seconds секунд
+        self._tokens = min(self._tokens, 1 - seconds * self.rate)
+
+    def idle(self) -> bool:
+        """Бакет полон, то есть давно не использовался"""
+        self._refill()
+        return self._tokens >= self.capacity
+
+    async def acquire(self, tokens: float = 1.0):
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await self._sleep(delay)
@@ -0,0 +1,271 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from datetime import date, datetime, time as dt_time, timedelta, tzinfo
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+
+from metrics import REMINDER_LAG
+from ratelimit import TokenBucket
+from storage import StateStore, UserSettings
+
+logger = logging.getLogger(__name__)
+
+REMINDER_TYPES = ("morning", "evening")
+
+
+def reminder_window(settings: UserSettings, reminder_type: str) -> Tuple[int, int]:
+    """Окно отправки (начальный час включительно, конечный — нет)"""
+    if reminder_type == "morning":
+        return settings.morning_start, settings.morning_end
+    return settings.evening_start, settings.evening_end
+
+
+def day_random(user_id: int, reminder_type: str, day: date) -> random.Random:
+    """
+    Генератор для выбора времени напоминания. Зерно — (получатель, тип, день),
+    так что после перезапуска и в другом процессе выпадает то же время.
+    """
+    return random.Random(f"{user_id}:{reminder_type}:{day.isoformat()}")
+
+
+def random_time_picker(settings: UserSettings, reminder_type: str, day: date) -> int:
+    """Случайная минута внутри окна; возвращает секунды от полуночи"""
+    start, end = reminder_window(settings, reminder_type)
+    minutes = max(1, (end - start) * 60)
+    return start * 3600 + day_random(settings.user_id, reminder_type, day).randrange(minutes) * 60
+
+
+class ReminderScheduler:
+    """
+    Планировщик напоминаний для многих получателей.
+
+    Вместо отдельной cron-задачи на каждого пользователя держит одну кучу
+    (heap) с ближайшими временами отправки. На каждом тике забирает все
+    наступившие записи, пачкой получает тексты и рассылает их с
+    ограничением параллелизма и частоты.
+
+    Если задан claim, перед отправкой каждое напоминание (получатель, день)
+    «забирается» в общем хранилище: при нескольких процессах оно уйдет
+    только один раз.
+
+    send получает (user_id, тип, текст, день): по дню в часовом поясе
+    получателя отправка отличается от вчерашней и завтрашней.
+
+    Время на каждый день выбирается детерминированно (time_picker с
+    зерном по получателю, типу и дню), поэтому при старте планировщик
+    находит и сразу отправляет напоминания, время которых прошло не
+    раньше catch_up секунд назад, пока процесс не работал. Уже
+    отправленные отсеивает claim — до генерации текстов.
+    """
+
+    def __init__(self, store: StateStore,
+                 generate_batch: Callable[[str, int], Awaitable[List[str]]],
+                 send: Callable[[int, str, str, date], Awaitable],
+                 default_timezone: Optional[str] = None,
+                 time_picker: Callable[[UserSettings, str, date], int] = random_time_picker,
+                 max_concurrent_sends: int = 20,
+                 global_rate: float = 25.0,
+                 max_texts_per_batch: int = 20,
+                 clock: Callable[[], float] = time.time,
+                 sleep: Callable[[float], Awaitable] = asyncio.sleep,
+                 claim: Optional[Callable[[str, List[Tuple[int, str]]], Awaitable[Set[int]]]] = None,
+                 catch_up: float = 0.0):
+        self.store = store
+        self.generate_batch = generate_batch
+        self.send = send
+        self.claim = claim
+        self.catch_up = catch_up
+        self.time_picker = time_picker
+        self.max_texts_per_batch = max_texts_per_batch
+        self.clock = clock
+        self._default_tz = ZoneInfo(default_timezone) if default_timezone else None
+        self._tz_cache: Dict[str, tzinfo] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrent_sends)
+        self._bucket = TokenBucket(global_rate, clock=clock, sleep=sleep)
+
+        # Куча (due, seq, user_id, reminder_type); актуальные сроки — в _due.
+        # Отмененные/перенесенные записи остаются в куче и пропускаются при извлечении.
+        self._heap: list = []
+        self._due: Dict[Tuple[int, str], float] = {}
+        self._seq = itertools.count()
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------- Расчет времени ----------
+
+    def timezone(self, settings: UserSettings) -> Optional[tzinfo]:
+        """Часовой пояс получателя (его собственный или по умолчанию)"""
+        if not settings.timezone:
+            return self._default_tz
+        tz = self._tz_cache.get(settings.timezone)
+        if tz is None:
+            tz = self._tz_cache[settings.timezone] = ZoneInfo(settings.timezone)
+        return tz
+
+    def next_due(self, settings: UserSettings, reminder_type: str, after: float,
+                 skip_day: Optional[date] = None) -> float:
+        """Ближайшее время отправки позже after (в окне получателя)"""
+        tz = self.timezone(settings)
+        day = datetime.fromtimestamp(after, tz).date()
+        for offset in range(3):
+            current = day + timedelta(days=offset)
+            if current == skip_day:
+                continue
+            seconds = self.time_picker(settings, reminder_type, current)
+            local = datetime.combine(current, dt_time(seconds // 3600, (seconds % 3600) // 60), tzinfo=tz)
+            due = local.timestamp()
+            if due > after:
+                return due
+        return after + 86400
+
+    # ---------- Управление расписанием ----------
+
+    def schedule(self, settings: UserSettings, reminder_type: str,
+                 after: Optional[float] = None, skip_day: Optional[date] = None):
+        key = (settings.user_id, reminder_type)
+        due = self.next_due(settings, reminder_type, self.clock() if after is None else after, skip_day)
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, next(self._seq), settings.user_id, reminder_type))
+        self._changed.set()
+
+    def unschedule(self, user_id: int, reminder_type: str):
+        self._due.pop((user_id, reminder_type), None)
+
+    def sync_user(self, user_id: int, since: Optional[float] = None):
+        """
+        Приводит расписание пользователя в соответствие с его настройками.
+        since — искать время отправки начиная с этого момента (в прошлом —
+        пропущенные напоминания), но не раньше включения напоминаний.
+        """
+        settings = self.store.get(user_id)
+        after = None
+        if since is not None:
+            after = max(since, settings.activated_at or since)
+        for reminder_type in REMINDER_TYPES:
+            active = getattr(settings, f"{reminder_type}_active")
+            scheduled = (user_id, reminder_type) in self._due
+            if active and not scheduled:
+                self.schedule(settings, reminder_type, after=after)
+            elif not active and scheduled:
+                self.unschedule(user_id, reminder_type)
+
+    def sync_all(self, since: Optional[float] = None):
+        for settings in self.store.all():
+            self.sync_user(settings.user_id, since)
+
+    def pending(self) -> int:
+        return len(self._due)
+
+    def next_wakeup(self) -> Optional[float]:
+        while self._heap:
+            due, _, user_id, reminder_type = self._heap[0]
+            if self._due.get((user_id, reminder_type)) == due:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+    # ---------- Выполнение ----------
+
+    def _pop_due(self, now: float) -> Dict[str, List[Tuple[int, float]]]:
+        batches: Dict[str, List[Tuple[int, float]]] = {}
+        while self._heap and self._heap[0][0] <= now:
+            due, _, user_id, reminder_type = heapq.heappop(self._heap)
+            if self._due.get((user_id, reminder_type)) != due:
+                continue
+            batches.setdefault(reminder_type, []).append((user_id, due))
+        return batches
+
+    async def _deliver(self, user_id: int, reminder_type: str, text: str, day: date):
+        async with self._semaphore:
+            await self._bucket.acquire()
+            try:
+                await self.send(user_id, reminder_type, text, day)
+            except Exception as e:
+                logger.error("Ошибка отправки напоминания %s пользователю %s: %s", reminder_type, user_id, e)
+
+    async def run_due(self, now: Optional[float] = None) -> int:
+        """Обрабатывает все наступившие напоминания; возвращает число отправок"""
+        now = self.clock() if now is None else now
+        batches = self._pop_due(now)
+        sent = 0
+        for reminder_type, entries in batches.items():
+            # Переносим на следующий день сразу, до отправки
+            fired_days = {}
+            for user_id, due in entries:
+                REMINDER_LAG.observe(max(0.0, now - due), reminder_type)
+                settings = self.store.get(user_id)
+                if getattr(settings, f"{reminder_type}_active"):
+                    fired_day = datetime.fromtimestamp(due, self.timezone(settings)).date()
+                    fired_days[user_id] = fired_day
+                    self.schedule(settings, reminder_type, after=due, skip_day=fired_day)
+                else:
+                    self._due.pop((user_id, reminder_type), None)
+
+            recipients = list(fired_days)
+            if recipients and self.claim is not None:
+                claimed = await self.claim(
+                    reminder_type, [(user_id, fired_days[user_id].isoformat()) for user_id in recipients]
+                )
+                skipped = len(recipients) - len(claimed)
+                if skipped:
+                    logger.info("%s напоминаний %s уже отправлены или отправляются", skipped, reminder_type)
+                recipients = [user_id for user_id in recipients if user_id in claimed]
+            if not recipients:
+                continue
+            texts = await self.generate_batch(
+                reminder_type, min(len(recipients), self.max_texts_per_batch)
+            )
+            if not texts:
+                continue
+            await asyncio.gather(*(
+                self._deliver(user_id, reminder_type, texts[i % len(texts)], fired_days[user_id])
+                for i, user_id in enumerate(recipients)
+            ))
+            sent += len(recipients)
+        return sent
+
+    async def _run(self):
+        while True:
+            self._changed.clear()
+            wakeup = self.next_wakeup()
+            now = self.clock()
+            if wakeup is not None and wakeup <= now:
+                try:
+                    await self.run_due(now)
+                except Exception as e:
+                    logger.error("Ошибка планировщика напоминаний: %s", e)
+                continue
+            timeout = None if wakeup is None else min(wakeup - now, 3600)
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        # Напоминания, пропущенные за время простоя, уйдут на первом тике
+        self.sync_all(since=self.clock() - self.catch_up if self.catch_up else None)
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"⏰ Планировщик напоминаний запущен, записей: {self.pending()}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def describe(self, user_id: int) -> Dict[str, datetime]:
+        """Запланированное время напоминаний пользователя (для логов)"""
+        settings = self.store.get(user_id)
+        tz = self.timezone(settings)
+        return {
+            reminder_type: datetime.fromtimestamp(self._due[(user_id, reminder_type)], tz)
+            for reminder_type in REMINDER_TYPES
+            if (user_id, reminder_type) in self._due
+        }
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.methods import SendChatAction
+from aiogram.methods.base import TelegramMethod
+
+from logs import log_event
+from metrics import OUTBOUND_LATENCY
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class OutboundDispatcher:
+    """
+    Центральный диспетчер исходящих запросов к Bot API.
+
+    Ограничивает частоту глобально и для каждого чата (token bucket),
+    соблюдает retry_after из ответов 429, повторяет запросы при сетевых
+    ошибках с экспоненциальной задержкой и джиттером, собирает метрики.
+    """
+
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 3.0,
+                 max_concurrency: int = 32, max_retries: int = 5,
+                 base_delay: float = 0.5, max_delay: float = 30.0, max_chats: int = 10000):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_chats = max_chats
+        self._global = TokenBucket(global_rate)
+        self._chats: Dict[int, TokenBucket] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        # Метрики
+        self.queued = 0
+        self.in_flight = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.rate_limited = 0
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_chats:
+                # Выбрасываем бакеты чатов, которые давно ничего не получали
+                self._chats = {key: value for key, value in self._chats.items() if not value.idle()}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, capacity=self.chat_burst)
+        return bucket
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: случайная задержка от 0 до экспоненциального предела
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def call(self, chat_id: Optional[Any], request: Callable[[], Awaitable],
+                   limited: bool = True) -> Any:
+        """Выполняет запрос с ограничением частоты и повторами; request вызывается на каждую попытку"""
+        started = time.perf_counter()
+        self.queued += 1
+        queued = True
+        try:
+            attempt = 0
+            while True:
+                if limited:
+                    if isinstance(chat_id, int):
+                        await self._chat_bucket(chat_id).acquire()
+                    await self._global.acquire()
+                async with self._semaphore:
+                    if queued:
+                        self.queued -= 1
+                        queued = False
+                    self.in_flight += 1
+                    try:
+                        result = await request()
+                    except TelegramRetryAfter as e:
+                        error, delay = e, float(e.retry_after)
+                        self.rate_limited += 1
+                        if limited and isinstance(chat_id, int):
+                            # Ждать будет бакет чата: заодно притормозят и другие сообщения в этот чат
+                            self._chat_bucket(chat_id).penalize(delay)
+                            delay = 0.0
+                    except (TelegramNetworkError, TelegramServerError) as e:
+                        error, delay = e, self._backoff(attempt)
+                    else:
+                        self.sent += 1
+                        duration = time.perf_counter() - started
+                        OUTBOUND_LATENCY.observe(duration)
+                        log_event(logger, "send", "Отправка в чат %s за %.0fмс", chat_id, duration * 1000,
+                                  chat_id=chat_id, attempts=attempt + 1, duration_ms=duration * 1000)
+                        return result
+                    finally:
+                        self.in_flight -= 1
+
+                attempt += 1
+                if attempt > self.max_retries:
+                    self.failed += 1
+                    raise error
+                self.retries += 1
+                logger.warning("Повтор отправки в чат %s через %.1fс (попытка %s): %s", chat_id, delay, attempt, error)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        finally:
+            if queued:
+                self.queued -= 1
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queued,
+            "in_flight": self.in_flight,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "latency_p50": OUTBOUND_LATENCY.quantile(0.5),
+            "latency_p99": OUTBOUND_LATENCY.quantile(0.99),
+        }
+
+
+class OutboundMiddleware(BaseRequestMiddleware):
+    """Пропускает все запросы бота через OutboundDispatcher"""
+
+    def __init__(self, dispatcher: OutboundDispatcher):
+        self.dispatcher = dispatcher
+
+    async def __call__(self, make_request, bot: Bot, method: TelegramMethod):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            # Служебные запросы (getUpdates, answerCallbackQuery...) идут напрямую
+            return await make_request(bot, method)
+        # Статус "печатает" не расходует лимит сообщений, но повторяется при сбоях
+        limited = not isinstance(method, SendChatAction)
+        return await self.dispatcher.call(chat_id, lambda: make_request(bot, method), limited=limited)
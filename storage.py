@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from dataclasses import asdict, dataclass, fields, replace
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def open_sqlite(path: str) -> sqlite3.Connection:
+    """
+    Соединение SQLite для работы из потоков и нескольких процессов:
+    WAL позволяет читать во время записи, busy_timeout — ждать чужую блокировку.
+    """
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=10.0)
+    if path != ":memory:":
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+@dataclass(frozen=True)
+class UserSettings:
+    """Настройки напоминаний одного получателя"""
+    user_id: int
+    morning_active: bool = False
+    evening_active: bool = False
+    activated_at: Optional[float] = None
+    timezone: Optional[str] = None
+    morning_start: int = 9
+    morning_end: int = 12
+    evening_start: int = 21
+    evening_end: int = 23
+
+
+_FIELDS = [f.name for f in fields(UserSettings)]
+
+
+class StateStore:
+    """
+    Хранилище состояния с кешем в памяти и отложенной записью.
+
+    Чтение и изменение выполняются синхронно в памяти; изменения копятся
+    и сбрасываются на диск пачкой в фоне (write-behind).
+
+    Если хранилище общее для нескольких процессов (refresh_interval задан),
+    в фоне подтягиваются чужие изменения, а on_change получает ID
+    пользователей, чьи настройки поменялись.
+    """
+
+    def __init__(self, flush_interval: float = 1.0, refresh_interval: Optional[float] = None):
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+        self.on_change: Optional[Callable[[List[int]], None]] = None
+        self._cache: Dict[int, UserSettings] = {}
+        self._dirty: set = set()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._seen_until = 0.0
+        self._last_refresh = 0.0
+
+    # ---------- Переопределяется в бэкендах ----------
+
+    def _load_all(self) -> List[UserSettings]:
+        return []
+
+    def _load_changed(self, since: float) -> List[tuple]:
+        """Записи (updated_at, settings), измененные после since"""
+        return []
+
+    def _save(self, records: List[UserSettings]):
+        pass
+
+    def _close(self):
+        pass
+
+    # ---------- Публичный API ----------
+
+    def get(self, user_id: int) -> UserSettings:
+        """Текущие настройки пользователя (из кеша)"""
+        settings = self._cache.get(user_id)
+        if settings is None:
+            settings = UserSettings(user_id=user_id)
+        return settings
+
+    def update(self, user_id: int, **changes) -> UserSettings:
+        """Меняет настройки в памяти и ставит их в очередь на запись"""
+        settings = replace(self.get(user_id), **changes)
+        self._cache[user_id] = settings
+        self._dirty.add(user_id)
+        return settings
+
+    def all(self) -> Iterable[UserSettings]:
+        return list(self._cache.values())
+
+    async def load(self):
+        """Однократно загружает все настройки при старте"""
+        self._seen_until = time.time()
+        records = await asyncio.to_thread(self._load_all)
+        self._cache = {record.user_id: record for record in records}
+        logger.info(f"Загружены настройки {len(records)} пользователей")
+
+    async def refresh(self) -> List[int]:
+        """Подтягивает изменения других процессов; возвращает ID изменившихся пользователей"""
+        # Запас в несколько секунд: запись с более ранней меткой могла закоммититься позже
+        since = self._seen_until - 5.0
+        rows = await asyncio.to_thread(self._load_changed, since)
+        changed = []
+        for updated_at, record in rows:
+            self._seen_until = max(self._seen_until, updated_at)
+            # Свои несохраненные изменения новее того, что лежит в базе
+            if record.user_id in self._dirty or self._cache.get(record.user_id) == record:
+                continue
+            self._cache[record.user_id] = record
+            changed.append(record.user_id)
+        if changed and self.on_change is not None:
+            self.on_change(changed)
+        return changed
+
+    async def flush(self):
+        """Записывает накопленные изменения одной пачкой"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, set()
+            records = [self._cache[user_id] for user_id in dirty]
+            try:
+                await asyncio.to_thread(self._save, records)
+            except Exception as e:
+                logger.error("Ошибка записи настроек: %s", e)
+                self._dirty |= dirty
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            # shield: остановка не должна прерывать запись на середине
+            await asyncio.shield(self.flush())
+            if self.refresh_interval is not None and time.monotonic() - self._last_refresh >= self.refresh_interval:
+                self._last_refresh = time.monotonic()
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    logger.error("Ошибка чтения общих настроек: %s", e)
+
+    async def start(self):
+        await self.load()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        await asyncio.to_thread(self._close)
+
+
+class MemoryStateStore(StateStore):
+    """Хранилище только в памяти (для тестов и локального запуска)"""
+
+
+class SQLiteStateStore(StateStore):
+    """Хранилище в файле SQLite"""
+
+    def __init__(self, path: str, flush_interval: float = 1.0, refresh_interval: Optional[float] = None):
+        super().__init__(flush_interval=flush_interval, refresh_interval=refresh_interval)
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = open_sqlite(self.path)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS user_settings (
+                    user_id INTEGER PRIMARY KEY,
+                    morning_active INTEGER NOT NULL,
+                    evening_active INTEGER NOT NULL,
+                    activated_at REAL,
+                    timezone TEXT,
+                    morning_start INTEGER NOT NULL,
+                    morning_end INTEGER NOT NULL,
+                    evening_start INTEGER NOT NULL,
+                    evening_end INTEGER NOT NULL,
+                    updated_at REAL NOT NULL DEFAULT 0
+                )
+                """
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(user_settings)")}
+            if "updated_at" not in columns:
+                self._conn.execute("ALTER TABLE user_settings ADD COLUMN updated_at REAL NOT NULL DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS user_settings_updated ON user_settings (updated_at)")
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def _record(row) -> UserSettings:
+        values = dict(zip(_FIELDS, row))
+        values["morning_active"] = bool(values["morning_active"])
+        values["evening_active"] = bool(values["evening_active"])
+        return UserSettings(**values)
+
+    def _load_all(self) -> List[UserSettings]:
+        rows = self._connect().execute(f"SELECT {', '.join(_FIELDS)} FROM user_settings").fetchall()
+        return [self._record(row) for row in rows]
+
+    def _load_changed(self, since: float) -> List[tuple]:
+        rows = self._connect().execute(
+            f"SELECT updated_at, {', '.join(_FIELDS)} FROM user_settings WHERE updated_at > ?",
+            (since,),
+        ).fetchall()
+        return [(row[0], self._record(row[1:])) for row in rows]
+
+    def _save(self, records: List[UserSettings]):
+        conn = self._connect()
+        placeholders = ", ".join("?" for _ in _FIELDS)
+        now = time.time()
+        conn.executemany(
+            f"INSERT OR REPLACE INTO user_settings ({', '.join(_FIELDS)}, updated_at) VALUES ({placeholders}, ?)",
+            [tuple(asdict(record)[name] for name in _FIELDS) + (now,) for record in records],
+        )
+        conn.commit()
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def create_state_store(backend: str, path: str, refresh_interval: Optional[float] = None) -> StateStore:
+    """Создает хранилище по имени бэкенда: sqlite или memory"""
+    if backend == "memory":
+        return MemoryStateStore()
+    if backend == "sqlite":
+        return SQLiteStateStore(path, refresh_interval=refresh_interval)
+    raise ValueError(f"Неизвестный бэкенд хранилища: {backend}")
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest
+
+logger = logging.getLogger(__name__)
+
+# Признак того, что текст еще дописывается
+CURSOR = " ▌"
+
+
+class ProgressiveMessage:
+    """
+    Ответ, который появляется по мере генерации.
+
+    Первый фрагмент отправляется сразу отдельным сообщением, дальше текст
+    обновляется правками не чаще min_interval: промежуточные версии
+    схлопываются, отправляется только самая свежая.
+    """
+
+    def __init__(self, reply_to: types.Message, min_interval: float = 1.0):
+        self.reply_to = reply_to
+        self.min_interval = min_interval
+        self.message: Optional[types.Message] = None
+        self.first_visible_at: Optional[float] = None
+        self._text = ""
+        self._shown = ""
+        self._changed = asyncio.Event()
+        self._editor: Optional[asyncio.Task] = None
+
+    @property
+    def started(self) -> bool:
+        return self.message is not None
+
+    async def update(self, text: str):
+        """Сообщает новый текст; первая версия отправляется, остальные ждут правки"""
+        self._text = text
+        if self.message is None:
+            self.message = await self.reply_to.answer(text + CURSOR)
+            self._shown = text
+            self.first_visible_at = time.perf_counter()
+            self._editor = asyncio.create_task(self._edit_loop())
+        else:
+            self._changed.set()
+
+    async def _edit_loop(self):
+        while True:
+            await asyncio.sleep(self.min_interval)
+            await self._changed.wait()
+            self._changed.clear()
+            text = self._text
+            if text == self._shown:
+                continue
+            try:
+                await self.message.edit_text(text + CURSOR)
+                self._shown = text
+            except Exception as e:
+                logger.warning("Не удалось обновить сообщение: %s", e)
+
+    async def finish(self, text: str, reply_markup=None):
+        """Фиксирует окончательный текст (с клавиатурой)"""
+        if self._editor is not None:
+            self._editor.cancel()
+            try:
+                await self._editor
+            except asyncio.CancelledError:
+                pass
+        if self.message is None:
+            self.message = await self.reply_to.answer(text, reply_markup=reply_markup)
+            return
+        try:
+            await self.message.edit_text(text, reply_markup=reply_markup)
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                raise
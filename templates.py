@@ -0,0 +1,209 @@
+from typing import Dict, Optional
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, User, WebAppInfo
+
+DEFAULT_LOCALE = "ru"
+
+# Тексты интерфейса по языкам; {поля} подставляются в Templates.text()
+TEXTS: Dict[str, Dict[str, str]] = {
+    "ru": {
+        "open_surprise": "💌 Открыть сюрприз",
+        "help_button": "❓ Справка",
+        "back_button": "⬅️ Назад",
+        "welcome": (
+            "💕 Привет, Иришка!\n\n"
+            "Я приготовил для тебя что-то на День Святого Валентина... 💘"
+        ),
+        "help": (
+            "🎯 Вот что я умею:\n\n"
+            "📱 Основное:\n"
+            "💌 Открыть сюрприз\n\n"
+            "⏱️ Команды:\n"
+            "/days - Счетчик дней вместе (в днях, часах, секундах)\n"
+            "/confession - Случайное признание (новое каждый раз)\n"
+            "/help - Эта справка\n"
+            "/disable_morning - Отключить утренние напоминания\n"
+            "/enable_morning - Включить утренние напоминания\n"
+            "/disable_evening - Отключить вечерние напоминания\n"
+            "/enable_evening - Включить вечерние напоминания\n\n"
+            "🎭 Дополнительно:\n"
+            "Напиши мне что-нибудь - я отвечу! 💕"
+        ),
+        "status": (
+            "✅ Бот работает!\n\n"
+            "👤 Твой ID: {user_id}\n"
+            "📝 Ник: @{username}\n"
+            "💕 Статус: Готов к признаниям!\n\n"
+            "Нажми кнопку ниже, чтобы открыть сюрприз 💌"
+        ),
+        "no_username": "No username",
+        "days_first": "0 (сегодня наш первый день!)",
+        "days": (
+            "💕 Мы вместе {days} дней\n"
+            "в часах это {hours} часов\n"
+            "в минутах это {minutes:,} минут\n"
+            "а в секундах целых {seconds:,}\n\n"
+            "Каждая секунда с тобой - волшебство ✨\n"
+            "Открой сюрприз, чтобы узнать, как сильно ты мне нужна 💌"
+        ),
+        "confession": (
+            "💕 Вот что я хочу сказать:\n\n"
+            "{confession}\n\n"
+            "Посмотри полный сюрприз - нажми кнопку ниже 💌"
+        ),
+        "error": "Что-то пошло не так... Напиши /help 💕",
+        "update_error": "Произошла ошибка 😔\nПопробуй еще раз или используй /start",
+        "recipients_only": "Эта команда доступна только для Иры или владельца.",
+        "owner_only": "Эта команда доступна только владельцу.",
+        "morning_disabled": "Утренние напоминания отключены. 💤",
+        "morning_enabled": "Утренние напоминания включены. ☀️",
+        "evening_disabled": "Вечерние напоминания отключены. 🌙💤",
+        "evening_enabled": "Вечерние напоминания включены. 🌙",
+        "stats_title": "📊 Статистика бота\n",
+        "stats_handler": "{name}: {count} шт, p50 {p50:.0f}мс, p99 {p99:.0f}мс",
+        "stats_llm": "LLM {kind}: {count} шт, ошибок {errors:.0f}, хеджей {hedges:.0f}, p50 {p50:.2f}с, токенов {tokens:.0f}",
+        "stats_llm_prompt": ", промпт ~{tokens:.0f} ток.",
+        "stats_llm_truncated": ", обрезано {count:.0f}",
+        "stats_route": "  {route}: ок {ok}, ошибок {errors:.0f}, таймаутов {timeouts:.0f}, p95 {p95:.2f}с",
+        "stats_reminder_lag": "Задержка напоминаний {type}: средняя {lag:.1f}с",
+        "stats_outbox": "Журнал напоминаний: {commits} коммитов, p99 {p99:.1f}мс, досланных {replayed:.0f}",
+        "stats_miniapp": "Mini App API: {requests:.0f} запросов, из них 304 — {not_modified:.0f}",
+        "stats_models": "Модели LLM: {models}",
+        "stats_cache": "Кеш ответов: {size} ключей, попаданий {hit_rate:.0%}",
+        "stats_sending": "Отправка: {sent} ок, {failed} ошибок, очередь {queue_depth}, p99 {p99:.0f}мс",
+        "stats_pool": "Пул текстов: {sizes}",
+        "stats_scheduled": "Запланировано напоминаний: {count}",
+        "stats_activity": "Известна активность: {count} польз.",
+    },
+    "en": {
+        "open_surprise": "💌 Open the surprise",
+        "help_button": "❓ Help",
+        "back_button": "⬅️ Back",
+        "welcome": (
+            "💕 Hi, Irishka!\n\n"
+            "I've prepared something for you for Valentine's Day... 💘"
+        ),
+        "help": (
+            "🎯 Here's what I can do:\n\n"
+            "📱 Main:\n"
+            "💌 Open the surprise\n\n"
+            "⏱️ Commands:\n"
+            "/days - How long we've been together (days, hours, seconds)\n"
+            "/confession - A random confession (new every time)\n"
+            "/help - This help\n"
+            "/disable_morning - Turn off morning reminders\n"
+            "/enable_morning - Turn on morning reminders\n"
+            "/disable_evening - Turn off evening reminders\n"
+            "/enable_evening - Turn on evening reminders\n\n"
+            "🎭 Also:\n"
+            "Write me anything - I'll answer! 💕"
+        ),
+        "status": (
+            "✅ The bot is running!\n\n"
+            "👤 Your ID: {user_id}\n"
+            "📝 Username: @{username}\n"
+            "💕 Status: Ready for confessions!\n\n"
+            "Tap the button below to open the surprise 💌"
+        ),
+        "no_username": "No username",
+        "days_first": "0 (today is our first day!)",
+        "days": (
+            "💕 We've been together for {days} days\n"
+            "that's {hours} hours\n"
+            "or {minutes:,} minutes\n"
+            "or a whole {seconds:,} seconds\n\n"
+            "Every second with you is magic ✨\n"
+            "Open the surprise to see how much I need you 💌"
+        ),
+        "confession": (
+            "💕 Here's what I want to tell you:\n\n"
+            "{confession}\n\n"
+            "See the whole surprise - tap the button below 💌"
+        ),
+        "error": "Something went wrong... Type /help 💕",
+        "update_error": "An error occurred 😔\nTry again or use /start",
+        "recipients_only": "This command is only available to Ira or the owner.",
+        "owner_only": "This command is only available to the owner.",
+        "morning_disabled": "Morning reminders are off. 💤",
+        "morning_enabled": "Morning reminders are on. ☀️",
+        "evening_disabled": "Evening reminders are off. 🌙💤",
+        "evening_enabled": "Evening reminders are on. 🌙",
+        "stats_title": "📊 Bot statistics\n",
+        "stats_handler": "{name}: {count} calls, p50 {p50:.0f}ms, p99 {p99:.0f}ms",
+        "stats_llm": "LLM {kind}: {count} calls, {errors:.0f} errors, {hedges:.0f} hedges, p50 {p50:.2f}s, {tokens:.0f} tokens",
+        "stats_llm_prompt": ", prompt ~{tokens:.0f} tok.",
+        "stats_llm_truncated": ", truncated {count:.0f}",
+        "stats_route": "  {route}: ok {ok}, {errors:.0f} errors, {timeouts:.0f} timeouts, p95 {p95:.2f}s",
+        "stats_reminder_lag": "Reminder delay {type}: {lag:.1f}s on average",
+        "stats_outbox": "Reminder outbox: {commits} commits, p99 {p99:.1f}ms, {replayed:.0f} replayed",
+        "stats_miniapp": "Mini App API: {requests:.0f} requests, {not_modified:.0f} of them 304",
+        "stats_models": "LLM models: {models}",
+        "stats_cache": "Reply cache: {size} keys, {hit_rate:.0%} hits",
+        "stats_sending": "Sending: {sent} ok, {failed} errors, queue {queue_depth}, p99 {p99:.0f}ms",
+        "stats_pool": "Text pool: {sizes}",
+        "stats_scheduled": "Scheduled reminders: {count}",
+        "stats_activity": "Known activity: {count} users",
+    },
+}
+
+
+class Templates:
+    """
+    Тексты и клавиатуры интерфейса, собранные один раз на язык.
+
+    Клавиатуры — общие объекты для всех ответов: их нельзя изменять
+    после получения.
+    """
+
+    def __init__(self, mini_app_url: str, default_locale: str = DEFAULT_LOCALE):
+        self.mini_app_url = mini_app_url
+        self.default_locale = default_locale
+        self._locales: Dict[Optional[str], str] = {}
+        self._main_keyboards: Dict[str, InlineKeyboardMarkup] = {}
+        self._back_keyboards: Dict[str, InlineKeyboardMarkup] = {}
+
+    def locale(self, user: Optional[User]) -> str:
+        """Язык ответа по language_code пользователя (ru, если перевода нет)"""
+        code = user.language_code if user is not None else None
+        locale = self._locales.get(code)
+        if locale is None:
+            base = (code or "").split("-")[0].lower()
+            locale = self._locales[code] = base if base in TEXTS else self.default_locale
+        return locale
+
+    def text(self, key: str, locale: str = DEFAULT_LOCALE, **fields) -> str:
+        template = TEXTS[locale][key]
+        return template.format(**fields) if fields else template
+
+    def main_keyboard(self, locale: str = DEFAULT_LOCALE) -> InlineKeyboardMarkup:
+        """Основная клавиатура: кнопка Mini App и справка"""
+        keyboard = self._main_keyboards.get(locale)
+        if keyboard is None:
+            keyboard = self._main_keyboards[locale] = InlineKeyboardMarkup(
+                inline_keyboard=[
+                    [
+                        InlineKeyboardButton(
+                            text=self.text("open_surprise", locale),
+                            web_app=WebAppInfo(url=self.mini_app_url),
+                        )
+                    ],
+                    [
+                        InlineKeyboardButton(
+                            text=self.text("help_button", locale),
+                            callback_data="help_callback",
+                        )
+                    ],
+                ]
+            )
+        return keyboard
+
+    def back_keyboard(self, locale: str = DEFAULT_LOCALE) -> InlineKeyboardMarkup:
+        """Клавиатура справки: возврат в главное меню"""
+        keyboard = self._back_keyboards.get(locale)
+        if keyboard is None:
+            keyboard = self._back_keyboards[locale] = InlineKeyboardMarkup(
+                inline_keyboard=[
+                    [InlineKeyboardButton(text=self.text("back_button", locale), callback_data="back_to_main")]
+                ]
+            )
+        return keyboard
@@ -0,0 +1,76 @@
+import json
+import logging
+import re
+from typing import Iterable, List, Optional
+
+from metrics import LLM_BATCH_TEXTS
+from pool import text_key
+
+logger = logging.getLogger(__name__)
+
+# Конец предложения: . ! ? … (в том числе «...», «?!»), дальше пробел или конец текста
+_SENTENCE_END = re.compile(r"[.!?…]+(?=\s|$)")
+_CODE_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def batch_instruction(count: int) -> str:
+    """Просьба к промпту текста: несколько вариантов сразу, ответ — JSON-массив"""
+    return (
+        f"Напиши {count} разных вариантов такого сообщения, не похожих друг на друга. "
+        "Ответ — только JSON-массив строк, без пояснений и нумерации, "
+        'например: ["первый вариант", "второй вариант"].'
+    )
+
+
+def parse_json_array(raw: str) -> List[str]:
+    """Достает массив строк из ответа модели (терпит ```json и текст вокруг)"""
+    raw = _CODE_FENCE.sub("", raw.strip())
+    start, end = raw.find("["), raw.rfind("]")
+    if start == -1 or end <= start:
+        raise ValueError("в ответе нет JSON-массива")
+    items = json.loads(raw[start:end + 1])
+    if not isinstance(items, list):
+        raise ValueError("ожидался JSON-массив")
+    return [item.strip() for item in items if isinstance(item, str) and item.strip()]
+
+
+def count_sentences(text: str) -> int:
+    sentences = len(_SENTENCE_END.findall(text))
+    # Последнее предложение может быть без точки (например, с эмодзи на конце)
+    tail = _SENTENCE_END.split(text)[-1]
+    if re.search(r"\w", tail):
+        sentences += 1
+    return sentences
+
+
+def check_text(text: str, names: Iterable[str], max_sentences: int = 2, max_chars: int = 400) -> Optional[str]:
+    """Причина, по которой текст нарушает правила промпта, или None"""
+    if len(text) > max_chars:
+        return "слишком длинный"
+    if not re.match(r"^\W*(?:%s)\b" % "|".join(re.escape(name) for name in names), text):
+        return "не начинается с имени"
+    if count_sentences(text) > max_sentences:
+        return f"больше {max_sentences} предложений"
+    return None
+
+
+def split_batch(raw: str, kind: str, names: Iterable[str], max_sentences: int = 2) -> List[str]:
+    """
+    Разбирает ответ на пачку запросов: JSON-массив -> проверенные тексты
+    без повторов. Тексты, нарушающие правила, отбрасываются.
+    """
+    names = tuple(names)
+    accepted, keys = [], set()
+    for text in parse_json_array(raw):
+        reason = check_text(text, names, max_sentences)
+        key = text_key(text)
+        if reason is None and key in keys:
+            reason = "повтор"
+        if reason is not None:
+            LLM_BATCH_TEXTS.inc(kind, "rejected")
+            logger.debug("Отброшен текст '%s' (%s): %r", kind, reason, text)
+            continue
+        keys.add(key)
+        accepted.append(text)
+        LLM_BATCH_TEXTS.inc(kind, "accepted")
+    return accepted
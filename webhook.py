@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import signal
+from typing import Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from metrics import metrics_handler
+from miniapp import MiniAppAPI
+
+logger = logging.getLogger(__name__)
+
+
+class DrainingRequestHandler(SimpleRequestHandler):
+    """Обработчик вебхука, который при остановке дожидается обработки принятых апдейтов"""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, drain_timeout: float = 30.0, **kwargs):
+        super().__init__(dispatcher=dispatcher, bot=bot, **kwargs)
+        self.drain_timeout = drain_timeout
+        self.closing = False
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._background_feed_update_tasks)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.closing:
+            # Telegram повторит доставку, когда поднимется новый процесс
+            return web.Response(status=503, text="shutting down")
+        return await super().handle(request)
+
+    async def close(self) -> None:
+        """Дожидается активных обработчиков, затем закрывает сессию бота"""
+        self.closing = True
+        tasks = set(self._background_feed_update_tasks)
+        if tasks:
+            logger.info("Ожидаем завершения %s обработчиков...", len(tasks))
+            done, pending = await asyncio.wait(tasks, timeout=self.drain_timeout)
+            if pending:
+                logger.warning("Не дождались %s обработчиков, отменяем", len(pending))
+                for task in pending:
+                    task.cancel()
+        await super().close()
+
+
+def build_app(dispatcher: Dispatcher, bot: Bot, path: str = "/webhook",
+              secret_token: Optional[str] = None, drain_timeout: float = 30.0,
+              miniapp_api: Optional[MiniAppAPI] = None) -> web.Application:
+    """Создает aiohttp приложение с вебхуком, health-эндпоинтом и API Mini App"""
+    app = web.Application()
+    handler = DrainingRequestHandler(
+        dispatcher,
+        bot,
+        drain_timeout=drain_timeout,
+        secret_token=secret_token,
+    )
+    handler.register(app, path=path)
+
+    async def health(request: web.Request) -> web.Response:
+        status = 503 if handler.closing else 200
+        return web.json_response(
+            {"status": "draining" if handler.closing else "ok", "in_flight": handler.in_flight},
+            status=status,
+        )
+
+    app.router.add_get("/healthz", health)
+    app.router.add_get("/metrics", metrics_handler)
+    if miniapp_api is not None:
+        miniapp_api.register(app)
+    app["webhook_handler"] = handler
+    setup_application(app, dispatcher, bot=bot)
+    return app
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot, host: str, port: int,
+                      path: str = "/webhook", base_url: Optional[str] = None,
+                      secret_token: Optional[str] = None, drain_timeout: float = 30.0,
+                      miniapp_api: Optional[MiniAppAPI] = None):
+    """Запускает вебхук-сервер и работает до SIGINT/SIGTERM"""
+    app = build_app(dispatcher, bot, path=path, secret_token=secret_token, drain_timeout=drain_timeout,
+                    miniapp_api=miniapp_api)
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info(f"🌐 Вебхук слушает http://{host}:{port}{path}")
+
+    if base_url:
+        await bot.set_webhook(
+            url=base_url.rstrip("/") + path,
+            secret_token=secret_token,
+            allowed_updates=dispatcher.resolve_used_update_types(),
+        )
+        logger.info(f"Вебхук зарегистрирован в Telegram: {base_url.rstrip('/')}{path}")
+    else:
+        logger.info("WEBHOOK_URL не задан — вебхук в Telegram не регистрируется")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows: остается KeyboardInterrupt
+            pass
+
+    try:
+        await stop.wait()
+    finally:
+        logger.info("🛑 Останавливаем вебхук-сервер")
+        await runner.cleanup()